@@ -1,7 +1,11 @@
 # global import
 from datetime import datetime
+from .rate_limiter import CkRateLimiter
+from .token_cache import CkTokenCache
 from .apstra_session import CkApstraSession
+from .blueprint_snapshot import BlueprintSnapshot
 from .apstra_blueprint import CkApstraBlueprint, CkEnum, IpLinkEnum
-from .generic_system import GsCsvKeys, add_generic_systems, get_generic_systems
+from .apstra_async_session import CkApstraAsyncSession, CkApstraAsyncBlueprint
+from .generic_system import GsCsvKeys, GenericSystemImport, add_generic_systems, get_generic_systems
 from .connectivity_template import CtCsvKeys, import_ip_link_ct
 from .util import prep_logging, deep_copy
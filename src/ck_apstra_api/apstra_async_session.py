@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+from typing import Any, Callable, List
+
+from result import Result
+
+from .apstra_session import CkApstraSession
+from .apstra_blueprint import CkApstraBlueprint
+
+
+# asyncio client to Apstra Controller on top of CkApstraSession
+class CkApstraAsyncSession:
+    """
+    Awaitable wrapper of the sync CkApstraSession, not asyncio-native I/O.
+
+    Each call is the blocking requests call of the sync session run in a worker thread of an executor.
+    The event loop stays free while the calls are outstanding, and the concurrency comes from
+    the threads, bounded by max_in_flight.
+
+        async with CkApstraAsyncSession(session, max_in_flight=8) as async_session:
+            bp = async_session.blueprint(CkApstraBlueprint(session, 'terra'))
+            results = await async_session.gather(*[bp.query(x) for x in queries])
+    """
+
+    def __init__(self,
+                 session: CkApstraSession,
+                 max_in_flight: int = 16) -> None:
+        """
+        Create an asyncio session over an existing (logged in) CkApstraSession.
+
+        The calls share the connection pool, the auth token and the caches of the sync session.
+        Each awaitable runs the blocking call in a worker thread, with at most max_in_flight
+        requests outstanding to the controller at any time.
+
+        Args:
+            session: The Apstra session object.
+            max_in_flight: The maximum number of concurrent requests to the controller.
+        """
+        self.session = session
+        self.max_in_flight = max_in_flight
+        self.logger = logging.getLogger('CkApstraAsyncSession')
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='ck-apstra')
+        # let the connections overlap on the pool instead of being discarded above the default 10
+        self.session.set_pool_size(max_in_flight)
+
+    async def __aenter__(self) -> 'CkApstraAsyncSession':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Release the worker threads. The sync session stays usable.
+        """
+        self._executor.shutdown(wait=False)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking call of the sync session or blueprint within the in-flight limit.
+        """
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def gather(self, *aws) -> List[Any]:
+        """
+        Await all the awaitables and return the results in the given order.
+        """
+        return await asyncio.gather(*aws)
+
+    async def get_items(self, url: str) -> dict:
+        """
+        Get the items from the url under /api
+        """
+        return await self.run(self.session.get_items, url)
+
+    async def post(self, url: str, data: dict, params: dict = None):
+        """
+        Post data to the url under /api
+        """
+        return await self.run(self.session.post, url, data, params)
+
+    async def patch_throttled(self, url: str, spec: dict, params: dict = None) -> dict:
+        """
+        Patch the full url. See CkApstraSession.patch_throttled
+        """
+        return await self.run(self.session.patch_throttled, url, spec, params)
+
+    async def query(self, blueprint: CkApstraBlueprint, query_string: str) -> Result[List, str]:
+        """
+        Query the blueprint. See CkApstraBlueprint.query
+        """
+        return await self.run(blueprint.query, query_string)
+
+    def blueprint(self, blueprint: CkApstraBlueprint) -> 'CkApstraAsyncBlueprint':
+        """
+        Return the asyncio counterpart of the blueprint sharing this session's limit.
+        """
+        return CkApstraAsyncBlueprint(self, blueprint)
+
+
+class CkApstraAsyncBlueprint:
+
+    def __init__(self,
+                 async_session: CkApstraAsyncSession,
+                 blueprint: CkApstraBlueprint) -> None:
+        """
+        The awaitable helpers of CkApstraBlueprint.
+
+        Args:
+            async_session: The asyncio session to run the calls through.
+            blueprint: The blueprint object.
+        """
+        self.async_session = async_session
+        self.blueprint = blueprint
+        self.id = blueprint.id
+        self.label = blueprint.label
+
+    async def query(self, query_string: str) -> Result[List, str]:
+        return await self.async_session.run(self.blueprint.query, query_string)
+
+    async def dump(self) -> dict:
+        return await self.async_session.run(self.blueprint.dump)
+
+    async def get_item(self, item: str):
+        return await self.async_session.run(self.blueprint.get_item, item)
+
+    async def patch_item(self, item: str, patch_spec, params=None):
+        return await self.async_session.run(self.blueprint.patch_item, item, patch_spec, params)
+
+    async def post_item(self, item_url: str, post_spec: dict, params={'type': 'staging'}):
+        return await self.async_session.run(self.blueprint.post_item, item_url, post_spec, params)
+
+    async def put_item(self, item_url: str, put_spec: dict, params={'type': 'staging'}):
+        return await self.async_session.run(self.blueprint.put_item, item_url, put_spec, params)
+
+    async def delete_item(self, item: str, params=None):
+        return await self.async_session.run(self.blueprint.delete_item, item, params)
+
+    async def get_system_node_from_label(self, system_label: str) -> Result[dict, str]:
+        return await self.async_session.run(self.blueprint.get_system_node_from_label, system_label)
+
+    async def get_server_interface_nodes(self, generic_system_label: str = None) -> Result[List, str]:
+        return await self.async_session.run(self.blueprint.get_server_interface_nodes, generic_system_label)
+
+    async def get_switch_interface_nodes(self, switch_labels=None, intf_name=None) -> Result[List, str]:
+        return await self.async_session.run(self.blueprint.get_switch_interface_nodes, switch_labels, intf_name)
+
+    async def get_transformation_id(self, system_label, intf_name, speed) -> Result[int, str]:
+        return await self.async_session.run(self.blueprint.get_transformation_id, system_label, intf_name, speed)
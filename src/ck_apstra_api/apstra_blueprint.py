@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
-from typing import Any, Dict, Generator, List, Optional
+import re
+import threading
+from typing import Any, Dict, Generator, List, Optional, Set
 import uuid
 from enum import StrEnum
-from functools import cache
 import time
 
 from result import Err, Result, Ok
 
 from . import CkApstraSession
+from .blueprint_snapshot import BlueprintSnapshot
+from .cache import LruCache, cached_method, clear_method_caches, method_cache_stats
+from .catalog import BlueprintCatalog
+from .graph_query import GraphQueryEngine
+from .write_batch import WriteBatcher
+from .task_tracker import TaskTracker, wait_until
 from .util import deep_copy
 
 
@@ -39,13 +47,37 @@ class IpLinkEnum(StrEnum):
     HEADER_IPV4_SWITCH = 'ipv4_switch'
     HEADER_IPV4_SERVER = 'ipv4_server'
 
+
+def normalize_query(query_string: str) -> str:
+    '''
+    Return the query string without the whitespaces outside of the quoted strings
+    '''
+    parts = re.split(r'''("[^"]*"|'[^']*')''', query_string)
+    return ''.join(part if index % 2 else re.sub(r'\s+', '', part) for index, part in enumerate(parts))
+
+
+def invalidates_caches(method):
+    '''
+    Decorator for the blueprint methods writing to the blueprint. The caches are dropped after the write.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.invalidate_caches()
+    return wrapper
+
+
 class CkApstraBlueprint:
     # __slots__ = ['session', 'label', 'design', 'id', 'logger', 'url_prefix']
 
     def __init__(self,
                  session: CkApstraSession,
                  label: str,
-                 id: str = None) -> None:
+                 id: str = None,
+                 query_cache_size: int = 256,
+                 version_ttl: float = 2.0) -> None:
         """
         Initialize a CkApstraBlueprint object.
 
@@ -53,21 +85,38 @@ class CkApstraBlueprint:
             session: The Apstra session object.
             label: The label of the blueprint.
             id: The ID of the blueprint in case it is known
+            query_cache_size: The number of query results to keep. 0 to disable the query cache.
+            version_ttl: The seconds to trust the staging version before checking it again.
         """
         self.session = session
         self.label = label
         self.id = id
+        self.design = None
+        self.version = None
+        self.graph = None  # the full blueprint dump. Loaded only by load_graph()
+        self.snapshot = None  # BlueprintSnapshot to answer the lookups locally. See attach_snapshot()
+        self.query_engine = None  # GraphQueryEngine to run query() over the snapshot. See attach_snapshot()
+        self.write_batcher = None  # WriteBatcher queuing the writes while active. See write_batch()
+        self.task_tracker = TaskTracker(self)  # the tasks of the async=full writes
+        self.query_cache = LruCache(query_cache_size)  # { normalized query: (cache generation, staging_version, items) }
+        self.catalog = BlueprintCatalog(self)  # label <-> id of the security zones, routing policies, VNs and CTs
+        self.version_ttl = version_ttl
+        self._staging_version = None
+        self._staging_version_at = 0.0
+        self._cache_generation = 0  # bumped by invalidate_caches(), so an entry put by a query in flight is not served
+        self._cache_lock = threading.Lock()
         self.log_prefix = f"CkApstraBlueprint({label})"
         self.logger = logging.getLogger(self.log_prefix)
-        if id:
-            this_blueprint = self.session.get_items(f"blueprints/{id}")
-            self.label = this_blueprint['label']
-            self.design = this_blueprint['design']
+        # resolve from the blueprint summary list instead of pulling the whole blueprint
+        summary = self.session.find_blueprint_summary(label=label, id=id)
+        if summary:
+            self.id = summary['id']
+            self.label = summary['label']
+            self.design = summary['design']
+            self.version = summary.get('version')
             self.url_prefix = f"{self.session.url_prefix}/blueprints/{self.id}"
         else:
-            self.get_id()
-            if self.id:
-                self.url_prefix = f"{self.session.url_prefix}/blueprints/{self.id}"
+            self.id = None
 
 
     def get_id(self) -> str:
@@ -80,12 +129,24 @@ class CkApstraBlueprint:
         if self.id:
             return self.id
         # get summary lists of all the blueprints
-        bp = [x for x in self.session.get_items('blueprints')['items'] if x['label'] == self.label]
-        if bp:
-            self.id = bp[0]['id']
-            self.design = bp[0]['design']
+        summary = self.session.find_blueprint_summary(label=self.label)
+        if summary:
+            self.id = summary['id']
+            self.design = summary['design']
+            self.version = summary.get('version')
         return self.id
-        
+
+    def load_graph(self) -> dict:
+        """
+        Download the whole blueprint graph (every node and relationship) and keep it in self.graph.
+        This can be hundreds of MB on a large blueprint. Call it only when the dump is needed.
+
+        Returns:
+            The blueprint dump. See dump()
+        """
+        self.graph = self.dump()
+        self.version = self.graph.get('version', self.version)
+        return self.graph
 
     def dump(self) -> dict:
         """
@@ -103,19 +164,103 @@ class CkApstraBlueprint:
         """
         return self.session.get_items(f"blueprints/{self.id}")
 
-    def query(self, query_string: str) -> Result[List, str]:
+    def attach_snapshot(self, snapshot: BlueprintSnapshot = None, local_query: bool = False) -> BlueprintSnapshot:
+        """
+        Answer the lookup helpers (system by label, virtual network, CT ids, security zone, tags) from the snapshot.
+        The snapshot is built from one load_graph() if not given. It is not updated by the writes.
+
+        Args:
+            snapshot: The snapshot to attach. Built from load_graph() if None.
+            local_query: Run query() over the snapshot. The queries out of the supported subset still go to the controller.
+
+        Returns:
+            The attached snapshot
+        """
+        self.snapshot = snapshot or BlueprintSnapshot(self.load_graph())
+        self.query_engine = GraphQueryEngine(self.snapshot) if local_query else None
+        return self.snapshot
+
+    def detach_snapshot(self) -> None:
+        """
+        Go back to the queries for the lookup helpers
+        """
+        self.snapshot = None
+        self.query_engine = None
+
+    def staging_version(self) -> Optional[int]:
+        """
+        Return the staging version of the blueprint. Pulled from diff-status at most once per version_ttl.
+        """
+        with self._cache_lock:
+            # one pull for the threads asking together
+            now = time.monotonic()
+            if self._staging_version is None or now - self._staging_version_at > self.version_ttl:
+                try:
+                    diff_status = self.session.get_items(f"blueprints/{self.id}/diff-status")
+                except Exception as e:
+                    self.logger.warning(f"staging_version() failed: {e}")
+                    return None
+                if diff_status.get('staging_version') is None:
+                    self.logger.warning(f"staging_version() not in {diff_status=}")
+                    return None
+                self._staging_version = diff_status['staging_version']
+                self._staging_version_at = now
+            return self._staging_version
+
+    def invalidate_caches(self) -> None:
+        """
+        Drop the cached data. Called after every write through this object.
+        The staging version is kept. It is checked again only to serve a cached query after version_ttl.
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+        self.query_cache.clear()
+        self.catalog.invalidate()
+        clear_method_caches(self)
+
+    def cache_stats(self) -> Dict[str, dict]:
+        """
+        The stats of the caches of this blueprint: the query cache, the catalog and the cached methods
+        """
+        return {
+            'query': self.query_cache.stats,
+            'catalog': self.catalog.stats,
+            **method_cache_stats(self),
+        }
+
+    def query(self, query_string: str, use_cache: bool = True) -> Result[List, str]:
         """
         Query the Apstra API.
 
         Args:
             query: The query string.
-            strip: Strip the query string. Required in case of multi-line query.
+            use_cache: Serve the same query of the same staging version from the query cache.
+                The query runs over the snapshot instead when attached with local_query (see attach_snapshot).
 
         Returns:
             The Tuple of the results of the query and the error message
 
         """
-        query_candidate = query_string.strip().replace("\n", '')        
+        query_candidate = query_string.strip().replace("\n", '')
+        if self.query_engine:
+            local_result = self.query_engine.query(query_candidate)
+            if isinstance(local_result, Ok):
+                return local_result
+            self.logger.debug(f"falling back to the controller: {local_result.err_value}")
+        cache_key, cache_entry = None, None
+        if use_cache and self.query_cache.maxsize:
+            cache_key = normalize_query(query_candidate)
+            generation = self._cache_generation
+            cached = self.query_cache.get(cache_key)
+            # the staging version is checked only when there is an entry to serve
+            if cached is not LruCache.MISSING and cached[0] == generation and cached[1] == self.staging_version():
+                # the caller may modify the items
+                return Ok(deep_copy(cached[2]))
+            # the version known before the query. An older version than the items only makes the entry miss later
+            version = self._staging_version if self._staging_version is not None else self.staging_version()
+            # not cached when the version is unknown
+            if version is not None:
+                cache_entry = (generation, version)
         url = f"{self.url_prefix}/qe"
         payload = {
             "query": query_candidate
@@ -126,7 +271,10 @@ class CkApstraBlueprint:
         # the content should have 'items'. otherwise, the query would be invalid
         elif 'items' not in response.json():
             return Err(f"items does not exist: {query_string=}, {response.text=}")
-        return Ok(response.json()['items'])
+        items = response.json()['items']
+        if cache_entry:
+            self.query_cache.put(cache_key, (*cache_entry, deep_copy(items)))
+        return Ok(items)
     
     # TODO: integrate with other functions
     def get_managed_system_nodes(self):
@@ -137,8 +285,8 @@ class CkApstraBlueprint:
         return self.managed_system_nodes
 
     
-    # return the first entry for the system
-    # @cache
+    # return the first entry for the system. the interface map of a system is kept for 5 minutes
+    @cached_method(maxsize=1024, ttl=300, cache_if=lambda x: isinstance(x, Ok))
     def get_system_with_im(self, system_label) -> Result[dict,str]:
         system_im_result = self.query(f"node('system', label='{system_label}', name='system').out().node('interface_map', name='im')")
         # if system_label not in self.system_label_2_id_cache:
@@ -161,6 +309,9 @@ class CkApstraBlueprint:
         Return the system dict from the system label
         called from move_access_switch
         """
+        if self.snapshot:
+            found = self.snapshot.nodes_by_label('system', system_label)
+            return Ok(found[0] if found else {})
         query = f"node('system', label='{system_label}', name='system')"
         system_query_result = self.query(query)
         if isinstance(system_query_result, Err):
@@ -179,17 +330,22 @@ class CkApstraBlueprint:
             return None
         return self.system_id_2_label_cache[system_id]
 
-    def get_server_interface_nodes(self, generic_system_label: str = None, intf_name: str = None) -> Result[str, str]:
+    def get_server_interface_nodes(self, generic_system_label=None, intf_name: str = None) -> Result[List, str]:
         """
-        Return interface nodes of a system label
+        Return interface nodes of the generic systems
+            generic_system_label: list of system labels, a str for the single system label, or None for all generic systems
             return CkEnum.MEMBER_INTERFACE and CkEnum.MEMBER_SWITCH
                 optionally CkEnum.EVPN_INTERFACE if it is a LAG
             It can be used for VLAN CT association
             TODO: implement intf_name in case of multiple link generic system
-        TODO: cache generic system interface id
         called by move_access_switch
         """
-        gs_label_filter = f"label='{generic_system_label}', " if generic_system_label else ''
+        if isinstance(generic_system_label, list):
+            gs_label_filter = f"label=is_in({generic_system_label}), "
+        elif generic_system_label:
+            gs_label_filter = f"label='{generic_system_label}', "
+        else:
+            gs_label_filter = ''
         interface_query = f"""match(
             node('system', system_type='server', {gs_label_filter} name='{CkEnum.GENERIC_SYSTEM}')
                 .out('hosted_interfaces').node('interface', name='{CkEnum.GENERIC_SYSTEM_INTERFACE}')
@@ -214,6 +370,33 @@ class CkApstraBlueprint:
         # query_result = self.query(interface_query)
         return self.query(interface_query)
 
+    def get_server_interface_index(self, generic_system_labels: List[str] = None, chunk_size: int = 500) -> Result[Dict[str, List], str]:
+        """
+        Prefetch the interface nodes of many generic systems, grouped by the generic system label.
+        The labels are queried chunk_size at a time with label=is_in([...]) instead of one query per generic system.
+
+        Args:
+            generic_system_labels: The labels of the generic systems. None for all the generic systems in one query.
+            chunk_size: The number of labels per query.
+
+        Returns:
+            { generic system label: [items of get_server_interface_nodes()] }. The absent generic systems have [].
+        """
+        if generic_system_labels is None:
+            label_chunks = [None]
+            index = {}
+        else:
+            labels = list(dict.fromkeys(generic_system_labels))
+            label_chunks = [labels[i:i + chunk_size] for i in range(0, len(labels), chunk_size)]
+            index = {x: [] for x in labels}
+        for label_chunk in label_chunks:
+            nodes_result = self.get_server_interface_nodes(label_chunk)
+            if isinstance(nodes_result, Err):
+                return nodes_result
+            for item in nodes_result.ok_value:
+                index.setdefault(item[CkEnum.GENERIC_SYSTEM]['label'], []).append(item)
+        return Ok(index)
+
     def get_switch_interface_nodes(self, switch_labels=None, intf_name=None) -> Result[List, str]:
         """
         Return interface nodes of the switches. The once not conencted to generic system may not appear.
@@ -283,26 +466,24 @@ class CkApstraBlueprint:
         return (tagged_ct, untagged_ct)
     
 
-    @cache
     def get_ct_ids(self, ct_labels: list) -> list:
         '''
         Return the CT IDs from the connectivity template names(labels)
         '''
         if isinstance(ct_labels, str):
             ct_labels = [ct_labels]
-        ct_list_query = f"""
-            node('ep_endpoint_policy', policy_type_name='batch', label=is_in({ct_labels}), name='ep')
-        """
-        ct_list_result = self.query(ct_list_query)
-        if isinstance(ct_list_result, Err):
-            return Err(f"Error: {ct_list_result.err_value=}")
-        ct_list = ct_list_result.ok_value
-        if len(ct_list) == 0:
+        if self.snapshot:
+            return [x['id'] for x in self.snapshot.find('ep_endpoint_policy', policy_type_name='batch') if x['label'] in ct_labels]
+        loaded = self.catalog.load('connectivity_template')
+        if isinstance(loaded, Err):
+            return Err(f"Error: {loaded.err_value}")
+        ct_ids = self.catalog.ids('connectivity_template', ct_labels)
+        if len(ct_ids) == 0:
             self.logger.debug(f"No CTs found for {ct_labels=}")
-            return []
-        return [x['ep']['id'] for x in ct_list]
+        return ct_ids
     
     
+    @invalidates_caches
     def add_generic_system(self, generic_system_spec: dict) -> Result[List, str]:
         """
         Add a generic system (and access switch pair) to the blueprint.
@@ -320,16 +501,43 @@ class CkApstraBlueprint:
             # skipping if the system already exists
             # return []
             return Ok([])
+        return self.add_generic_systems(generic_system_spec)
+
+    def add_generic_systems(self, generic_system_spec: dict) -> Result[List, str]:
+        """
+        Add the generic systems of the spec with one switch-system-links request. The existence is not checked.
+
+        Args:
+            generic_system_spec: The specification with any number of new_systems.
+                The links refer to their new system with system.new_system_index.
+
+        Returns:
+            The ID of the switch-system-link ids.
+        """
+        new_generic_system_labels = [x['label'] for x in generic_system_spec['new_systems']]
         url = f"{self.url_prefix}/switch-system-links"
         created_generic_system = self.session.session.post(url, json=generic_system_spec)
         if created_generic_system.status_code != 201:
-            # self.logger.error(f"System not created: {created_generic_system=}, {new_generic_system_label=}, {created_generic_system.text=}")
-            return Err(f"System not created: {created_generic_system=}, {new_generic_system_label=}, {created_generic_system.text=}")
+            # self.logger.error(f"System not created: {created_generic_system=}, {new_generic_system_labels=}, {created_generic_system.text=}")
+            return Err(f"System not created: {created_generic_system=}, {new_generic_system_labels=}, {created_generic_system.text=}")
         # which case?
         if created_generic_system is None or len(created_generic_system.json()) == 0 or 'ids' not in created_generic_system.json():
             return Err("Not created")
         return Ok(created_generic_system.json()['ids'])
 
+    def get_system_labels(self, system_labels: List[str], chunk_size: int = 500) -> Result[Set[str], str]:
+        """
+        Return the labels of system_labels present in the blueprint, chunk_size labels per query.
+        """
+        labels = list(dict.fromkeys(system_labels))
+        present = set()
+        for label_chunk in [labels[i:i + chunk_size] for i in range(0, len(labels), chunk_size)]:
+            systems_result = self.query(f"node('system', label=is_in({label_chunk}), name='system')")
+            if isinstance(systems_result, Err):
+                return systems_result
+            present.update(x['system']['label'] for x in systems_result.ok_value)
+        return Ok(present)
+
     def get_transformation_id(self, system_label, intf_name, speed) -> Result[int, str]:
         '''
         Get the transformation ID for the interface
@@ -345,25 +553,12 @@ class CkApstraBlueprint:
         if isinstance(system_im_result, Err):
             return Err(f"{system_label=} {intf_name=} {speed=}\n\tError get_system_with_im {system_im_result=}")
         system_im = system_im_result.ok_value
-        device_profile_result = self.session.get_device_profile(system_im['im']['device_profile_id'])
-        if isinstance(device_profile_result, Err):
-            return Err(f"{system_label=} {intf_name=} {speed=}\n\tError get_device_profile {device_profile_result.err_value=}")
-        device_profile = device_profile_result.ok_value
-        if 'ports' not in device_profile:
-            return Err(f"{system_label=} {intf_name=} {speed=}\n\tError: no ports in device profile {device_profile=}")
-        for port in device_profile['ports']:
-            if 'transformations' not in port:
-                return Err(f"{system_label=} {intf_name=} {speed=}\n\tError: no transformations in port {port=}")    
-            for transformation in port['transformations']:
-                # self.logger.debug(f"{transformation=}")
-                for intf in transformation['interfaces']:
-                    # if intf['name'] == intf_name:
-                    #     self.logger.debug(f"{intf=}")
-                    if intf['name'] == intf_name and intf['speed']['unit'] == speed[-1:] and intf['speed']['value'] == int(speed[:-1]): 
-                        # self.logger.warning(f"{intf_name=}, {intf=}")
-                        return Ok(transformation['transformation_id'])
-        return Err(f"transformation not found for {system_label=} {intf_name=} {speed=}")
+        transformation_id_result = self.session.device_profiles.transformation_id(system_im['im']['device_profile_id'], intf_name, speed)
+        if isinstance(transformation_id_result, Err):
+            return Err(f"{system_label=} {intf_name=} {speed=}\n\t{transformation_id_result.err_value}")
+        return transformation_id_result
 
+    @invalidates_caches
     def patch_leaf_server_link(self, link_spec: dict) -> None:
         """
         Patch a leaf-server link.
@@ -374,12 +569,16 @@ class CkApstraBlueprint:
         url = f"{self.url_prefix}/leaf-server-link-labels"
         self.session.patch_throttled(url, spec=link_spec)
 
+    @invalidates_caches
     def patch_obj_policy_batch_apply(self, policy_spec, params=None):
         '''
-        Apply policies in a batch
+        Apply policies in a batch. The task of async=full is registered to self.task_tracker
         '''
-        return self.session.patch_throttled(f"{self.url_prefix}/obj-policy-batch-apply", spec=policy_spec, params=params)
+        patched = self.session.patch_throttled(f"{self.url_prefix}/obj-policy-batch-apply", spec=policy_spec, params=params)
+        self.task_tracker.register(patched)
+        return patched
 
+    @invalidates_caches
     def patch_leaf_server_link_labels(self, spec, params=None, print_prefix=None):
         '''
         Update the generic system links
@@ -389,25 +588,33 @@ class CkApstraBlueprint:
         patched = self.session.patch_throttled(f"{self.url_prefix}/leaf-server-link-labels", spec=spec, params=params)
         return patched
 
+    @invalidates_caches
     def patch_node_single(self, node, patch_spec, params=None):
         '''
         Patch node data
         '''
         return self.session.session.patch(f"{self.url_prefix}/nodes/{node}", json=patch_spec, params=params)
 
+    @invalidates_caches
     def patch_item(self, item: str, patch_spec, params=None):
         '''
         Patch an item (generic)
         '''
+        if self.write_batcher:
+            return self.write_batcher.queue('PATCH', item, patch_spec, params)
         return self.session.session.patch(f"{self.url_prefix}/{item}", json=patch_spec, params=params)
 
+    @invalidates_caches
     def delete_item(self, item: str, params=None):
         '''
-        Patch an item (generic)
+        Delete an item (generic)
         '''
+        if self.write_batcher:
+            return self.write_batcher.queue('DELETE', item, None, params)
         return self.session.session.delete(f"{self.url_prefix}/{item}", params=params)
 
 
+    @invalidates_caches
     def patch_nodes(self, patch_spec, params=None):
         '''
         Patch node data with patch_spec list
@@ -420,13 +627,79 @@ class CkApstraBlueprint:
         '''
         Get virtual network data from vni or None
         '''
-        vn_id_got, error = self.query(f"node('virtual_network', vn_id='{vni}', name='vn')")
+        if self.snapshot:
+            vn_id_got = [{'vn': x} for x in self.snapshot.find('virtual_network', vn_id=str(vni))]
+        else:
+            vn_node = self.catalog.node('virtual_network', vni, key='vn_id')
+            vn_id_got = [{'vn': vn_node}] if vn_node else []
         if len(vn_id_got) == 0:
             self.logger.warning(f"{vni=} not found")
             return None
         vn_id = vn_id_got[0]['vn']['id']
         return self.session.get_items(f"blueprints/{self.id}/virtual-networks/{vn_id}")
     
+    def get_security_zone_id(self, security_zone_label: str) -> Optional[str]:
+        '''
+        Get the security zone (routing zone) id from the label or None
+        '''
+        if self.snapshot:
+            found = self.snapshot.nodes_by_label('security_zone', security_zone_label)
+            return found[0]['id'] if found else None
+        return self.catalog.id('security_zone', security_zone_label)
+
+    def get_routing_policy_id(self, routing_policy_label: str) -> Optional[str]:
+        '''
+        Get the routing policy id from the label or None
+        '''
+        if not routing_policy_label:
+            return None
+        if self.snapshot:
+            found = self.snapshot.nodes_by_label('routing_policy', routing_policy_label)
+            return found[0]['id'] if found else None
+        return self.catalog.id('routing_policy', routing_policy_label)
+
+    def get_tags(self, node_id: str) -> Result[List[str], str]:
+        '''
+        Get the labels of the tags of the node
+        '''
+        if self.snapshot:
+            return Ok(self.snapshot.tags(node_id))
+        tags_result = self.query(f"node(id='{node_id}').in_('tag').node('tag', name='tag')")
+        if isinstance(tags_result, Err):
+            return tags_result
+        return Ok([x['tag']['label'] for x in tags_result.ok_value])
+
+    def get_node_tags(self, node_ids: List[str] = None, chunk_size: int = 500) -> Result[Dict[str, List[str]], str]:
+        '''
+        Get the labels of the tags of many nodes with one query per chunk of node ids
+
+        Args:
+            node_ids: The node ids. None for all the tagged nodes of the blueprint in one query.
+
+        Returns:
+            { node_id: [tag labels] }. The nodes without tags have [].
+        '''
+        if node_ids is None:
+            tags_result = self.query("node('tag', name='tag').out('tag').node(name='node')")
+            if isinstance(tags_result, Err):
+                return tags_result
+            node_tags = {}
+            for x in tags_result.ok_value:
+                node_tags.setdefault(x['node']['id'], []).append(x['tag']['label'])
+            return Ok(node_tags)
+        ids = list(dict.fromkeys(x for x in node_ids if x))
+        if self.snapshot:
+            return Ok({x: self.snapshot.tags(x) for x in ids})
+        node_tags = {x: [] for x in ids}
+        for i in range(0, len(ids), chunk_size):
+            tags_result = self.query(f"node(id=is_in({ids[i:i + chunk_size]}), name='node').in_('tag').node('tag', name='tag')")
+            if isinstance(tags_result, Err):
+                return tags_result
+            for x in tags_result.ok_value:
+                node_tags[x['node']['id']].append(x['tag']['label'])
+        return Ok(node_tags)
+
+    @invalidates_caches
     def patch_virtual_network(self, patch_spec, params=None, svi_requirement=False):
         '''
         Patch virtual network data
@@ -441,6 +714,7 @@ class CkApstraBlueprint:
         patched = self.session.patch_throttled(f"{self.url_prefix}/virtual-networks/{patch_spec['id']}", spec=patch_spec, params=params)
         return patched
 
+    @invalidates_caches
     def post_tagging(self, nodes: list, tags_to_add = None, tags_to_remove = None, params=None):
         '''
         Update the tagging
@@ -471,32 +745,32 @@ class CkApstraBlueprint:
         # in case of single tags_to_add
         if isinstance(tags_to_add, str):
             tags_to_add = [tags_to_add]
-        # no need to check the present of tags in tags_to_add 
-        tag_nodes_result = self.query(f"node(id=is_in({the_nodes_list})).in_().node('tag', label=is_in({tags_to_add}), name='tag')")
-        are_tags_the_same = len(tag_nodes_result.ok_value) == (len(tags_to_add) * len(nodes))
-        self.logger.debug(f"{nodes=} {the_nodes_list=} {tags_to_add=}, {tags_to_remove=}, {are_tags_the_same=} {tag_nodes_result.ok_value}")
-
-        # self.logger.debug(f"{nodes=} {tags_to_add=}, {tags_to_remove=} {are_tags_the_same=}")
-        # The tags are the same as the existing tags
-        # if are_tags_the_same or (not tags_to_add and not tags_to_remove):
-        #     return
+        self.logger.debug(f"{nodes=} {the_nodes_list=} {tags_to_add=}, {tags_to_remove=}")
         tagging_spec['nodes'] = the_nodes_list
         tagging_spec['add'] = tags_to_add
         tagging_spec['remove'] = tags_to_remove
-        return self.session.session.post(f"{self.url_prefix}/tagging", json=tagging_spec, params={'aync': 'full'})
+        # through post_item to be queued in a write batch
+        return self.post_item('tagging', tagging_spec, params=params)
 
+    @invalidates_caches
     def post_item(self, item_url: str, post_spec: dict, params={'type': 'staging'}):
         '''
         Post an item
         '''
+        if self.write_batcher:
+            return self.write_batcher.queue('POST', item_url, post_spec, params)
         return self.session.session.post(f"{self.url_prefix}/{item_url}", json=post_spec, params=params)
 
+    @invalidates_caches
     def put_item(self, item_url: str, put_spec: dict, params={'type': 'staging'}):
         '''
         Put an item
         '''
+        if self.write_batcher:
+            return self.write_batcher.queue('PUT', item_url, put_spec, params)
         return self.session.session.put(f"{self.url_prefix}/{item_url}", json=put_spec, params=params)
 
+    @invalidates_caches
     def batch(self, batch_spec: dict, params=None) -> dict:
         '''
         Run API commands in batch
@@ -505,6 +779,16 @@ class CkApstraBlueprint:
         result = self.session.session.post(url, json=batch_spec, params=params)
         return result
 
+    def write_batch(self, size: int = 100, params=None) -> WriteBatcher:
+        '''
+        Return a context manager to send patch_item, post_item, put_item and delete_item as /batch requests
+
+        Args:
+            size: The maximum number of operations per /batch request
+            params: The query parameters of the /batch request
+        '''
+        return WriteBatcher(self, size, params)
+
     # def get_cts_on_generic_system_with_only_ae(self, generic_system_label) -> list:
     #     '''
     #     Get the CTS of generic system with single AE
@@ -548,6 +832,9 @@ class CkApstraBlueprint:
         if is_tagged is False:
             vlan_name = f"{vlan_name}-untagged"
         ct_ids = self.get_ct_ids([vlan_name])
+        if isinstance(ct_ids, Err):
+            self.logger.error(f"get_single_vlan_ct_or_create({vlan_id=}) {ct_ids.err_value}")
+            return None
         if len(ct_ids) == 1:
             return ct_ids[0]
         new_ct_id = self.add_single_vlan_ct(200000 + vlan_id, vlan_id, is_tagged)
@@ -621,9 +908,11 @@ class CkApstraBlueprint:
         }
         url = f"{self.url_prefix}/obj-policy-import"
         result = self.session.session.put(url, json=policy_spec)
+        self.invalidate_caches()
         # it will be 204 with b''
         yield Ok(f"{func_name} CT {ct_label} created with {uuid_batch}")
 
+    @invalidates_caches
     def add_multiple_vlan_ct(self, ct_label: str, untagged_vlan_id: int = None, tagged_vlan_ids: list[int] = []) -> str:
         '''
         Create a multi VLAN CT
@@ -690,6 +979,7 @@ class CkApstraBlueprint:
         url = f"{self.url_prefix}/cabling-maps"
         return self.session.session.get(url).json()
 
+    @invalidates_caches
     def patch_cable_map(self, cable_map_spec) -> Result[None, str]:
         '''
         Set the cabling map
@@ -701,6 +991,7 @@ class CkApstraBlueprint:
             return Ok(None)
         return Err(patched.text)
 
+    @invalidates_caches
     def patch_security_zones_csv_bulk(self, csv_bulk: str, params: dict = {'async': 'full'}):
         '''
         Patch the security zones in bulk
@@ -712,6 +1003,7 @@ class CkApstraBlueprint:
         patched = self.session.session.patch(url, json=csv_spec, params=params)
         return patched
 
+    @invalidates_caches
     def patch_virtual_networks_csv_bulk(self, csv_bulk: str, params: dict = {'async': 'full'}):
         '''
         Patch the virtual networks in bulk
@@ -723,6 +1015,7 @@ class CkApstraBlueprint:
         patched = self.session.session.patch(url, json=csv_spec, params=params)
         return patched
     
+    @invalidates_caches
     def patch_resource_groups(self, resource_group_spec: dict, params: dict = {'async': 'full'}):
         '''
         Patch the resource groups
@@ -731,6 +1024,7 @@ class CkApstraBlueprint:
         patched = self.session.session.patch(url, json=resource_group_spec, params=params)
         return patched
 
+    @invalidates_caches
     def revert(self):
         '''
         Revert the blueprint
@@ -771,31 +1065,37 @@ class CkApstraBlueprint:
         '''
         log_prefix = f"{self.log_prefix}::swap_ct_vns({from_vn_id=}, {to_vn_id=})"
         endpoint_policies = self.get_item('endpoint-policies')['endpoint_policies']
-        for ct in endpoint_policies:
-            attr = ct['attributes']
-            if ct['policy_type_name'] == 'AttachSingleVLAN':
-                if attr['vn_node_id'] == from_vn_id:
-                    modified_attributes = deep_copy(attr)
-                    modified_attributes['vn_node_id'] = to_vn_id
-                    patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
-                    yield f"{log_prefix} patched: {ct['id']=} {attr=} {patched=}"
-
-                # logger.info(f"CT - not to process: {ct['id']=} {ct['policy_type_name']} {attr=}")
-            elif ct['policy_type_name'] == 'AttachMultipleVLAN':
-                if from_vn_id in attr['tagged_vn_node_ids']:
-                    modified_attributes = deep_copy(attr)
-                    modified_attributes['tagged_vn_node_ids'] = [x for x in attr['tagged_vn_node_ids'] if x != from_vn_id]
-                    modified_attributes['tagged_vn_node_ids'].append(to_vn_id)
-                    patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
-                    yield f"{log_prefix} patched: {ct['id']=} {attr=} {patched=}"
-                elif from_vn_id == attr['untagged_vn_node_id']:
-                    modified_attributes = deep_copy(attr)
-                    modified_attributes['untagged_vn_node_id'] = to_vn_id
-                    patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
-                    yield f"{log_prefix} patched: {ct['id']=} {attr=} {patched=}"
-                else:
-                    # yield f"{log_prefix} - not to process: {ct['id']=} {ct['policy_type_name']} {attr=}")
-                    pass
+        patched_cts = []
+        # the patches go out in /batch requests
+        with self.write_batch() as batch:
+            for ct in endpoint_policies:
+                attr = ct['attributes']
+                if ct['policy_type_name'] == 'AttachSingleVLAN':
+                    if attr['vn_node_id'] == from_vn_id:
+                        modified_attributes = deep_copy(attr)
+                        modified_attributes['vn_node_id'] = to_vn_id
+                        patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
+                        patched_cts.append((ct, attr, patched))
+
+                    # logger.info(f"CT - not to process: {ct['id']=} {ct['policy_type_name']} {attr=}")
+                elif ct['policy_type_name'] == 'AttachMultipleVLAN':
+                    if from_vn_id in attr['tagged_vn_node_ids']:
+                        modified_attributes = deep_copy(attr)
+                        modified_attributes['tagged_vn_node_ids'] = [x for x in attr['tagged_vn_node_ids'] if x != from_vn_id]
+                        modified_attributes['tagged_vn_node_ids'].append(to_vn_id)
+                        patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
+                        patched_cts.append((ct, attr, patched))
+                    elif from_vn_id == attr['untagged_vn_node_id']:
+                        modified_attributes = deep_copy(attr)
+                        modified_attributes['untagged_vn_node_id'] = to_vn_id
+                        patched = self.patch_item(f"endpoint-policies/{ct['id']}", {'attributes': modified_attributes})
+                        patched_cts.append((ct, attr, patched))
+                    else:
+                        # yield f"{log_prefix} - not to process: {ct['id']=} {ct['policy_type_name']} {attr=}")
+                        pass
+        for ct, attr, patched in patched_cts:
+            yield f"{log_prefix} patched: {ct['id']=} {attr=} {patched=}"
+        yield f"{log_prefix} {batch.stats=}"
 
     def get_temp_vn(self, virtual_network: str) -> Generator[Dict[str, Any], None, None]:
         '''
@@ -1040,10 +1340,17 @@ class CkApstraBlueprint:
             } for x in iplink_result.ok_value]
         return Ok(iplink_list)
     
-    def delete_self(self):
-        '''Delete self - Blueprint'''
+    @invalidates_caches
+    def delete_self(self, timeout: float = 30):
+        '''Delete self - Blueprint. False if not accepted or still present after timeout seconds'''
         deleted = self.session.delete_raw(self.url_prefix)
-        # TODO: optimize
-        time.sleep(3)
-        return deleted.status_code == 202  # 202 is ACCEPTED
+        self.session.blueprint_summaries = None
+        self.session.blueprints.clear()
+        if deleted.status_code != 202:  # 202 is ACCEPTED
+            return False
+        # gone from the controller. diff-status instead of the blueprint itself not to pull the whole graph per poll
+        if not wait_until(lambda: self.session.session.get(f"{self.url_prefix}/diff-status").status_code == 404, timeout=timeout):
+            self.logger.error(f"delete_self() blueprint {self.label} still present after {timeout} seconds")
+            return False
+        return True
     
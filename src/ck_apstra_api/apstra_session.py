@@ -1,15 +1,52 @@
 #!/usr/bin/env python3
-from functools import cache
 from typing import Optional
 import requests
 import urllib3
 import logging
-import time
+import threading
 from datetime import datetime
 from result import Result, Ok, Err
 
+from .rate_limiter import CkRateLimiter
+from .token_cache import CkTokenCache
+from .cache import LruCache
+from .device_profile import DeviceProfileCatalog
+from .task_tracker import wait_until
+
 # from ck_apstra_api import prep_logging
 
+class CkHttpSession(requests.Session):
+    """
+    requests.Session which sends every verb through the rate limiter and retries on HTTP 429
+    """
+
+    def __init__(self, rate_limiter: CkRateLimiter) -> None:
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.on_unauthorized = None  # callback(rejected_token) -> bool to log in again on HTTP 401
+        self.logger = logging.getLogger('CkHttpSession')
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        relogged = False
+        while True:
+            self.rate_limiter.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code == 401 and self.on_unauthorized and not relogged and not url.endswith('/user/login'):
+                # the token expired or was revoked. log in again and retry once
+                relogged = True
+                if self.on_unauthorized(response.request.headers.get('AuthToken')):
+                    continue
+            if response.status_code != 429:   # http 429 too many requests
+                self.rate_limiter.on_success()
+                return response
+            if attempt >= self.rate_limiter.max_retries:
+                self.logger.error(f"giving up {method} {url} after {attempt} retries: {response.text}")
+                return response
+            self.rate_limiter.on_throttled(response.headers.get('Retry-After'), attempt)
+            attempt += 1
+
+
 # https client session to Apstra Controller
 class CkApstraSession:
 
@@ -17,29 +54,42 @@ class CkApstraSession:
                  host: str, 
                  port: int, 
                  username: str, 
-                 password: str) -> None:
+                 password: str,
+                 rate_limiter: CkRateLimiter = None,
+                 token_cache: CkTokenCache = None) -> None:
         """
         Create a new Apstra session. When it fails, self.last_error captures the error message.
+
+        Args:
+            rate_limiter: The limiter shared by all the requests of this session. A default one is created if not given.
+            token_cache: The on-disk token cache. A valid cached token skips the login round trip.
         """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.token = None
+        self.token_cache = token_cache
         self.ssl_verify = False
         self.logger = logging.getLogger('CkApstraSession')
+        self._version = None
+        self._login_lock = threading.Lock()
 
-        self.session = requests.Session()
+        self.rate_limiter = rate_limiter or CkRateLimiter()
+        self.session = CkHttpSession(self.rate_limiter)
+        self.session.on_unauthorized = self.relogin
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         self.session.verify = False
         self.session.headers.update({'Content-Type': "application/json"})
         self.url_prefix = f"https://{self.host}:{self.port}/api"
         self.last_error = None
 
-        self.get_version()
+        # the version is pulled on first use of self.version
         self.login()
 
-        self.device_profile_cache = {}  # { device_profile_id: data }
+        self.device_profiles = DeviceProfileCatalog(self)
+        self.blueprint_summaries = None  # { blueprint_id: summary } - the directory from 'blueprints'
+        self.blueprints = LruCache(64, ttl=600)  # { label: CkApstraBlueprint } - see get_blueprint()
 
     def get_version(self) -> str:
         """
@@ -56,12 +106,34 @@ class CkApstraSession:
             self.logger.error(f"get_version failed: {self.last_error}")
             return None
         version = response.json()["version"]
-        self.version = version
-        return self.version
+        self._version = version
+        return self._version
+
+    @property
+    def version(self) -> str:
+        """
+        The version of the Apstra controller, pulled once on first access.
+        """
+        if self._version is None:
+            self.get_version()
+        return self._version
 
     def login(self) -> None:
         """
-        Log in to the Apstra controller.
+        Log in to the Apstra controller. The token from the token cache is used if it is still valid.
+        """
+        if self.token_cache:
+            cached_token = self.token_cache.get(self.host, self.port, self.username)
+            if cached_token:
+                self.token = cached_token
+                self.session.headers.update({'AuthToken': self.token})
+                self.last_error = None
+                return
+        self._login()
+
+    def _login(self) -> None:
+        """
+        Log in to the Apstra controller with the username and password.
         """
         url = f"{self.url_prefix}/user/login"
         payload = {
@@ -79,6 +151,8 @@ class CkApstraSession:
             self.token = response.json()["token"]
             self.session.headers.update({'AuthToken': self.token})
             self.last_error = None
+            if self.token_cache:
+                self.token_cache.put(self.host, self.port, self.username, self.token)
             return
         if response.status_code == 401:
             self.last_error = response.json()['errors']
@@ -89,8 +163,30 @@ class CkApstraSession:
             self.logger.error(f"login failed: {self.last_error}")
             return
 
+    def relogin(self, rejected_token: str = None) -> bool:
+        """
+        Log in again after the controller rejected a token with HTTP 401.
+
+        Args:
+            rejected_token: The token of the failed request. Another thread may have replaced it already.
+
+        Returns:
+            True if there is a new token to retry with.
+        """
+        with self._login_lock:
+            if self.token and rejected_token and self.token != rejected_token:
+                return True
+            self.logger.info("token rejected. logging in again")
+            if self.token_cache:
+                self.token_cache.remove(self.host, self.port, self.username)
+            self.token = None
+            self._login()
+            return self.token is not None
+
     def logout(self) -> None:
         self.token = None
+        if self.token_cache:
+            self.token_cache.remove(self.host, self.port, self.username)
         url = f"{self.url_prefix}/aaa/logout"
         response = self.post(url, None)
         # the status code is 404 (not found) if the logout is successful
@@ -106,24 +202,17 @@ class CkApstraSession:
         return self.token is not None
 
 
-    @cache
     def get_device_profile(self, device_profile_name: str = None) -> Result[dict, str]:
         """
-        Get the device profile with the specified name.
+        Get the device profile with the specified name. Each device profile is pulled once per session.
 
         Args:
             name: The name of the device profile.
 
         Returns:
-            The device profile, or None if the device profile does not exist.
+            The device profile, or Err if the device profile does not exist.
         """
-        if device_profile_name is None:
-            return Err(f"Error: {device_profile_name=}")
-            # return None, f"Error: {device_profile_name=}"
-        device_profiles = self.get_items('device-profiles')['items']
-        the_device_profile = [x for x in device_profiles if x['id'] == device_profile_name][0]
-        return Ok(the_device_profile)
-        # return the_device_profile, None
+        return self.device_profiles.get(device_profile_name)
 
 
     def get_logical_device(self, id: int) -> dict:
@@ -168,20 +257,15 @@ class CkApstraSession:
         self.logger.debug(f"patch_item({url}, {spec})")
         return self.session.patch(url, json=spec).json()
 
-    def patch_throttled(self, url: str, spec: dict, params: None) -> dict:
+    def patch_throttled(self, url: str, spec: dict, params: dict = None) -> dict:
         """
+        Patch the full url. HTTP 429 is retried by the session rate limiter.
+
+        Returns:
+            The json of the response, or None if the response is empty
         """
-        throttle_seconds = 10
         patched = self.session.patch(url, json=spec, params=params)
         try:
-            while patched.status_code == 429:   # http 429 too many requests
-                self.logger.info(f"sleeping {throttle_seconds} seconds due to: {patched.text}")
-                time.sleep(throttle_seconds)
-                patched = self.session.patch(url, json=spec, params=params)
-                if patched.content:
-                    return patched.json()
-                else:
-                    return None
             if patched.content:
                 return patched.json()
             else:
@@ -190,6 +274,20 @@ class CkApstraSession:
             self.logger.error(f"{spec=}, {patched.content=} {e=}")
             return None
 
+    def set_pool_size(self, pool_size: int) -> None:
+        """
+        Keep up to pool_size connections to the controller for the concurrent calls over this session.
+        Without it, the connections above the default 10 are discarded after each call.
+        """
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def throttle_stats(self) -> dict:
+        """
+        Return the counters of the rate limiter: requests, throttled, wait_seconds, rate
+        """
+        return self.rate_limiter.stats
+
     def print_token(self) -> None:
         """
         Print the current authentication token.
@@ -206,6 +304,59 @@ class CkApstraSession:
         url = f"{self.url_prefix}/blueprints"
         return self.session.options(url).json()['items']
 
+    def get_blueprint_summaries(self, refresh: bool = False) -> dict:
+        """
+        Get the summaries of all the blueprints, cached per session.
+
+        The summary list carries id, label, design and version without the nodes and relationships.
+
+        Args:
+            refresh: Pull the list again from the controller
+
+        Returns:
+            The dict of { blueprint_id: summary }
+        """
+        if self.blueprint_summaries is None or refresh:
+            self.blueprint_summaries = {x['id']: x for x in self.get_items('blueprints')['items']}
+        return self.blueprint_summaries
+
+    def get_blueprint(self, label: str):
+        """
+        Get the CkApstraBlueprint of the label, the same object for the same label while cached in self.blueprints.
+
+        Returns:
+            The CkApstraBlueprint or None if the blueprint does not exist.
+        """
+        from .apstra_blueprint import CkApstraBlueprint
+
+        blueprint = self.blueprints.get(label, None)
+        if blueprint is None:
+            blueprint = CkApstraBlueprint(self, label)
+            if blueprint.id is None:
+                return None
+            self.blueprints.put(label, blueprint)
+        return blueprint
+
+    def find_blueprint_summary(self, label: str = None, id: str = None) -> Optional[dict]:
+        """
+        Find the summary of a blueprint by id or label. The cached directory is refreshed once on a miss.
+
+        Returns:
+            The summary of the blueprint or None if the blueprint does not exist.
+        """
+        def lookup():
+            summaries = self.get_blueprint_summaries()
+            if id:
+                return summaries.get(id)
+            found = [x for x in summaries.values() if x['label'] == label]
+            return found[0] if found else None
+
+        summary = lookup()
+        if summary is None:
+            self.get_blueprint_summaries(refresh=True)
+            summary = lookup()
+        return summary
+
     def post(self, url: str, data: dict, params: dict = None) -> dict:
         """
         Post data to the url.
@@ -258,10 +409,12 @@ class CkApstraSession:
             'relationships': relationship_list
         }
         bp_created = self.post('blueprints', data=bp_spec)
-        # TODO: check the task status instead of fixed wait
-        # may take 6 seconds or more
-        time.sleep(10)
-        return bp_created.json()['id']
+        self.blueprint_summaries = None
+        bp_id = bp_created.json()['id']
+        # may take 6 seconds or more to be available. diff-status instead of the blueprint itself not to pull the whole graph per poll
+        if not wait_until(lambda: self.session.get(f"{self.url_prefix}/blueprints/{bp_id}/diff-status").status_code == 200, timeout=60):
+            self.logger.warning(f"create_blueprint_json() blueprint {bp_name} {bp_id=} not available after 60 seconds")
+        return bp_id
 
     def delete_raw(self, delete_url: str):
         return self.session.delete(delete_url)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+from collections import defaultdict
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class BlueprintSnapshot:
+    """
+    In-memory indexes over one blueprint dump (see CkApstraBlueprint.dump)
+
+    It is a point-in-time view. Writes made after the dump are not reflected until a new snapshot is taken.
+    """
+
+    def __init__(self, blueprint_dump: dict) -> None:
+        """
+        Args:
+            blueprint_dump: The blueprint with 'nodes' and 'relationships'
+        """
+        self.id = blueprint_dump.get('id')
+        self.label = blueprint_dump.get('label')
+        self.version = blueprint_dump.get('version')
+        self.logger = logging.getLogger(f"BlueprintSnapshot({self.label})")
+
+        nodes = blueprint_dump['nodes']
+        relationships = blueprint_dump['relationships']
+        node_list = nodes.values() if isinstance(nodes, dict) else nodes
+        relationship_list = relationships.values() if isinstance(relationships, dict) else relationships
+
+        self.nodes: Dict[str, dict] = {}  # { node_id: node }
+        self._by_type: Dict[str, List[dict]] = defaultdict(list)  # { node type: [node] }
+        self._by_type_label: Dict[Tuple[str, str], List[dict]] = defaultdict(list)  # { (node type, label): [node] }
+        # { node_id: { relationship type: [node_id] } }
+        self._out: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        self._in: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+
+        for node in node_list:
+            self.nodes[node['id']] = node
+            self._by_type[node['type']].append(node)
+            self._by_type_label[(node['type'], node.get('label'))].append(node)
+        for relationship in relationship_list:
+            self._out[relationship['source_id']][relationship['type']].append(relationship['target_id'])
+            self._in[relationship['target_id']][relationship['type']].append(relationship['source_id'])
+        self.logger.debug(f"indexed {len(self.nodes)} nodes and {len(relationship_list)} relationships")
+
+    def node(self, node_id: str) -> Optional[dict]:
+        """
+        Return the node of the id or None
+        """
+        return self.nodes.get(node_id)
+
+    def nodes_by_type(self, node_type: Optional[str] = None) -> List[dict]:
+        """
+        Return the nodes of the type. All the nodes when node_type is None
+        """
+        if node_type is None:
+            return list(self.nodes.values())
+        return self._by_type.get(node_type, [])
+
+    def nodes_by_label(self, node_type: str, label: str) -> List[dict]:
+        """
+        Return the nodes of the type with the label
+        """
+        return self._by_type_label.get((node_type, label), [])
+
+    def find(self, node_type: Optional[str] = None, **properties: Any) -> List[dict]:
+        """
+        Return the nodes of the type having all the property values
+        """
+        if 'label' in properties and node_type:
+            candidates = self.nodes_by_label(node_type, properties['label'])
+        else:
+            candidates = self.nodes_by_type(node_type)
+        return [x for x in candidates if all(x.get(k) == v for k, v in properties.items())]
+
+    def out_ids(self, node_id: str, relationship_type: Optional[str] = None) -> List[str]:
+        """
+        Return the ids of the nodes the node points to, optionally of the relationship type
+        """
+        by_type = self._out.get(node_id, {})
+        if relationship_type is not None:
+            return by_type.get(relationship_type, [])
+        return [x for ids in by_type.values() for x in ids]
+
+    def in_ids(self, node_id: str, relationship_type: Optional[str] = None) -> List[str]:
+        """
+        Return the ids of the nodes pointing to the node, optionally of the relationship type
+        """
+        by_type = self._in.get(node_id, {})
+        if relationship_type is not None:
+            return by_type.get(relationship_type, [])
+        return [x for ids in by_type.values() for x in ids]
+
+    def out_nodes(self, node_id: str, relationship_type: Optional[str] = None) -> List[dict]:
+        return [self.nodes[x] for x in self.out_ids(node_id, relationship_type)]
+
+    def in_nodes(self, node_id: str, relationship_type: Optional[str] = None) -> List[dict]:
+        return [self.nodes[x] for x in self.in_ids(node_id, relationship_type)]
+
+    def tags(self, node_id: str) -> List[str]:
+        """
+        Return the labels of the tags of the node
+        """
+        return [x['label'] for x in self.in_nodes(node_id, 'tag') if x['type'] == 'tag']
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LruCache:
+    """
+    Thread safe bounded LRU cache with an optional time to live and hit/miss/eviction counters
+    """
+    MISSING = object()
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            maxsize: The maximum number of entries. The least recently used entry is evicted beyond it.
+            ttl: The seconds an entry is served after put(). None to keep it until evicted.
+            clock: The time source of the ttl
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: OrderedDict = OrderedDict()  # { key: (expires_at, value) }
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Return the value of the key, or default (LruCache.MISSING) if absent or expired.
+        """
+        with self._lock:
+            if key in self._data:
+                expires_at, value = self._data[key]
+                if expires_at is None or expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """
+        Drop the entry of the key. Returns True if it was present.
+        """
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Return a hashable form of the value. The lists, sets and dicts of the arguments become tuples.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(x) for x in value))
+    return value
+
+
+_method_caches_lock = threading.Lock()
+
+
+def _method_caches(obj: Any) -> Dict[str, LruCache]:
+    # kept in the object, so the entries go away with the object
+    caches = obj.__dict__.get('_method_caches')
+    if caches is None:
+        with _method_caches_lock:
+            caches = obj.__dict__.setdefault('_method_caches', {})
+    return caches
+
+
+def cached_method(maxsize: int = 256, ttl: Optional[float] = None, cache_if: Callable[[Any], bool] = None):
+    """
+    Cache the results of a method per object in a LruCache, instead of functools.cache which keeps self
+    forever, has no bound and fails on the list arguments.
+
+        @cached_method(maxsize=1024, ttl=300, cache_if=lambda x: isinstance(x, Ok))
+        def get_system_with_im(self, system_label): ...
+
+    The caches of an object are dropped by clear_method_caches(obj), to be called by the write methods.
+
+    Args:
+        maxsize: The maximum number of results per object
+        ttl: The seconds a result is served. None to keep it until evicted or cleared.
+        cache_if: Cache only the results for which it returns True. All the results by default.
+    """
+    def decorator(method):
+        name = method.__qualname__
+
+        def method_cache(obj: Any) -> LruCache:
+            caches = _method_caches(obj)
+            if name not in caches:
+                with _method_caches_lock:
+                    caches.setdefault(name, LruCache(maxsize, ttl))
+            return caches[name]
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = method_cache(self)
+            key = (freeze(args), freeze(kwargs))
+            value = cache.get(key)
+            if value is not LruCache.MISSING:
+                return value
+            value = method(self, *args, **kwargs)
+            if cache_if is None or cache_if(value):
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = method_cache
+        return wrapper
+    return decorator
+
+
+def clear_method_caches(obj: Any) -> None:
+    """
+    Drop the results of all the cached_method of the object
+    """
+    for cache in list(_method_caches(obj).values()):
+        cache.clear()
+
+
+def method_cache_stats(obj: Any) -> Dict[str, dict]:
+    """
+    The stats of the cached_method of the object by the method name
+    """
+    return {name: cache.stats for name, cache in list(_method_caches(obj).items())}
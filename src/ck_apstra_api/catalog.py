@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from result import Err, Ok, Result
+
+
+class BlueprintCatalog:
+    """
+    The label <-> id maps of the named objects of a blueprint.
+
+    Each kind is loaded with one query on the first lookup. All the kinds are dropped when the staging version
+    of the blueprint changes, or by invalidate() after a write through the blueprint.
+
+        sz_id = bp.catalog.id('security_zone', 'blue')
+        vn_id = bp.catalog.id('virtual_network', '200020', key='vn_id')
+    """
+
+    # { kind: (query, the properties to index by) }
+    KINDS = {
+        'security_zone': ("node('security_zone', name='node')", ('label', 'vrf_name')),
+        'routing_policy': ("node('routing_policy', name='node')", ('label',)),
+        'virtual_network': ("node('virtual_network', name='node')", ('label', 'vn_id')),
+        'connectivity_template': ("node('ep_endpoint_policy', policy_type_name='batch', name='node')", ('label',)),
+    }
+
+    def __init__(self, bp) -> None:
+        """
+        Args:
+            bp: The CkApstraBlueprint of the catalog
+        """
+        self.bp = bp
+        self.logger = logging.getLogger(f"BlueprintCatalog({bp.label})")
+        self._indexes: Dict[str, Dict[str, Dict[str, dict]]] = {}  # { kind: { key: { value: node } } }
+        self._version = None
+        self._lock = threading.Lock()
+        # counters
+        self.loads = 0
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._indexes = {}
+
+    def load(self, kind: str) -> Result[Dict[str, Dict[str, dict]], str]:
+        """
+        Load the kind unless loaded for the staging version
+
+        Returns:
+            { key: { value: node } } of the kind, or Err of the query
+        """
+        version = self.bp.staging_version()
+        with self._lock:
+            if version != self._version:
+                if self._indexes:
+                    self.refreshes += 1
+                self._indexes = {}
+                self._version = version
+            if kind in self._indexes:
+                return Ok(self._indexes[kind])
+        query, keys = self.KINDS[kind]
+        nodes_result = self.bp.query(query)
+        if isinstance(nodes_result, Err):
+            # not kept, to be loaded again on the next lookup
+            self.logger.warning(f"{kind} not loaded: {nodes_result.err_value}")
+            return Err(f"{kind} not loaded: {nodes_result.err_value}")
+        index = {'id': {}}
+        for key in keys:
+            index[key] = {}
+        for x in nodes_result.ok_value:
+            node = x['node']
+            index['id'][node['id']] = node
+            for key in keys:
+                if node.get(key) is not None:
+                    index[key].setdefault(str(node[key]), node)
+        with self._lock:
+            self.loads += 1
+            self._indexes[kind] = index
+        return Ok(index)
+
+    def _index(self, kind: str) -> Dict[str, Dict[str, dict]]:
+        # a kind not loaded has no nodes
+        return self.load(kind).unwrap_or({})
+
+    def node(self, kind: str, value: Any, key: str = 'label') -> Optional[dict]:
+        """
+        The node of the kind with the property key of value, or None
+        """
+        node = self._index(kind).get(key, {}).get(str(value))
+        if node is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return node
+
+    def id(self, kind: str, value: Any, key: str = 'label') -> Optional[str]:
+        node = self.node(kind, value, key)
+        return node['id'] if node else None
+
+    def ids(self, kind: str, values: List[Any], key: str = 'label') -> List[str]:
+        """
+        The ids of the values present, in the order of the values
+        """
+        return [x for x in (self.id(kind, y, key) for y in values) if x]
+
+    def label(self, kind: str, node_id: str) -> Optional[str]:
+        node = self.node(kind, node_id, 'id')
+        return node.get('label') if node else None
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = {k: len(v['id']) for k, v in self._indexes.items()}
+        return {
+            'loads': self.loads,
+            'refreshes': self.refreshes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'sizes': sizes,
+        }
@@ -1,7 +1,7 @@
 import click
 import sys
 
-from ck_apstra_api import CkApstraSession, prep_logging
+from ck_apstra_api import CkApstraSession, CkTokenCache, prep_logging
 
 from . import cliVar
 
@@ -9,6 +9,7 @@ from .blueprint import check_blueprint, export_blueprint_json, import_blueprint_
 from .virtual_network import export_virtual_network_csv, import_virtual_network_csv, relocate_vn, test_get_temp_vn, assign_vn_to_leaf
 from .system import export_systems, export_generic_system, import_generic_system
 from .ip_link import export_iplink, import_iplink
+from .ip_endpoint import add_ip_endpoints
 from .dci import export_dci, import_dci
 from .configlet_validate import validate_configlet
 from .vlan_cts import add_single_vlan_cts
@@ -21,9 +22,10 @@ from .vlan_cts import add_single_vlan_cts
 @click.option('--host-password', type=str, envvar='HOST_PASSWORD', help='Host password', default='admin')
 @click.option('--file-folder', type=str, envvar='FILE_FOLDER', help='Folder path to read files from and write files to', default='.')
 @click.option('--log-folder', type=str, envvar='LOG_FOLDER', help='Folder path to write log files to', default='.')
+@click.option('--token-cache/--no-token-cache', envvar='TOKEN_CACHE', help='Reuse the auth token across invocations (~/.cache/ck_apstra_api/tokens.json)', default=True)
 @click.version_option(message='%(package)s, %(version)s')
 @click.pass_context
-def cli(ctx, host_ip: str, host_port: int, host_user: str, host_password: str, file_folder: str, log_folder: str):
+def cli(ctx, host_ip: str, host_port: int, host_user: str, host_password: str, file_folder: str, log_folder: str, token_cache: bool):
     """
     A CLI tool for interacting with ck-apstra-api.
 
@@ -41,7 +43,8 @@ def cli(ctx, host_ip: str, host_port: int, host_user: str, host_password: str, f
 
     if host_ip:
         # ck-cli --help won't have host-ip
-        cliVar.session = CkApstraSession(host_ip, host_port, host_user, host_password)
+        cliVar.session = CkApstraSession(host_ip, host_port, host_user, host_password,
+                                         token_cache=CkTokenCache() if token_cache else None)
         if cliVar.session.last_error:
             logger.error(f"Session error: {cliVar.session.last_error}")
             sys.exit(1)  # Exit if there is a session error
@@ -93,6 +96,7 @@ cli.add_command(import_generic_system)
 # Register IP link-related commands
 cli.add_command(export_iplink)
 cli.add_command(import_iplink)
+cli.add_command(add_ip_endpoints)
 
 # Register DCI-related commands
 cli.add_command(export_dci)
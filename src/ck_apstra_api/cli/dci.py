@@ -1,31 +1,16 @@
-from functools import cache
 import json
 import os
-import time
 import click
 import yaml
 
 from . import cliVar, prep_logging
+from ck_apstra_api.task_tracker import wait_until
 
 INTERCONNECT = 'evpn_interconnect_groups'
 IC_ROUTING_ZONES = 'interconnect_security_zones'
 IC_VIRTUAL_NETWORKS = 'interconnect_virtual_networks'
 
 
-@cache
-def get_routing_policy_id(bp, label: str):
-    """
-    Get routing policy by label
-
-    """
-    logger = prep_logging('DEBUG', 'get_routing_policy()')
-
-    if label:
-        routing_policies = {x['label']: x for x in bp.get_item('routing-policies')['items']}
-        if label in routing_policies:
-            return routing_policies[label]['id']
-    return None
-
 def pull_ic_virtual_networks(ic_datum_in_blueprint: dict, ic_datum: dict):
     """
     Retrieve virtual networks
@@ -212,109 +197,115 @@ def import_interconnect():
             posted = bp.post_item(INTERCONNECT, ic_spec)
             logger.info(f"{posted=}, {posted.text=}, {posted.status_code=}")
             ic_id = posted.json()['id']
-            # TODO:
-            time.sleep(2)
-            ic_datum_in_bp = [ x for x in bp.get_item(INTERCONNECT)[INTERCONNECT] if x['label'] == ic_label][0]
+            # the interconnect shows up in the collection after a while
+            ic_data = wait_until(lambda: [ x for x in bp.get_item(INTERCONNECT)[INTERCONNECT] if x['label'] == ic_label], timeout=30)
+            if not ic_data:
+                logger.error(f"{ic_label=} not found after creation")
+                continue
+            ic_datum_in_bp = ic_data[0]
         if any([
             ic_datum_in_bp['interconnect_route_target'] != ic_datum_in_file['interconnect_route_target'],
             ic_datum_in_bp['interconnect_esi_mac'] != ic_datum_in_file['interconnect_esi_mac']
             ]):
             patched = bp.patch_item(f"{INTERCONNECT}/{ic_id}", ic_spec)
-            logger.info(f"{patched=}, {patched.text=}, {patched.status_code=}")
-
-        # import remote gateways
-        remote_gateways_in_bp = { x['gw_name']: x for x in ic_datum_in_bp.get('remote_gateway_node_ids', {}).values()}
-        remote_gateways_in_file = ic_datum_in_file['remote_gateway_node_ids']
-        # remove the remote gateways those are not present in the file
-        for rg_in_bp in remote_gateways_in_bp.values():
-            if rg_in_bp['gw_name'] not in remote_gateways_in_file:
-                rg_deleted = bp.delete_item(f"remote_gateways/{rg_in_bp['id']}")
-                logger.info(f"{rg_deleted=}, {rg_deleted.text=}, {rg_deleted.status_code=}")
-        # add or update the remote gateways in the file
-        for rg_datum_in_file in remote_gateways_in_file.values():
-            rg_name = rg_datum_in_file['gw_name']
-            rg_datum_in_bp = remote_gateways_in_bp.get(rg_name, {})
-            rg_datum_id = rg_datum_in_bp.get('id', None)
-            rg_spec = {
-                'gw_name': rg_datum_in_file['gw_name'],
-                'gw_ip': rg_datum_in_file['gw_ip'],
-                'gw_asn': rg_datum_in_file['gw_asn'],
-                'ttl': rg_datum_in_file.get('ttl', 30),
-                'keepalive_timer': rg_datum_in_file.get('keepalive_timer', 10),
-                'holdtime_timer': rg_datum_in_file.get('holdtime_timer', 30),
-                # 'local_gw_nodes': rg_datum_in_file['local_gw_nodes']
-            }
-            logger.info(f"{rg_name=}")
-            # create one if not in the blueprint
-            if not rg_datum_in_bp:
-                # create the remote gateway
-                rg_spec['evpn_interconnect_group_id'] = ic_id
-                rg_spec['evpn_route_types'] = 'all'
-                rg_spec['local_gw_nodes'] = [bp.get_system_node_from_label(x).ok_value['id'] for x in rg_datum_in_file['local_gw_nodes']]
-                posted = bp.post_item("remote_gateways", rg_spec)
-                logger.info(f"{posted=}, {posted.text=}, {posted.status_code=}")
-                continue
-            for variable in ['gw_ip', 'gw_asn', 'ttl', 'keepalive_timer', 'holdtime_timer']:
-                if rg_datum_in_file[variable] != rg_datum_in_bp.get(variable, None):
+            if not patched.ok:
+                logger.error(f"{ic_label=} not patched: {patched.status_code=}, {patched.text=}")
+
+        # the writes after the interconnect creation go out in /batch requests
+        with bp.write_batch() as batch:
+            # import remote gateways
+            remote_gateways_in_bp = { x['gw_name']: x for x in ic_datum_in_bp.get('remote_gateway_node_ids', {}).values()}
+            remote_gateways_in_file = ic_datum_in_file['remote_gateway_node_ids']
+            # remove the remote gateways those are not present in the file
+            for rg_in_bp in remote_gateways_in_bp.values():
+                if rg_in_bp['gw_name'] not in remote_gateways_in_file:
+                    rg_deleted = bp.delete_item(f"remote_gateways/{rg_in_bp['id']}")
+            # add or update the remote gateways in the file
+            for rg_datum_in_file in remote_gateways_in_file.values():
+                rg_name = rg_datum_in_file['gw_name']
+                rg_datum_in_bp = remote_gateways_in_bp.get(rg_name, {})
+                rg_datum_id = rg_datum_in_bp.get('id', None)
+                rg_spec = {
+                    'gw_name': rg_datum_in_file['gw_name'],
+                    'gw_ip': rg_datum_in_file['gw_ip'],
+                    'gw_asn': rg_datum_in_file['gw_asn'],
+                    'ttl': rg_datum_in_file.get('ttl', 30),
+                    'keepalive_timer': rg_datum_in_file.get('keepalive_timer', 10),
+                    'holdtime_timer': rg_datum_in_file.get('holdtime_timer', 30),
+                    # 'local_gw_nodes': rg_datum_in_file['local_gw_nodes']
+                }
+                logger.info(f"{rg_name=}")
+                # create one if not in the blueprint
+                if not rg_datum_in_bp:
+                    # create the remote gateway
+                    rg_spec['evpn_interconnect_group_id'] = ic_id
+                    rg_spec['evpn_route_types'] = 'all'
+                    rg_spec['local_gw_nodes'] = [bp.get_system_node_from_label(x).ok_value['id'] for x in rg_datum_in_file['local_gw_nodes']]
+                    posted = bp.post_item("remote_gateways", rg_spec)
+                    continue
+                for variable in ['gw_ip', 'gw_asn', 'ttl', 'keepalive_timer', 'holdtime_timer']:
+                    if rg_datum_in_file[variable] != rg_datum_in_bp.get(variable, None):
+                        is_changed = True
+                # local_gw_nodes should be present always
+                if is_changed or rg_datum_in_file['local_gw_nodes'] != [x['label'] for x in rg_datum_in_bp['local_gw_nodes']]:
+                    rg_spec['local_gw_nodes'] = [bp.get_system_node_from_label(x).ok_value['id'] for x in rg_datum_in_file['local_gw_nodes']]
+                if is_changed:
+                    patched = bp.put_item(f"remote_gateways/{rg_datum_id}", rg_spec)
+                else:
+                    logger.info(f"No change in remote gateway {rg_name}")
+
+            # iterarte through the routing zones        
+            security_zones_in_bp = { x['vrf_name']: x for x in ic_datum_in_bp.get('interconnect_security_zones', {}).values()}
+            security_zones_in_file = ic_datum_in_file['interconnect_security_zones']
+            rz_spec = ic_spec['interconnect_security_zones'] = {}
+            for vrf_name, security_zone_in_file in security_zones_in_file.items():
+                security_zone_in_bp = security_zones_in_bp[vrf_name]
+                this_rz_spec = {}
+                sz_id = security_zone_in_bp['security_zone_id']
+                this_rz_spec['enabled_for_l3'] = security_zone_in_file['enabled_for_l3']
+                if security_zone_in_file['enabled_for_l3'] != security_zone_in_bp['enabled_for_l3']:
                     is_changed = True
-            # local_gw_nodes should be present always
-            if is_changed or rg_datum_in_file['local_gw_nodes'] != [x['label'] for x in rg_datum_in_bp['local_gw_nodes']]:
-                rg_spec['local_gw_nodes'] = [bp.get_system_node_from_label(x).ok_value['id'] for x in rg_datum_in_file['local_gw_nodes']]
-            if is_changed:
-                patched = bp.put_item(f"remote_gateways/{rg_datum_id}", rg_spec)
-                logger.info(f"{patched=}, {patched.text=}, {patched.status_code=}")                
-            else:
-                logger.info(f"No change in remote gateway {rg_name}")
-
-        # iterarte through the routing zones        
-        security_zones_in_bp = { x['vrf_name']: x for x in ic_datum_in_bp.get('interconnect_security_zones', {}).values()}
-        security_zones_in_file = ic_datum_in_file['interconnect_security_zones']
-        rz_spec = ic_spec['interconnect_security_zones'] = {}
-        for vrf_name, security_zone_in_file in security_zones_in_file.items():
-            security_zone_in_bp = security_zones_in_bp[vrf_name]
-            this_rz_spec = {}
-            sz_id = security_zone_in_bp['security_zone_id']
-            this_rz_spec['enabled_for_l3'] = security_zone_in_file['enabled_for_l3']
-            if security_zone_in_file['enabled_for_l3'] != security_zone_in_bp['enabled_for_l3']:
-                is_changed = True
-            this_rz_spec['interconnect_route_target'] = security_zone_in_file['interconnect_route_target']
-            if security_zone_in_file['interconnect_route_target'] != security_zone_in_bp['interconnect_route_target']:
-                is_changed = True
-            this_rz_spec['routing_policy_id'] = get_routing_policy_id(bp, security_zone_in_file['routing_policy_label'])
-            rz_spec[sz_id] = this_rz_spec
-
-        # iterate through the virtual networks
-        virtual_networks_in_file = ic_datum_in_file['interconnect_virtual_networks']
-        virtual_networks_in_bp = ic_datum_in_bp['interconnect_virtual_networks']
-        vn_spec = ic_spec['interconnect_virtual_networks'] = {}
-        for vn_id, virtual_network_in_bp in virtual_networks_in_bp.items():
-            vn_label = virtual_network_in_bp['label']
-            virtual_network_in_file = virtual_networks_in_file.get(vn_label, {})
-            if virtual_network_in_file:
-                if any([
-                    virtual_network_in_file['translation_vni'] != virtual_network_in_bp['translation_vni'],
-                    virtual_network_in_file['l2'] != virtual_network_in_bp['l2'],
-                    virtual_network_in_file['l3'] != virtual_network_in_bp['l3']
-                ]):
+                this_rz_spec['interconnect_route_target'] = security_zone_in_file['interconnect_route_target']
+                if security_zone_in_file['interconnect_route_target'] != security_zone_in_bp['interconnect_route_target']:
                     is_changed = True
-                this_vn_spec = {
-                    'translation_vni': virtual_network_in_file['translation_vni'],
-                    'l2': virtual_network_in_file['l2'],
-                    'l3': virtual_network_in_file['l3']
-                }
-            else:
-                is_changed = True
-                this_vn_spec = {
-                    'translation_vni': virtual_network_in_bp['translation_vni'],
-                    'l2': virtual_network_in_bp['l2'],
-                    'l3': virtual_network_in_bp['l3']
-                }
-            if is_changed:
-                vn_spec[vn_id] = this_vn_spec
+                this_rz_spec['routing_policy_id'] = bp.get_routing_policy_id(security_zone_in_file['routing_policy_label'])
+                rz_spec[sz_id] = this_rz_spec
+
+            # iterate through the virtual networks
+            virtual_networks_in_file = ic_datum_in_file['interconnect_virtual_networks']
+            virtual_networks_in_bp = ic_datum_in_bp['interconnect_virtual_networks']
+            vn_spec = ic_spec['interconnect_virtual_networks'] = {}
+            for vn_id, virtual_network_in_bp in virtual_networks_in_bp.items():
+                vn_label = virtual_network_in_bp['label']
+                virtual_network_in_file = virtual_networks_in_file.get(vn_label, {})
+                if virtual_network_in_file:
+                    if any([
+                        virtual_network_in_file['translation_vni'] != virtual_network_in_bp['translation_vni'],
+                        virtual_network_in_file['l2'] != virtual_network_in_bp['l2'],
+                        virtual_network_in_file['l3'] != virtual_network_in_bp['l3']
+                    ]):
+                        is_changed = True
+                    this_vn_spec = {
+                        'translation_vni': virtual_network_in_file['translation_vni'],
+                        'l2': virtual_network_in_file['l2'],
+                        'l3': virtual_network_in_file['l3']
+                    }
+                else:
+                    is_changed = True
+                    this_vn_spec = {
+                        'translation_vni': virtual_network_in_bp['translation_vni'],
+                        'l2': virtual_network_in_bp['l2'],
+                        'l3': virtual_network_in_bp['l3']
+                    }
+                if is_changed:
+                    vn_spec[vn_id] = this_vn_spec
 
-        if is_changed:
-            patched = bp.patch_item(f"{INTERCONNECT}/{ic_id}", ic_spec)
-            logger.info(f"{patched=}, {patched.text=}, {patched.status_code=}")
+            if is_changed:
+                patched = bp.patch_item(f"{INTERCONNECT}/{ic_id}", ic_spec)
+        # the results are set when the batch is flushed
+        for operation in batch.failed:
+            logger.error(f"{ic_label=} {operation.method} {operation.path} failed: {operation.status_code=}, {operation.text=}")
+        logger.info(f"{ic_label=} {batch.stats=}")
 
     return
 
@@ -0,0 +1,22 @@
+import click
+
+from . import cliVar, prep_logging
+from ck_apstra_api.ip_endpoint import PrefixListCollection, add_ip_endpoints as add_ip_endpoints_to_blueprint
+
+
+@click.command(name='add-ip-endpoints')
+@click.option('--bp-name', type=str, envvar='BP_NAME', help='Blueprint name')
+@click.option('--set-file', required=True, help='The name of the junos configuration in set format')
+@click.pass_context
+def add_ip_endpoints(ctx, bp_name: str, set_file: str):
+    """
+    Add the ip endpoints and their groups from the prefix lists of the junos configuration
+    """
+    logger = prep_logging('DEBUG', 'add_ip_endpoints()')
+
+    main_bp = cliVar.get_blueprint(bp_name, logger)
+    if not main_bp:
+        return
+    prefix_list_collection = PrefixListCollection(main_bp)
+    prefix_list_collection.read_from_set(set_file)
+    add_ip_endpoints_to_blueprint(main_bp, prefix_list_collection)
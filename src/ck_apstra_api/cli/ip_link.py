@@ -1,4 +1,3 @@
-from functools import cache
 import click
 import csv
 import os
@@ -55,13 +54,6 @@ def export_iplink(ctx, csv_out: str = None):
         writer.writerows(iplinks)
     logger.info(f"IP Links exported to {csv_path}")
 
-@cache
-def get_blueprint(session, bp_name):
-    from ck_apstra_api import CkApstraBlueprint
-    bp = CkApstraBlueprint(session, bp_name)
-    return bp
-
-
 @click.command()
 @click.option('--csv-in', type=str, default='iplink-in.csv', help='CSV file name to read IpLinks')
 @click.pass_context
@@ -94,8 +86,8 @@ def import_iplink(ctx, csv_in: str = None):
             ip_links_to_add.append(dict_to_add)
             # logger.info(f"{dict_to_add=}")
             blueprint_label = dict_to_add[IpLinkEnum.HEADER_BLUEPRINT]
-            bp = get_blueprint(cliVar.session, blueprint_label)
-            if not bp.id:
+            bp = cliVar.session.get_blueprint(blueprint_label)
+            if bp is None:
                 logger.error(f"Blueprint {blueprint_label} not found")
                 continue
             patched = bp.import_iplink(dict_to_add)
@@ -89,8 +89,14 @@ def export_systems(ctx, bp_name, systems_csv):
 
 @click.command()
 @click.option('--gs-csv-in', type=str, default='~/Downloads/gs_sample.csv', help='Path to the CSV file for generic systems')
+@click.option('--workers', type=int, envvar='WORKERS', default=16, show_default=True, help='The number of generic systems to fetch concurrently')
+@click.option('--dry-run', is_flag=True, default=False, help='Log the plan of the changes without applying them')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='The number of generic systems to process at a time. 0 for all at once')
+@click.option('--presorted', is_flag=True, default=False, help='The rows of each generic system are contiguous in the CSV file')
+@click.option('--journal', 'journal_path', type=str, default=None, help='Path to the import journal. <gs-csv-in>.journal by default')
+@click.option('--resume', is_flag=True, default=False, help='Skip the generic systems and the stages done in the journal of an earlier run')
 @click.pass_context
-def import_generic_system(ctx, gs_csv_in: str):
+def import_generic_system(ctx, gs_csv_in: str, workers: int, dry_run: bool, chunk_size: int, presorted: bool, journal_path: str, resume: bool):
     """
     Import generic systems from a CSV file
 
@@ -103,6 +109,7 @@ def import_generic_system(ctx, gs_csv_in: str):
 
 
     from ck_apstra_api import GsCsvKeys, add_generic_systems, CkApstraSession, prep_logging
+    from ck_apstra_api.import_journal import ImportJournal
     from result import Ok, Err
 
     # logger = prep_logging('DEBUG', 'import_generic_system()')
@@ -117,8 +124,9 @@ def import_generic_system(ctx, gs_csv_in: str):
     #     logger.error(f"Session error: {session.last_error}")
     #     return
     gs_csv_path = os.path.expanduser(gs_csv_in)
+    # the dry run does not change anything to record
+    journal = None if dry_run else ImportJournal(os.path.expanduser(journal_path or f"{gs_csv_path}.journal"), resume)
 
-    links_to_add = []
     with open(gs_csv_path, 'r') as csvfile:
         csv_reader = csv.DictReader(csvfile)        
         headers = csv_reader.fieldnames
@@ -128,46 +136,39 @@ def import_generic_system(ctx, gs_csv_in: str):
                 f"CSV header mismatch. Expected headers ({len(expected_headers)}): "
                     + ', '.join(expected_headers) + f', Input headers ({len(headers)}) : ' + ', '.join(headers))
 
-        for row in csv_reader:
-            links_to_add.append(row)
-
-    logger.debug(f"Importing generic systems {links_to_add=}")
-    for res in add_generic_systems(cliVar.session, links_to_add):
-        if isinstance(res, Ok):
-            logger.info(res.ok_value)
-        elif isinstance(res, Err):
-            logger.warning(res.err_value)
-        else:
-            logger.info(res)
+        # the rows are streamed through in chunks of generic systems
+        logger.debug(f"Importing generic systems {gs_csv_path=} {chunk_size=} {presorted=}")
+        for res in add_generic_systems(cliVar.session, csv_reader, workers, dry_run, chunk_size or None, presorted, journal):
+            if isinstance(res, Ok):
+                logger.info(res.ok_value)
+            elif isinstance(res, Err):
+                logger.warning(res.err_value)
+            else:
+                logger.info(res)
 
 
 @click.command()
 @click.option('--gs-csv-out', type=str, default='~/gs.csv', help='Path to the CSV file for generic systems')
+@click.option('--bp-name', 'bp_names', type=str, multiple=True, help='The blueprint to export. Repeat for more. All the datacenter blueprints by default')
+@click.option('--workers', type=int, envvar='WORKERS', default=4, show_default=True, help='The number of blueprints to pull concurrently')
 @click.pass_context
-def export_generic_system(ctx, gs_csv_out: str):
+def export_generic_system(ctx, gs_csv_out: str, bp_names: tuple, workers: int):
     """
     Export generic systems to a CSV file
     """
-    from ck_apstra_api import get_generic_systems, CkApstraSession, prep_logging
+    from ck_apstra_api import get_generic_systems, prep_logging
     from result import Ok, Err
 
     logger = prep_logging('DEBUG', 'export_generic_system()')
 
-    host_ip = ctx.obj['HOST_IP']
-    host_port = ctx.obj['HOST_PORT']
-    host_user = ctx.obj['HOST_USER']
-    host_password = ctx.obj['HOST_PASSWORD']
-
-    # uncomment below for debugging purpose. It prints the username and password
-    # logger.info(f"{ctx.obj=}")
-
-    session = CkApstraSession(host_ip, host_port, host_user, host_password)
-    if session.last_error:
-        logger.error(f"Session error: {session.last_error}")
+    # reuse the session opened by cli()
+    session = cliVar.session
+    if session is None or session.last_error:
+        logger.error(f"Session error: {session and session.last_error}")
         return
     gs_csv_path = os.path.expanduser(gs_csv_out)
 
-    for res in get_generic_systems(session, gs_csv_path):
+    for res in get_generic_systems(session, gs_csv_path, list(bp_names) or None, workers):
         if isinstance(res, Ok):
             logger.info(res.ok_value)
         elif isinstance(res, Err):
@@ -5,6 +5,7 @@ import click
 from result import Err, Ok
 
 from . import cliVar, prep_logging
+from ck_apstra_api.connectivity_template import CtBuilder
 
 @click.command()
 # @click.option('--bp-name', type=str, envvar='BP_NAME', help='Blueprint name')
@@ -51,25 +52,20 @@ def add_single_vlan_cts(ctx, file_name: str):
     tagged_vlan_ids = data['tagged_vlan_ids']
     untagged_vlan_ids = data['untagged_vlan_ids']
 
+    # all the CTs are resolved and created in bulk
+    builder = CtBuilder(ck_bp)
     logger.info(f"tagged_vlan_ids to add {tagged_vlan_ids}")
-    for vlan_id in data['tagged_vlan_ids']:
-        istagged = True
+    for vlan_id in tagged_vlan_ids:
         ct_label = f"{tagged_ct_name_format.format(vlan_id=vlan_id)}"
         logger.info(f"tagged {vlan_id=}, name = {ct_label}")
-        for res in ck_bp.add_single_vlan_ct(vlan_id + vni_base, vlan_id, is_tagged=istagged, ct_label=ct_label):
-            if isinstance(res, Err):
-                logger.Err(f"{res.err_value}")
-            else:
-                logger.info(f"{res.ok_value}")
-    logger.info("")
+        builder.add_single_vlan(ct_label, vlan_id + vni_base, is_tagged=True)
     logger.info(f"untagged_vlan_ids to add {untagged_vlan_ids}")
-    for vlan_id in data['untagged_vlan_ids']:
-        is_tagged = False
+    for vlan_id in untagged_vlan_ids:
         ct_label = f"{untagged_ct_name_format.format(vlan_id=vlan_id)}"
-        logger.info(f"tagged {vlan_id=}, name = {ct_label}")
-        for res in ck_bp.add_single_vlan_ct(vlan_id + vni_base, vlan_id, is_tagged=is_tagged, ct_label=ct_label):
-            if isinstance(res, Err):
-                logger.Err(f"{res.err_value}")
-                break
-            else:
-                logger.info(f"{res.ok_value}")
+        logger.info(f"untagged {vlan_id=}, name = {ct_label}")
+        builder.add_single_vlan(ct_label, vlan_id + vni_base, is_tagged=False)
+    for res in builder.build():
+        if isinstance(res, Err):
+            logger.error(f"{res.err_value}")
+        else:
+            logger.info(f"{res.ok_value}")
@@ -1,7 +1,6 @@
 from dataclasses import dataclass, field, asdict
 from enum import StrEnum
-from functools import cache
-from typing import Dict, Generator, List, Optional
+from typing import Any, Dict, Generator, List, Optional
 import uuid
 
 from result import Err, Ok, Result
@@ -60,6 +59,29 @@ class PolicyIpLink:
         self.attributes = IpLinkAttributes(security_zone, interface_type, vlan_id, l3_mtu, ipv4_addressing_type, ipv6_addressing_type)
 
 
+@dataclass
+class SingleVlanAttributes:
+    vn_node_id: str
+    tag_type: str = 'vlan_tagged'
+
+
+@dataclass
+class PolicySingleVlan:
+    """
+    The Single VLAN Policy Object
+    """
+    id: str
+    attributes: SingleVlanAttributes
+    label: str = 'Virtual Network (Single)'
+    description: str = 'Add a single VLAN to interfaces'
+    policy_type_name: str = 'AttachSingleVLAN'
+    visible: bool = False
+
+    def __init__(self, vn_node_id: str, is_tagged: bool):
+        self.id = str(uuid.uuid4())
+        self.attributes = SingleVlanAttributes(vn_node_id, 'vlan_tagged' if is_tagged else 'untagged')
+
+
 @dataclass
 class PipelineAttributes:
     first_subpolicy: str
@@ -149,60 +171,169 @@ class CtIpLink:
     
         self.policies = [iplink, pipeline, batch]
 
-@cache
-def get_security_zone_id(blueprint: CkApstraBlueprint, security_zone_name: str) -> str:
+
+@dataclass
+class CtSingleVlan:
     """
-    Get the Security Zone ID from the name
+    The Single VLAN Connectivity Template
     """
-    security_zones = blueprint.get_item('security-zones')['items']
-    security_zone = [x['id'] for x in security_zones.values() if x['label'] == security_zone_name]
-    if security_zone:
-        return security_zone[0]
-    return None
+    policies: List[Dict]
 
+    def __init__(self, label: str, vn_node_id: str, is_tagged: bool, description: str = ''):
+        single_vlan = PolicySingleVlan(vn_node_id, is_tagged)
+        pipeline = PolicyPipeline(single_vlan.label, single_vlan)
+        batch = PolicyBatch(label, pipeline, single_vlan)
+        batch.description = description
 
+        self.policies = [batch, single_vlan, pipeline]
 
-@cache
-def get_blueprint(session: CkApstraSession, blueprint_name: str) -> CkApstraBlueprint:
+
+class CtBuilder:
     """
-    Get the Blueprint
+    Create many connectivity templates of a blueprint in bulk.
+    The present CT labels are resolved with one label=is_in query, the VNIs with one vn_id=is_in query,
+    and the policies of the missing CTs go out chunk_size CTs per obj-policy-import PUT.
+
+        builder = CtBuilder(bp)
+        builder.add_single_vlan('vn20', vni=200020, is_tagged=True)
+        for res in builder.build():
+            ...
     """
-    blueprint = CkApstraBlueprint(session, blueprint_name)
-    return blueprint
+
+    def __init__(self, blueprint: CkApstraBlueprint, chunk_size: int = 100, query_chunk_size: int = 500):
+        """
+        Args:
+            blueprint: The blueprint of the CTs
+            chunk_size: The number of CTs per obj-policy-import PUT
+            query_chunk_size: The number of labels or VNIs per query
+        """
+        self.blueprint = blueprint
+        self.chunk_size = chunk_size
+        self.query_chunk_size = query_chunk_size
+        self.log_prefix = f"CtBuilder({blueprint.label})"
+        self.single_vlans: Dict[str, dict] = {}  # { ct label: {'vni', 'is_tagged', 'description'} }
+        self.ip_links: Dict[str, dict] = {}  # { ct label: the arguments of CtIpLink }
+
+    def add_single_vlan(self, label: str, vni: int, is_tagged: bool, description: str = None):
+        """
+        Queue a single VLAN CT of the virtual network of vni
+        """
+        self.single_vlans[label] = {
+            'vni': vni,
+            'is_tagged': is_tagged,
+            'description': description or f"Single VLAN Connectivity Template for VNI {vni}",
+        }
+
+    def add_ip_link(self, label: str, security_zone_id: str, interface_type: str, vlan_id: int, l3_mtu: int,
+                    ipv4_addressing_type: str, ipv6_addressing_type: str):
+        """
+        Queue an IP Link CT
+        """
+        self.ip_links[label] = {
+            'security_zone': security_zone_id,
+            'interface_type': interface_type,
+            'vlan_id': vlan_id,
+            'l3_mtu': l3_mtu,
+            'ipv4_addressing_type': ipv4_addressing_type,
+            'ipv6_addressing_type': ipv6_addressing_type,
+        }
+
+    def _chunks(self, items: List[Any], size: int) -> List[List[Any]]:
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def present_labels(self, labels: List[str]) -> Result[set, str]:
+        """
+        The labels of the batch CTs present in the blueprint
+        """
+        present = set()
+        for label_chunk in self._chunks(labels, self.query_chunk_size):
+            ct_result = self.blueprint.query(f"node('ep_endpoint_policy', policy_type_name='batch', label=is_in({label_chunk}), name='ct')")
+            if isinstance(ct_result, Err):
+                return ct_result
+            present.update(x['ct']['label'] for x in ct_result.ok_value)
+        return Ok(present)
+
+    def vn_ids(self, vnis: List[int]) -> Result[Dict[str, str], str]:
+        """
+        { vni in str: virtual network node id } of the vnis present in the blueprint
+        """
+        vn_ids = {}
+        for vni_chunk in self._chunks([str(x) for x in dict.fromkeys(vnis)], self.query_chunk_size):
+            vn_result = self.blueprint.query(f"node('virtual_network', vn_id=is_in({vni_chunk}), name='vn')")
+            if isinstance(vn_result, Err):
+                return vn_result
+            vn_ids.update({str(x['vn']['vn_id']): x['vn']['id'] for x in vn_result.ok_value})
+        return Ok(vn_ids)
+
+    def build(self) -> Generator[Result[str, str], Any, Any]:
+        """
+        Create the CTs queued and absent from the blueprint
+        """
+        log_prefix = f"{self.log_prefix}::build()"
+        labels = list(self.single_vlans) + list(self.ip_links)
+        if not labels:
+            return
+        present_result = self.present_labels(labels)
+        if isinstance(present_result, Err):
+            yield Err(f"{log_prefix} Error: {present_result.err_value}")
+            return
+        present = present_result.ok_value
+        for label in labels:
+            if label in present:
+                yield Ok(f"{log_prefix} Skipping. CT {label} present")
+
+        cts = []  # [(label, policies)]
+        single_vlans = {k: v for k, v in self.single_vlans.items() if k not in present}
+        if single_vlans:
+            vn_ids_result = self.vn_ids([x['vni'] for x in single_vlans.values()])
+            if isinstance(vn_ids_result, Err):
+                yield Err(f"{log_prefix} Error: {vn_ids_result.err_value}")
+                return
+            vn_ids = vn_ids_result.ok_value
+            for label, x in single_vlans.items():
+                vn_id = vn_ids.get(str(x['vni']))
+                if vn_id is None:
+                    yield Err(f"{log_prefix} virtual network with vni={x['vni']} not found for {label}")
+                    continue
+                cts.append((label, asdict(CtSingleVlan(label, vn_id, x['is_tagged'], x['description']))['policies']))
+        for label, x in self.ip_links.items():
+            if label not in present:
+                cts.append((label, asdict(CtIpLink(label, **x))['policies']))
+
+        for ct_chunk in self._chunks(cts, self.chunk_size):
+            chunk_labels = [x[0] for x in ct_chunk]
+            result = self.blueprint.put_item('obj-policy-import', {'policies': [y for x in ct_chunk for y in x[1]]})
+            # it will be 204 with b''
+            if result.status_code is not None and result.status_code >= 300:
+                yield Err(f"{log_prefix} failed to create {chunk_labels}: {result.status_code=} {result.text=}")
+            else:
+                yield Ok(f"{log_prefix} {len(chunk_labels)} CTs created: {chunk_labels}")
+
 
 def import_ip_link_ct(session: CkApstraSession, ct_data: List[dict]) -> Generator[Result, None, None]:
     """
     Import the IP Link Connectivity Template
     """
     log_prefix = 'import_ct_ip_link()'
+    # one CtBuilder per blueprint
+    builders: Dict[str, CtBuilder] = {}
     for ct in ct_data:
         # get blueprint
-        blueprint = get_blueprint(session, ct[CtCsvKeys.BLUEPRINT])
+        blueprint = session.get_blueprint(ct[CtCsvKeys.BLUEPRINT])
         if blueprint is None:
             yield Err(f"{log_prefix} {ct[CtCsvKeys.BLUEPRINT]} not found")
             continue
-        # see if the connectivity template already exists
-        ct_name = ct[CtCsvKeys.CT_LABEL]
-        ct_query_result = blueprint.query(f"node('ep_endpoint_policy', policy_type_name='batch', label='{ct_name}', name='batch')")
-        if isinstance(ct_query_result, Err):
-            yield ct_query_result.err_value
-            continue
-        if ct_query_result.ok_value:
-            yield Err(f"{log_prefix} '{ct_name}' already exists. Skipping.")
-            continue
         # get security zone id
-        security_zone_id = get_security_zone_id(blueprint, ct[CtCsvKeys.SECURITY_ZONE])
+        security_zone_id = blueprint.get_security_zone_id(ct[CtCsvKeys.SECURITY_ZONE])
         if security_zone_id is None:
             yield Err(f"{log_prefix} {ct[CtCsvKeys.SECURITY_ZONE]} not found")
             continue
         ct['security_zone'] = security_zone_id
 
         yield Ok(f"{log_prefix} Creating with: {ct}")
-        ct_ip_link_spec = asdict(CtIpLink(ct[CtCsvKeys.CT_LABEL], security_zone_id, ct['interface_type'], int(ct[CtCsvKeys.VLAN_ID]), int(ct[CtCsvKeys.L3_MTU]), ct['ipv4_addressing_type'], ct['ipv6_addressing_type']))
-        yield f"{log_prefix} {ct_ip_link_spec=}"
-        result = blueprint.put_item("obj-policy-import", ct_ip_link_spec)
-        if result.status_code != 204:
-            yield Err(f"{log_prefix} {result.text=} {result.status_code=}")
-        else:
-            yield Ok(f"{log_prefix} {ct_name} created.")
+        if blueprint.label not in builders:
+            builders[blueprint.label] = CtBuilder(blueprint)
+        builders[blueprint.label].add_ip_link(ct[CtCsvKeys.CT_LABEL], security_zone_id, ct['interface_type'], int(ct[CtCsvKeys.VLAN_ID]), int(ct[CtCsvKeys.L3_MTU]), ct['ipv4_addressing_type'], ct['ipv6_addressing_type'])
 
+    for builder in builders.values():
+        yield from builder.build()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from typing import Dict, Tuple
+
+from result import Result, Ok, Err
+
+
+class DeviceProfileCatalog:
+    """
+    The device profiles of the controller, each loaded once, with the index of
+    (device_profile_id, if_name, speed) -> transformation_id
+    """
+
+    def __init__(self, session) -> None:
+        """
+        Args:
+            session: The CkApstraSession to load the device profiles from.
+        """
+        self.session = session
+        self.logger = logging.getLogger('DeviceProfileCatalog')
+        self._profiles: Dict[str, dict] = {}  # { device_profile_id: device_profile }
+        self._transformations: Dict[Tuple[str, str, str], int] = {}  # { (device_profile_id, if_name, speed): transformation_id }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def speed_key(speed: dict) -> str:
+        """
+        Return the speed of the device profile in the format of '10G'
+        """
+        return f"{speed['value']}{speed['unit']}".upper()
+
+    def _index(self, device_profile: dict) -> None:
+        device_profile_id = device_profile['id']
+        for port in device_profile.get('ports', []):
+            for transformation in port.get('transformations', []):
+                for intf in transformation['interfaces']:
+                    key = (device_profile_id, intf['name'], self.speed_key(intf['speed']))
+                    # the first transformation in the port order wins
+                    self._transformations.setdefault(key, transformation['transformation_id'])
+
+    def get(self, device_profile_id: str) -> Result[dict, str]:
+        """
+        Get the device profile, pulled from the controller on the first use.
+        """
+        if device_profile_id is None:
+            return Err(f"Error: {device_profile_id=}")
+        if device_profile_id in self._profiles:
+            return Ok(self._profiles[device_profile_id])
+        device_profile = self.session.get_items(f"device-profiles/{device_profile_id}")
+        if 'ports' not in device_profile:
+            return Err(f"Error: device profile {device_profile_id} not loaded: {device_profile}")
+        with self._lock:
+            if device_profile_id not in self._profiles:
+                self._index(device_profile)
+                self._profiles[device_profile_id] = device_profile
+        return Ok(self._profiles[device_profile_id])
+
+    def transformation_id(self, device_profile_id: str, intf_name: str, speed: str) -> Result[int, str]:
+        """
+        Get the transformation ID for the interface
+
+        Args:
+            device_profile_id: The device profile id
+            intf_name: The name of the interface
+            speed: The speed of the interface in the format of '10G'
+        """
+        device_profile_result = self.get(device_profile_id)
+        if isinstance(device_profile_result, Err):
+            return device_profile_result
+        transformation_id = self._transformations.get((device_profile_id, intf_name, speed.upper()))
+        if transformation_id is None:
+            return Err(f"transformation not found for {device_profile_id=} {intf_name=} {speed=}")
+        return Ok(transformation_id)
@@ -1,13 +1,21 @@
 
-from dataclasses import dataclass, fields, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, fields, field, asdict
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import tempfile
 import time
-from typing import Generator, List, Optional, Any, Dict, ClassVar
+from typing import Generator, Iterable, Iterator, List, Optional, Any, Dict, Tuple
 from collections import Counter
 from enum import StrEnum, auto
 
 from result import Result, Ok, Err
 
 from ck_apstra_api import CkApstraSession, CkApstraBlueprint, CkEnum
+from .import_journal import ImportJournal
 
 
 class GsCsvKeys(StrEnum):
@@ -36,6 +44,42 @@ class GsCsvKeys(StrEnum):
     COMMENT = auto()
 
 
+class PlanStage(StrEnum):
+    """The stages of the generic system import plan in the order of apply"""
+    CREATE_SYSTEM = auto()
+    FORM_LAG = auto()
+    RENAME_INTERFACES = auto()
+    REMOVE_CTS = auto()
+    ADD_CTS = auto()
+    FIX_TAGS = auto()
+    PATCH_SYSTEM = auto()
+
+
+# the stage of the import journal for each stage of the plan
+JOURNAL_STAGES = {
+    PlanStage.CREATE_SYSTEM: PlanStage.CREATE_SYSTEM,
+    PlanStage.FORM_LAG: PlanStage.FORM_LAG,
+    PlanStage.RENAME_INTERFACES: PlanStage.RENAME_INTERFACES,
+    PlanStage.REMOVE_CTS: PlanStage.ADD_CTS,
+    PlanStage.ADD_CTS: PlanStage.ADD_CTS,
+    PlanStage.FIX_TAGS: PlanStage.FIX_TAGS,
+    PlanStage.PATCH_SYSTEM: PlanStage.FIX_TAGS,
+}
+JOURNAL_DONE = 'done'  # all the stages of the generic system are done
+
+
+@dataclass
+class PlanOperation:
+    """
+    A change to be made by the generic system import. Serializable with asdict() for a dry run review.
+    The links are referred by 'switch:switch_ifname' since the ids of the links to be created are not known yet.
+    """
+    stage: PlanStage
+    blueprint: str
+    server: str
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+
 @dataclass
 class DataInit:
     """Build a data class with the given input dict."""
@@ -49,54 +93,71 @@ class DataInit:
                 setattr(self, key, value)
 
 
-@dataclass
-class LeafSwitch:
-    """The class to hold the switch data"""
-    switch_label: str
-    id: str = None
-    nodes: List[Dict[str, Any]] = field(default_factory=list)  # store the node data of the switch
-    interfaces: Optional[Dict[str, Any]] = field(default_factory=dict)  # store the interface data of the switch
-    bp: CkApstraBlueprint = None
-    log_prefix: str = None
-    # class variable to store the switch data
-    _switches: ClassVar[Dict[str, Any]] = {}  # Dict[switch name, LeafSwitch]
-    last_error: str = None
-
-    def __new__(cls, switch_label: str, bp: CkApstraBlueprint):        
-        if switch_label in cls._switches:
-            return cls._switches[switch_label]
-        else:
-            switch = super().__new__(cls)
-            cls._switches[switch_label] = switch
-            return switch
+class SwitchInterfaceIndex:
+    """
+    The switches of a blueprint with their ethernet interfaces, loaded with one query per chunk of switch labels.
+    One index per blueprint. The lookups are (switch label, if_name) -> interface id.
+    """
 
-    def __init__(self, switch_label: str, bp: CkApstraBlueprint):
-        self.log_prefix = f"LeafSwitch({switch_label})"
-        self.switch_label = switch_label
+    def __init__(self, bp: CkApstraBlueprint):
         self.bp = bp
-        
-        switch_interfaces_nodes_result = self.bp.get_switch_interface_nodes(self.switch_label)
-        if isinstance(switch_interfaces_nodes_result, Err):
-            self.last_error = switch_interfaces_nodes_result.err_value
-            return Err(f"Switch {self.switch_label} not found")
-        self.nodes = switch_interfaces_nodes_result.ok_value
-        
-        if self.nodes:
-            self.id = self.nodes[0][CkEnum.MEMBER_SWITCH]['id']
-            self.interfaces = {x[CkEnum.MEMBER_INTERFACE]['if_name']: x[CkEnum.MEMBER_INTERFACE] for x in self.nodes}
-        else:
-            leaf_switch_query = f"node('system', name='system', label='{self.switch_label}', role='leaf')"
-            switch_node_result = self.bp.query(leaf_switch_query)
-            if isinstance(switch_node_result, Err):
-                self.last_error = switch_node_result.err_value
-                return Err(f"Switch {self.switch_label} not found")
-            self.interfaces = []
-            if len(switch_node_result.ok_value):
-                self.id = switch_node_result.ok_value[0]['system']['id']
-    
-    def interface_id(self, if_name: str) -> str:
-        return self.interfaces.get(if_name, {}).get('id')
-    
+        self.log_prefix = f"SwitchInterfaceIndex({bp.label})"
+        self.switch_ids: Dict[str, Optional[str]] = {}  # { switch label: switch id or None if absent }
+        self.interfaces: Dict[tuple, str] = {}  # { (switch label, if_name): interface id }
+        self.failed_labels: set = set()  # the switch labels of the failed queries, not queried again by the lookups
+        self.last_error: str = None
+        self.logger = logging.getLogger(self.log_prefix)
+
+    def load(self, switch_labels: List[str], chunk_size: int = 500) -> Result[int, str]:
+        """
+        Load the switches not loaded yet.
+
+        Returns:
+            The number of the interfaces loaded
+        """
+        labels = [x for x in dict.fromkeys(switch_labels) if x and x not in self.switch_ids]
+        loaded = 0
+        for i in range(0, len(labels), chunk_size):
+            label_chunk = labels[i:i + chunk_size]
+            switch_query = f"""match(
+                node('system', system_type='switch', label=is_in({label_chunk}), name='{CkEnum.MEMBER_SWITCH}'),
+                optional(
+                    node(name='{CkEnum.MEMBER_SWITCH}')
+                        .out('hosted_interfaces').node('interface', if_type='ethernet', name='{CkEnum.MEMBER_INTERFACE}')
+                )
+            )"""
+            switch_result = self.bp.query(switch_query)
+            if isinstance(switch_result, Err):
+                self.last_error = switch_result.err_value
+                self.failed_labels.update(label_chunk)
+                return Err(f"{self.log_prefix} Error: {switch_result.err_value}")
+            for label in label_chunk:
+                self.switch_ids[label] = None
+                self.failed_labels.discard(label)
+            for item in switch_result.ok_value:
+                switch_label = item[CkEnum.MEMBER_SWITCH]['label']
+                self.switch_ids[switch_label] = item[CkEnum.MEMBER_SWITCH]['id']
+                if item[CkEnum.MEMBER_INTERFACE]:
+                    self.interfaces[(switch_label, item[CkEnum.MEMBER_INTERFACE]['if_name'])] = item[CkEnum.MEMBER_INTERFACE]['id']
+                    loaded += 1
+        return Ok(loaded)
+
+    def _load_one(self, switch_label: str) -> None:
+        # a lookup of a switch not loaded. The switch of a failed query is taken as absent
+        if switch_label in self.switch_ids or switch_label in self.failed_labels:
+            return
+        load_result = self.load([switch_label])
+        if isinstance(load_result, Err):
+            self.logger.error(f"{switch_label=} not loaded: {load_result.err_value}")
+
+    def switch_id(self, switch_label: str) -> Optional[str]:
+        self._load_one(switch_label)
+        return self.switch_ids.get(switch_label)
+
+    def interface_id(self, switch_label: str, if_name: str) -> Optional[str]:
+        self._load_one(switch_label)
+        return self.interfaces.get((switch_label, if_name))
+
 
 @dataclass
 class LinkMember(DataInit):
@@ -137,9 +198,15 @@ class LinkMember(DataInit):
         self.fetched_tags_link = []
 
 
-    def fetch_apstra(self, server_links: list, apstra_bp) -> Generator[Result[str, str], Any, Any]:
+    def fetch_apstra(self, server_links: list, apstra_bp, switch_index: SwitchInterfaceIndex = None, node_tags: Dict[str, List[str]] = None) -> Generator[Result[str, str], Any, Any]:
         """
-        Fetch the link member from the apstra controller.        
+        Fetch the link member from the apstra controller.
+
+        Args:
+            server_links: The items of get_server_interface_nodes() of the generic system
+            apstra_bp: The blueprint of the generic system
+            switch_index: The switch interfaces of the blueprint for the links not created yet
+            node_tags: The tags of the links by the link id (see CkApstraBlueprint.get_node_tags)
         """
         log_prefix = f"{self.log_prefix}::fetch_apstra()"
         self.bp = apstra_bp
@@ -158,16 +225,21 @@ class LinkMember(DataInit):
             self.fetched_server_intf_id = found[CkEnum.GENERIC_SYSTEM_INTERFACE]['id']
         else:
             # not found. Load data from switch links
-            switch = LeafSwitch(self.switch, self.bp)
-            self.fetched_switch_id = switch.id
-            self.fetched_switch_intf_id = switch.interface_id(self.switch_ifname)
+            switch_index = switch_index or SwitchInterfaceIndex(self.bp)
+            self.fetched_switch_id = switch_index.switch_id(self.switch)
+            self.fetched_switch_intf_id = switch_index.interface_id(self.switch, self.switch_ifname)
 
         # get the tags for the link
-        tags_result = self.bp.query(f"node(id='{self.fetched_link_id}').in_('tag').node('tag', name='tag')")
-        if isinstance(tags_result, Err):
-            yield Err(f"{log_prefix} Error: {tags_result.err_value}")
+        if not self.fetched_link_id:
+            self.fetched_tags_link = []
+        elif node_tags is not None and self.fetched_link_id in node_tags:
+            self.fetched_tags_link = node_tags[self.fetched_link_id]
         else:
-            self.fetched_tags_link = [tag['tag']['label'] for tag in tags_result.ok_value]
+            tags_result = self.bp.get_tags(self.fetched_link_id)
+            if isinstance(tags_result, Err):
+                yield Err(f"{log_prefix} Error: {tags_result.err_value}")
+            else:
+                self.fetched_tags_link = tags_result.ok_value
         # yield Ok(f"{log_prefix} Done")
 
     @property
@@ -275,7 +347,7 @@ class LinkGroup(DataInit):
         """
         self.members.append(LinkMember(data))
 
-    def fetch_apstra(self, server_links: list, apstra_bp) -> Generator[Result[str, str], Any, Any]:
+    def fetch_apstra(self, server_links: list, apstra_bp, switch_index: SwitchInterfaceIndex = None, node_tags: Dict[str, List[str]] = None) -> Generator[Result[str, str], Any, Any]:
         """
         Fetch the link group from the apstra controller.
         """
@@ -284,7 +356,7 @@ class LinkGroup(DataInit):
         # yield Ok(f"{log_prefix} begin")
         # interate over the members and see if they have group link associated
         for counter, member in enumerate(self.members):
-            for res in member.fetch_apstra(server_links, self.bp):
+            for res in member.fetch_apstra(server_links, self.bp, switch_index, node_tags):
                 yield res
             # member matched. Update the link group, only once
             if counter == 0:
@@ -316,6 +388,19 @@ class LinkGroup(DataInit):
             self.fetched_ct_names = [x['CT_NODE']['label'] for x in ct_result.ok_value]
         yield Ok(f"{log_prefix} Done fetching the link group data from Apstra {self}")
         
+    def lag_links(self) -> Result[Dict[str, dict], str]:
+        """
+        Return the links of the LAG to be formed: { link_id: {'group_label': ae, 'lag_mode': lag_mode} }
+        Empty when not for lag or the lag is already formed.
+        """
+        log_prefix = f"{self.log_prefix}::lag_links()"
+        if not self.lag_mode or self.fetched_ae_id:
+            return Ok({})
+        links = {x.fetched_link_id: {'group_label': self.ae, 'lag_mode': self.lag_mode} for x in self.members if x.fetched_link_id}
+        if not links:
+            return Err(f"{log_prefix} has no live links. Skipping")
+        return Ok(links)
+
     def form_lag(self):
         """
         Form the LAG for the link group
@@ -331,12 +416,13 @@ class LinkGroup(DataInit):
             yield Ok(f"{log_prefix} already lag {self.fetched_ae_id}. Skipping")
             return
 
+        lag_links_result = self.lag_links()
+        if isinstance(lag_links_result, Err):
+            yield lag_links_result
+            return
         lag_spec = {
-            'links': {x.fetched_link_id: {'group_label': self.ae, 'lag_mode': self.lag_mode} for x in self.members}
+            'links': lag_links_result.ok_value
         }
-        if len(lag_spec['links']) == 0:
-            yield Err(f"{log_prefix} has no live links. Skipping {lag_spec=}")
-            return
         # update LAG
         lag_updated = self.bp.patch_leaf_server_link_labels(lag_spec)
         if lag_updated:
@@ -352,20 +438,27 @@ class LinkGroup(DataInit):
         """
         data = []
         for member in self.members:
-            if isinstance(member.link_spec, Ok):
-                data.append(member.link_spec.ok_value)
+            member_link_spec = member.link_spec
+            if isinstance(member_link_spec, Ok):
+                data.append(member_link_spec.ok_value)
             # TODO: handle Err
             else:
-                yield Err(f"Error: {member.link_spec.err_value}")
+                yield Err(f"Error: {member_link_spec.err_value}")
         yield Ok(data)
     
     @property
     def speed_count(self) -> List[str]:
         return [x.speed for x in self.members]
 
+    def rename_links(self) -> List[dict]:
+        """
+        Return the cabling map entries of the links to be renamed
+        """
+        return [member.rename_spec for member in self.members if member.rename_spec]
+
     def rename_interfaces(self) -> Generator[Result[str, str], Any, Any]:
         log_prefix = f"{self.log_prefix}::rename_interfaces()"
-        rename_spec = {'links': [member.rename_spec for member in self.members if member.rename_spec]}
+        rename_spec = {'links': self.rename_links()}
         if rename_spec['links']:
             yield Ok(f"{log_prefix} about to rename: {self.ae=} {rename_spec=}")
             rename_updated = self.bp.patch_cable_map(rename_spec)
@@ -384,7 +477,9 @@ class LinkGroup(DataInit):
             if vn_name.lower() == 'na':
                 continue
             ct_id = self.bp.get_ct_ids(vn_name)
-            if ct_id:
+            if isinstance(ct_id, Err):
+                yield Err(f"{log_prefix} CT '{vn_name}' in blueprint {self.bp.label}: {ct_id.err_value}")
+            elif ct_id:
                 ct_ids.append(ct_id[0])
             else:
                 yield Err(f"{log_prefix} CT '{vn_name}' not found in blueprint {self.bp.label}")
@@ -397,10 +492,16 @@ class LinkGroup(DataInit):
         log_prefix = f"{self.log_prefix}::remove_vlans()"
         vlans_to_remove = [x for x in self.fetched_ct_names if x not in self.ct_names]
         yield Ok(f"{log_prefix} {self.ae=} {vlans_to_remove=}")
-        if vlans_to_remove:
+        ct_ids_to_remove = []
+        for res in self._get_ct_ids(vlans_to_remove):
+            if isinstance(res, Err):
+                yield res
+            else:
+                ct_ids_to_remove = res.ok_value
+        if ct_ids_to_remove:
             yield {
                 'id': self.fetched_ae_id,
-                'policies': [{'policy': self.bp.get_ct_ids(x)[0], 'used': False} for x in vlans_to_remove]
+                'policies': [{'policy': x, 'used': False} for x in ct_ids_to_remove]
             }
 
     def add_vlans(self) -> Generator[Result[dict, str], Any, Any]:
@@ -450,6 +551,7 @@ class GenericSystem(DataInit):
     tags_server: Optional[List[str]]
     # child
     link_groups: Optional[List[LinkGroup]] = field(default=None, repr=False)  # optional only during initial creation
+    link_groups_by_ae: Dict[str, LinkGroup] = field(default=None, repr=False)  # the link groups with ae for load_link_group()
     # fetched
     gs_id: Optional[str] = None # generic system node id to be fetched from the blueprint
     fetched_server_tags: Optional[List[str]] = None  # the fetched tags from the apstra controller
@@ -457,6 +559,7 @@ class GenericSystem(DataInit):
     fetched_deploy_mode: Optional[bool] = None  # the fetched deploy flag from the apstra controller
     bp: CkApstraBlueprint = field(default=None, repr=False)
     raw_input: Dict[str, Any] = field(default=None, repr=False)
+    input_digest: str = field(default='', repr=False)  # the digest of the input rows for the import journal
     log_prefix: str = field(default='', repr=False)
     
     # TODO: node('system', name='system', role='generic').in_('tag').node('tag', name='system_tag')
@@ -469,6 +572,7 @@ class GenericSystem(DataInit):
             self.tags_server = self.tags_server.split(',')
         self.log_prefix = f"GenericSystem({self.server})"
         self.link_groups = []
+        self.link_groups_by_ae = {}
         self.ext = True if self.ext == 'True' else False
         if self.deploy_mode:
             self.deploy_mode = self.deploy_mode.strip().lower() or None
@@ -477,25 +581,46 @@ class GenericSystem(DataInit):
         """
         Load the link group data from input dict into the generic system.
         """
+        row_json = json.dumps({k: v for k, v in data.items() if k != GsCsvKeys.LINE}, sort_keys=True)
+        self.input_digest = hashlib.sha256(f"{self.input_digest}{row_json}".encode()).hexdigest()
         if ae := data[GsCsvKeys.AE]:
-            the_link_groups = [x for x in self.link_groups if x.ae == ae]
-            if the_link_groups:
-                the_link_groups[0].load_link_member(data)
+            if ae in self.link_groups_by_ae:
+                self.link_groups_by_ae[ae].load_link_member(data)
                 return
         # new AE or non AE. Create it
-        self.link_groups.append(LinkGroup(data))
+        link_group = LinkGroup(data)
+        self.link_groups.append(link_group)
+        if ae:
+            self.link_groups_by_ae[ae] = link_group
 
-    def fetch_apstra(self, apstra_bp: CkApstraBlueprint) -> Generator[Result[str, str], Any, Any]:
+    def fetch_apstra(self, apstra_bp: CkApstraBlueprint, server_links: list = None, switch_index: SwitchInterfaceIndex = None, node_tags: Dict[str, List[str]] = None) -> Generator[Result[str, str], Any, Any]:
         """
         Fetch the generic system from the apstra controller.
+
+        Args:
+            apstra_bp: The blueprint of the generic system
+            server_links: The items of get_server_interface_nodes() for this generic system, when prefetched by the blueprint
+            switch_index: The switch interfaces of the blueprint, when prefetched by the blueprint
+            node_tags: The tags of the generic system and the links by the node id, when prefetched by the blueprint
         """
         log_prefix = f"{self.log_prefix}::fetch_apstra()"
         self.bp = apstra_bp
-        server_link_result = self.bp.get_server_interface_nodes(self.server)
-        server_links = server_link_result.ok_value
+        if server_links is None:
+            server_link_result = self.bp.get_server_interface_nodes(self.server)
+            if isinstance(server_link_result, Err):
+                yield Err(f"{log_prefix} Error: {server_link_result.err_value}")
+                return
+            server_links = server_link_result.ok_value
+        if node_tags is None:
+            node_ids = [x[CkEnum.GENERIC_SYSTEM]['id'] for x in server_links[:1]] + [x[CkEnum.LINK]['id'] for x in server_links]
+            node_tags_result = self.bp.get_node_tags(node_ids)
+            if isinstance(node_tags_result, Err):
+                yield Err(f"{log_prefix} Error: {node_tags_result.err_value}")
+                return
+            node_tags = node_tags_result.ok_value
         # yield Ok(f"{log_prefix} DEBUGGING LINKGROUPS: {self.link_groups}")
         for lg in self.link_groups:
-            for res in lg.fetch_apstra(server_links, self.bp):
+            for res in lg.fetch_apstra(server_links, self.bp, switch_index, node_tags):
                 lg_fetch_result = res
                 if isinstance(lg_fetch_result, Err):
                     yield Err(f"{log_prefix} {lg.ae=}, Error: {lg_fetch_result.err_value}")
@@ -504,35 +629,88 @@ class GenericSystem(DataInit):
         if len(server_links):
             # yield Ok(f"{log_prefix} present in blueprint {apstra_bp.label}")
             self.gs_id = server_links[0][CkEnum.GENERIC_SYSTEM]['id']
-            self.fetched_server_tags = server_links[0][CkEnum.GENERIC_SYSTEM]['tags']  # TODO: fix
             self.fetched_external_flag = server_links[0][CkEnum.GENERIC_SYSTEM]['external']
-            self.fetched_deploy_flag = server_links[0][CkEnum.GENERIC_SYSTEM]['deploy_mode']
-            #
-            tag_result = apstra_bp.query(f"node('system', name='system', label='{self.server}', role='generic').in_('tag').node('tag', name='system_tag')")
-            if isinstance(tag_result, Err):
-                yield Err(f"{log_prefix} Error: {tag_result.err_value}")
-            tags = tag_result.ok_value
-            self.fetched_server_tags = [tag['system_tag']['label'] for tag in tags]
-        # pull tags of the server
-        tags_result = apstra_bp.query(f"node(id='{self.gs_id}').in_('tag').node('tag', name='tag')")
-        if isinstance(tags_result, Err):
-            yield Err(f"{log_prefix} Error: {tags_result.err_value}")
-        else:
-             self.fetched_server_tags = [tag['tag']['label'] for tag in tags_result.ok_value]
-             yield Ok(f"{log_prefix} Done fetching the generic system tags from Apstra {self.fetched_server_tags=}")
+            self.fetched_deploy_mode = server_links[0][CkEnum.GENERIC_SYSTEM]['deploy_mode']
+        # tags of the server
+        self.fetched_server_tags = node_tags.get(self.gs_id, []) if self.gs_id else []
+        yield Ok(f"{log_prefix} Done fetching the generic system tags from Apstra {self.fetched_server_tags=}")
 
         yield f"{log_prefix} Done fetching the generic system data from Apstra {self}"
 
+    def journal_ids(self) -> Dict[str, Any]:
+        """
+        The ids learned for the generic system, for the import journal
+        """
+        return {
+            'gs_id': self.gs_id,
+            'ae_ids': {lg.ae: lg.fetched_ae_id for lg in self.link_groups if lg.fetched_ae_id},
+            'link_ids': {f"{m.switch}:{m.switch_ifname}": m.fetched_link_id for lg in self.link_groups for m in lg.members if m.fetched_link_id},
+        }
+
     @property
     def system_type(self):
         return 'external' if self.ext else 'server'
 
-    def create(self):
-        log_prefix = f"{self.log_prefix}::create()"
-        if self.gs_id:
-            yield Ok(f"{log_prefix} present. No need to create this. Skipping")
-            return
-        yield Ok(f"{log_prefix} Absent. Do need to create this")
+    def plan(self, blueprint: str) -> List[PlanOperation]:
+        """
+        Diff the input against the fetched data. See fetch_apstra()
+
+        Returns:
+            The operations to bring the generic system to the input
+        """
+        operations = []
+        is_new = self.gs_id is None
+        if is_new:
+            operations.append(PlanOperation(PlanStage.CREATE_SYSTEM, blueprint, self.server, {
+                'system_type': self.system_type,
+                'links': [f"{m.switch}:{m.switch_ifname}:{m.speed}" for lg in self.link_groups for m in lg.members],
+            }))
+        for lg in self.link_groups:
+            links = [f"{m.switch}:{m.switch_ifname}" for m in lg.members]
+            if lg.lag_mode and (is_new or not (lg.fetched_ae_id or lg.fetched_lag_mode)):
+                operations.append(PlanOperation(PlanStage.FORM_LAG, blueprint, self.server, {
+                    'ae': lg.ae, 'lag_mode': lg.lag_mode, 'links': links}))
+            # the links are created without the server interface names, so a new generic system is always renamed
+            # after the creation. The interfaces of an existing one are renamed if they differ
+            renames = {f"{m.switch}:{m.switch_ifname}": m.ifname for m in lg.members
+                       if m.ifname and (is_new or (m.fetched_server_ifname and m.fetched_server_ifname != m.ifname))}
+            if renames:
+                operations.append(PlanOperation(PlanStage.RENAME_INTERFACES, blueprint, self.server, {'ae': lg.ae, 'if_names': renames}))
+            cts_to_remove = [x for x in lg.fetched_ct_names if x not in lg.ct_names]
+            if cts_to_remove:
+                operations.append(PlanOperation(PlanStage.REMOVE_CTS, blueprint, self.server, {'ae': lg.ae, 'ct_names': cts_to_remove}))
+            cts_to_add = [x for x in lg.ct_names if x not in lg.fetched_ct_names and x.lower() != 'na']
+            if cts_to_add:
+                operations.append(PlanOperation(PlanStage.ADD_CTS, blueprint, self.server, {'ae': lg.ae, 'ct_names': cts_to_add}))
+            for m in lg.members:
+                fetched_tags = m.fetched_tags_link or []
+                tags_to_add = [x for x in m.tags_link if x not in fetched_tags]
+                tags_to_remove = [x for x in fetched_tags if x not in m.tags_link]
+                if tags_to_add or tags_to_remove:
+                    operations.append(PlanOperation(PlanStage.FIX_TAGS, blueprint, self.server, {
+                        'link': f"{m.switch}:{m.switch_ifname}", 'add': tags_to_add, 'remove': tags_to_remove}))
+        tags_server = self.tags_server or []
+        fetched_server_tags = self.fetched_server_tags or []
+        tags_to_add = [x for x in tags_server if x not in fetched_server_tags]
+        tags_to_remove = [x for x in fetched_server_tags if x not in tags_server]
+        if tags_to_add or tags_to_remove:
+            operations.append(PlanOperation(PlanStage.FIX_TAGS, blueprint, self.server, {'add': tags_to_add, 'remove': tags_to_remove}))
+        patch_spec = {}
+        if self.deploy_mode and self.deploy_mode != self.fetched_deploy_mode:
+            patch_spec['deploy_mode'] = self.deploy_mode
+        # the new one is created with the system type
+        if not is_new and self.ext != self.fetched_external_flag:
+            patch_spec['external'] = self.ext
+        if patch_spec:
+            operations.append(PlanOperation(PlanStage.PATCH_SYSTEM, blueprint, self.server, patch_spec))
+        return operations
+
+    def create_spec(self) -> Generator[Result[str, str], Any, Dict]:
+        """
+        Yield the errors of the links and return the switch-system-links spec of this generic system.
+            generic_system_spec = yield from generic_system.create_spec()
+        """
+        log_prefix = f"{self.log_prefix}::create_spec()"
         speed_count = []
         for lg in self.link_groups:
             sc = lg.speed_count
@@ -587,6 +765,19 @@ class GenericSystem(DataInit):
                     generic_system_spec['links'].extend(res.ok_value)
                 else:
                     yield Err(f"{log_prefix} Error: LinkGroup Error: {res.err_value}")
+        return generic_system_spec
+
+    def create(self):
+        log_prefix = f"{self.log_prefix}::create()"
+        if self.gs_id:
+            yield Ok(f"{log_prefix} present. No need to create this. Skipping")
+            return
+        yield Ok(f"{log_prefix} Absent. Do need to create this")
+        link_errors = []
+        generic_system_spec = yield from noting_errors(self.create_spec(), link_errors)
+        if link_errors:
+            yield Err(f"{log_prefix} not created for the {len(link_errors)} link errors")
+            return
         # creating the generic system
         yield Ok(f"{log_prefix} creating {generic_system_spec=}")
         generic_system_created_result = self.bp.add_generic_system(generic_system_spec)
@@ -616,31 +807,7 @@ class GenericSystem(DataInit):
         """
         Patch the vlans for the generic system
         """
-        log_prefix = f"{self.log_prefix}::patch_vlans()"
-        yield Ok(f"{log_prefix} {vlan_spec=}")
-        if len(vlan_spec['application_points']):
-            ct_assign_updated = self.bp.patch_obj_policy_batch_apply(vlan_spec, params={'async': 'full'})
-            task_id = ct_assign_updated['task_id']
-            # task may take time to complete
-            for i in range(10):
-                task_status = self.bp.get_item(f"tasks/{task_id}")
-                match task_status['status']:
-                    case 'succeeded':
-                        yield Ok(f"{log_prefix} done - {len(vlan_spec['application_points'])} vlans. {ct_assign_updated=}")
-                        return
-                    case 'init':
-                        yield Ok(f"{log_prefix} the task in init {task_id}")
-                        time.sleep(1)
-                        continue
-                    case 'in_progress':
-                        yield Ok(f"{log_prefix} the task in in_progress {task_id}")
-                        time.sleep(1)
-                        continue
-                    case 'failed':
-                        yield Err(f"{log_prefix} failed: {task_status['detailed_status']}")
-                        return
-                    case _:
-                        yield Err(f"{log_prefix} some other {task_id} to complete. {task_status}")
+        yield from patch_vlans(self.bp, vlan_spec, f"{self.log_prefix}::patch_vlans()")
 
     def add_vlans(self) -> Generator[Result[str, str], Any, Any]:
         """
@@ -687,13 +854,16 @@ class GenericSystem(DataInit):
             for res in lg.fix_tags():
                 yield res
         patch_spec = {}
-        if self.deploy_mode != self.fetched_deploy_mode:
+        # empty deploy_mode in the input leaves it as is
+        if self.deploy_mode and self.deploy_mode != self.fetched_deploy_mode:
             patch_spec['deploy_mode'] = self.deploy_mode
         if self.ext != self.fetched_external_flag:
             patch_spec['external'] = self.ext
         if patch_spec:
             patched = self.bp.patch_item(f"nodes/{self.gs_id}", patch_spec)
-            if patched.status_code == 202:
+            if patched.status_code is None:
+                yield Ok(f"{log_prefix} queued {patch_spec}")
+            elif patched.status_code == 202:
                 yield Ok(f"{log_prefix} patched {patch_spec} result: {patched}")
             else:
                 yield Err(f"{log_prefix} failed for {patch_spec} result: {patched.text}")
@@ -701,6 +871,41 @@ class GenericSystem(DataInit):
 
 
 
+def noting_errors(results: Generator, errors: List[Err]) -> Generator[Result[str, str], Any, Any]:
+    """
+    Yield the results, appending the errors to errors. Returns the return value of results.
+        value = yield from noting_errors(generator, errors)
+    """
+    while True:
+        try:
+            res = next(results)
+        except StopIteration as stop:
+            return stop.value
+        if isinstance(res, Err):
+            errors.append(res)
+        yield res
+
+
+def patch_vlans(bp: CkApstraBlueprint, vlan_spec: Dict, log_prefix: str) -> Generator[Result[str, str], Any, Any]:
+    """
+    Apply the obj-policy-batch-apply spec and wait for the task
+    """
+    yield Ok(f"{log_prefix} {vlan_spec=}")
+    if len(vlan_spec['application_points']):
+        ct_assign_updated = bp.patch_obj_policy_batch_apply(vlan_spec, params={'async': 'full'})
+        if not ct_assign_updated or 'task_id' not in ct_assign_updated:
+            yield Err(f"{log_prefix} failed: {ct_assign_updated=}")
+            return
+        task_id = ct_assign_updated['task_id']
+        # task may take time to complete
+        yield Ok(f"{log_prefix} waiting for the task {task_id}")
+        task_result = bp.task_tracker.wait([task_id])
+        if isinstance(task_result, Err):
+            yield Err(f"{log_prefix} failed: {task_result.err_value}")
+            return
+        yield Ok(f"{log_prefix} done - {len(vlan_spec['application_points'])} vlans. {ct_assign_updated=}")
+
+
 @dataclass
 class ServerBlueprint(DataInit):
     """
@@ -711,183 +916,655 @@ class ServerBlueprint(DataInit):
     servers: Dict[str, GenericSystem] = field(default_factory=dict, repr=False) # optional only during initial creation
     #fetched value
     ck_bp: CkApstraBlueprint = field(default=None, repr=False)  # the apstra blueprint to be used for fetching the data
-    _bps: ClassVar[Dict[str, 'ServerBlueprint']] = {}
+    switch_index: SwitchInterfaceIndex = field(default=None, repr=False)  # the switch interfaces of the blueprint
     log_prefix: str = field(default='', repr=False)
 
-    def __new__(cls, data: Dict[str, Any]):        
-        blueprint = data[GsCsvKeys.BLUEPRINT]
-        # logging.warning(f"ServerBlueprint::__new__ {data=}")
-        if blueprint in cls._bps:
-            return cls._bps[blueprint]
-        else:
-            bp = super().__new__(cls)
-            bp.blueprint = blueprint
-            cls._bps[blueprint] = bp
-            return bp
-
     def __init__(self, data: Dict[str, Any]):
         """
-        Initialize the server blueprint with the given input data.
+        Initialize the server blueprint with the given input data. See load_generic_system() for the rows.
         """
+        super().__init__(data)
+        self.servers = {}
         self.log_prefix = f"ServerBlueprint({self.blueprint})"
-        if not hasattr(self, 'servers'):
-            super().__init__(data)
-            self.servers = {}
-        server_label = data[GsCsvKeys.SERVER]        
-        # logging.warning(f"ServerBlueprint::init processing GS {server_label=}")
+
+    def load_generic_system(self, data: Dict[str, Any]):
+        """
+        Load a row of the input into its generic system
+        """
+        server_label = data[GsCsvKeys.SERVER]
         if server_label not in self.servers:
             self.servers[server_label] = GenericSystem(data)
         this_server = self.servers[server_label]
         this_server.load_link_group(data)
 
-    @classmethod
-    def iterate_server_blueprints(cls):
-        for k, v in cls._bps.items():
-            yield k, v
-
     def interate_generic_systems(self):
         for k, v in self.servers.items():
             yield k, v
 
-    def fetch_apstra(self, apstra_session: CkApstraSession) -> Result[str, str]:
+    def fetch_apstra(self, apstra_session: CkApstraSession, workers: int = 1, server_labels: List[str] = None) -> Result[str, str]:
         """
         Fetch the apstra blueprint from the server.
+
+        Args:
+            apstra_session: The apstra session
+            workers: The number of generic systems to fetch concurrently. The messages are in the input order regardless.
+            server_labels: The generic systems to fetch. All of them if None.
         """
         log_prefix = f"{self.log_prefix}::fetch_apstra()"
-        yield Ok(f"{self.log_prefix} {self.blueprint=}")
-        self.ck_bp = CkApstraBlueprint(apstra_session, self.blueprint)
+        yield Ok(f"{self.log_prefix} {self.blueprint=} {server_labels=}")
+        if self.ck_bp is None or self.ck_bp.session is not apstra_session:
+            self.ck_bp = CkApstraBlueprint(apstra_session, self.blueprint)
+            self.switch_index = None
         if self.ck_bp.id is None:
             yield Err(f"{log_prefix} Error: BP {self.blueprint=} - id not found")
-        for server_label, generic_system in self.servers.items():
-            for res in generic_system.fetch_apstra(self.ck_bp):
-                yield res
+            return
+        servers = self.servers if server_labels is None else {x: self.servers[x] for x in server_labels}
+        # the interface nodes of all the generic systems with one query per chunk of labels
+        server_index_result = self.ck_bp.get_server_interface_index(list(servers))
+        if isinstance(server_index_result, Err):
+            yield Err(f"{log_prefix} Error: {server_index_result.err_value}")
+            return
+        server_index = server_index_result.ok_value
+        # the tags of all the generic systems and their links with one query per chunk of node ids
+        node_ids = []
+        for server_links in server_index.values():
+            node_ids.extend(x[CkEnum.GENERIC_SYSTEM]['id'] for x in server_links[:1])
+            node_ids.extend(x[CkEnum.LINK]['id'] for x in server_links)
+        node_tags_result = self.ck_bp.get_node_tags(node_ids)
+        if isinstance(node_tags_result, Err):
+            yield Err(f"{log_prefix} Error: {node_tags_result.err_value}")
+            return
+        node_tags = node_tags_result.ok_value
+        # the switches in the input with their interfaces, for the links to be created
+        if self.switch_index is None:
+            self.switch_index = SwitchInterfaceIndex(self.ck_bp)
+        switch_labels = [m.switch for gs in servers.values() for lg in gs.link_groups for m in lg.members]
+        switch_index_result = self.switch_index.load(switch_labels)
+        if isinstance(switch_index_result, Err):
+            yield Err(f"{log_prefix} Error: {switch_index_result.err_value}")
+            return
+
+        def fetch_generic_system(generic_system: GenericSystem):
+            return generic_system.fetch_apstra(self.ck_bp, server_index.get(generic_system.server, []), self.switch_index, node_tags)
 
-    def add_generic_systems(self):
+        if workers > 1:
+            # the fetches are read only. Each thread collects the messages of one generic system
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ck-gs-fetch') as executor:
+                for messages in executor.map(lambda x: list(fetch_generic_system(x)), servers.values()):
+                    yield from messages
+        else:
+            for generic_system in servers.values():
+                yield from fetch_generic_system(generic_system)
+
+    def plan(self) -> List[PlanOperation]:
         """
-        Add the generic system to the apstra server.
+        Diff the input against the fetched data of all the generic systems. See fetch_apstra()
         """
-        for generic_system in self.servers.values():
-            for res in generic_system.create():
-                yield res
+        return [op for generic_system in self.servers.values() for op in generic_system.plan(self.blueprint)]
 
-    def form_lag(self):
+    def wait_for_lags(self, apstra_session: CkApstraSession, server_labels: List[str], workers: int = 1,
+                      timeout: float = 30.0) -> Generator[Result[str, str], Any, Any]:
         """
-        Form the LAG for the generic system
+        Refetch the generic systems until the LAGs of the input show up in the blueprint, or timeout
         """
-        for generic_system in self.servers.values():
-            for res in generic_system.form_lag():
-                yield res
-    
-    def rename_interfaces(self):
+        log_prefix = f"{self.log_prefix}::wait_for_lags()"
+        deadline = time.monotonic() + timeout
+        delay = 0.5
+        while True:
+            if self.ck_bp is not None:
+                # each round reads the blueprint again instead of the query cache entries of the previous round
+                self.ck_bp.invalidate_caches()
+            for res in self.fetch_apstra(apstra_session, workers, server_labels):
+                if isinstance(res, Err):
+                    yield res
+            pending = [f"{x}:{lg.ae}" for x in server_labels for lg in self.servers[x].link_groups
+                       if lg.lag_mode and not (lg.fetched_ae_id or lg.fetched_lag_mode)]
+            if not pending:
+                yield Ok(f"{log_prefix} LAGs present for {len(server_labels)} generic systems")
+                return
+            if time.monotonic() + delay > deadline:
+                yield Err(f"{log_prefix} LAGs not present after {timeout} seconds: {pending}")
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+    def apply(self, plan: List[PlanOperation], apstra_session: CkApstraSession, workers: int = 1,
+              journal: ImportJournal = None) -> Generator[Result[str, str], Any, Any]:
         """
-        Rename the interfaces for the generic system
+        Apply the plan of this blueprint. See plan()
+        Only the generic systems created, or with the LAGs formed, are fetched again.
+
+        Args:
+            journal: Record the stages done per generic system, and skip the operations of the stages recorded
         """
-        for generic_system in self.servers.values():
-            for res in generic_system.rename_interfaces():
-                yield res
+        log_prefix = f"{self.log_prefix}::apply()"
+        operations = [x for x in plan if x.blueprint == self.blueprint]
+        if journal:
+            skipped = [x for x in operations if journal.done(self.blueprint, x.server, JOURNAL_STAGES[x.stage], self.servers[x.server].input_digest)]
+            if skipped:
+                yield Ok(f"{log_prefix} {len(skipped)} operations done in the journal")
+                operations = [x for x in operations if x not in skipped]
+        failed_servers = set()
+
+        def servers_of(*stages: PlanStage) -> List[str]:
+            # the later stages are not run for the generic systems failed in an earlier stage
+            servers = list(dict.fromkeys(x.server for x in operations if x.stage in stages))
+            return [x for x in servers if x not in failed_servers]
+
+        def journaled(stage: PlanStage, server_labels: List[str], results: Generator) -> Generator[Result[str, str], Any, Any]:
+            # the writes of a stage are blueprint wide. An error fails the stage for all the generic systems in it,
+            # unless the stage returns the generic systems failed
+            errors = []
+            stage_failed = yield from noting_errors(results, errors)
+            if stage_failed is None:
+                stage_failed = set(server_labels) if errors else set()
+            failed_servers.update(stage_failed)
+            if journal:
+                for server_label in server_labels:
+                    if server_label in stage_failed:
+                        continue
+                    generic_system = self.servers[server_label]
+                    journal.record(self.blueprint, server_label, stage, generic_system.input_digest, generic_system.journal_ids())
+
+        def create_and_fetch(created: List[str]) -> Generator[Result[str, str], Any, set]:
+            failed = yield from self.add_generic_systems(created)
+            fetched = [x for x in created if x not in failed]
+            fetch_errors = []
+            yield from noting_errors(self.fetch_apstra(apstra_session, workers, fetched), fetch_errors)
+            yield Ok(f"{log_prefix} Done fetching {len(fetched)} generic systems created")
+            # a failed fetch leaves the generic systems without the ids for the later stages
+            return set(created) if fetch_errors else failed
+
+        created = servers_of(PlanStage.CREATE_SYSTEM)
+        if created:
+            yield from journaled(PlanStage.CREATE_SYSTEM, created, create_and_fetch(created))
+
+        def form_lag_and_wait(lag_servers: List[str]) -> Generator[Result[str, str], Any, Any]:
+            lag_groups = [(x.server, x.detail['ae']) for x in operations if x.stage == PlanStage.FORM_LAG and x.server in lag_servers]
+            yield from self.form_lag([lg for server_label, ae in lag_groups for lg in self.servers[server_label].link_groups if lg.ae == ae])
+            # form_lag may need some time to catch up
+            yield from self.wait_for_lags(apstra_session, lag_servers, workers)
+
+        lag_servers = servers_of(PlanStage.FORM_LAG)
+        if lag_servers:
+            yield from journaled(PlanStage.FORM_LAG, lag_servers, form_lag_and_wait(lag_servers))
+
+        rename_servers = servers_of(PlanStage.RENAME_INTERFACES)
+        if rename_servers:
+            yield from journaled(PlanStage.RENAME_INTERFACES, rename_servers, self.rename_interfaces(rename_servers))
+
+        ct_servers = servers_of(PlanStage.REMOVE_CTS, PlanStage.ADD_CTS)
+        if ct_servers:
+            yield from journaled(PlanStage.ADD_CTS, ct_servers, self.add_vlans(ct_servers))
+
+        def fix_tags(tag_servers: List[str]) -> Generator[Result[str, str], Any, Any]:
+            with self.ck_bp.write_batch() as batch:
+                for server_label in tag_servers:
+                    yield from self.servers[server_label].fix_tags()
+            for operation in batch.failed:
+                yield Err(f"{log_prefix} failed {operation} {operation.payload=}: {operation.text}")
+
+        tag_servers = servers_of(PlanStage.FIX_TAGS, PlanStage.PATCH_SYSTEM)
+        if tag_servers:
+            yield from journaled(PlanStage.FIX_TAGS, tag_servers, fix_tags(tag_servers))
+
+        if journal:
+            # nothing left for these generic systems. The next resume does not fetch them
+            for server_label, generic_system in self.servers.items():
+                if server_label not in failed_servers:
+                    journal.record(self.blueprint, server_label, JOURNAL_DONE, generic_system.input_digest, generic_system.journal_ids())
+        yield Ok(f"{log_prefix} Done {len(operations)} operations")
+
+    def add_generic_systems(self, server_labels: List[str] = None, chunk_size: int = 50) -> Generator[Result[str, str], Any, set]:
+        """
+        Add the absent generic systems, all of them by default, chunk_size generic systems per switch-system-links request.
+        The existence is checked with one query per chunk of labels. The generic systems of a failed chunk are created one by one.
+        A generic system with an error in its links is not created.
 
-    def add_vlans(self):
+        Returns:
+            The labels of the generic systems failed
+                failed = yield from server_blueprint.add_generic_systems()
         """
-        Add the vlans to the generic system
+        log_prefix = f"{self.log_prefix}::add_generic_systems()"
+        generic_systems = [x for x in self._selected(server_labels) if not x.gs_id]
+        if not generic_systems:
+            return set()
+        present_result = self.ck_bp.get_system_labels([x.server for x in generic_systems])
+        if isinstance(present_result, Err):
+            yield Err(f"{log_prefix} Error: {present_result.err_value}")
+            return {x.server for x in generic_systems}
+        present = present_result.ok_value
+        failed = set()
+        absent = []
+        for generic_system in generic_systems:
+            if generic_system.server in present:
+                yield Ok(f"{generic_system.log_prefix}::create() present. No need to create this. Skipping")
+            else:
+                absent.append(generic_system)
+
+        for absent_chunk in [absent[i:i + chunk_size] for i in range(0, len(absent), chunk_size)]:
+            generic_system_spec = {
+                'links': [],
+                'new_systems': [],
+            }
+            chunk = []
+            for generic_system in absent_chunk:
+                link_errors = []
+                system_spec = yield from noting_errors(generic_system.create_spec(), link_errors)
+                if link_errors:
+                    # not to be created with missing links
+                    failed.add(generic_system.server)
+                    continue
+                for link in system_spec['links']:
+                    link['system']['new_system_index'] = len(chunk)
+                generic_system_spec['links'].extend(system_spec['links'])
+                generic_system_spec['new_systems'].extend(system_spec['new_systems'])
+                chunk.append(generic_system)
+            if not chunk:
+                continue
+            labels = [x.server for x in chunk]
+            created_result = self.ck_bp.add_generic_systems(generic_system_spec)
+            if isinstance(created_result, Ok):
+                yield Ok(f"{log_prefix} created {len(chunk)} generic systems: {labels}")
+                continue
+            if len(chunk) == 1:
+                yield Err(f"{log_prefix} failed to create {labels}: {created_result.err_value}")
+                failed.update(labels)
+                continue
+            # isolate the failing generic systems. Only their errors are reported as errors
+            yield Ok(f"{log_prefix} Warning: creating one by one. Failed to create {labels}: {created_result.err_value}")
+            for generic_system in chunk:
+                create_errors = []
+                yield from noting_errors(generic_system.create(), create_errors)
+                if create_errors:
+                    failed.add(generic_system.server)
+        return failed
+
+    def _selected(self, server_labels: List[str] = None) -> List[GenericSystem]:
+        if server_labels is None:
+            return list(self.servers.values())
+        return [self.servers[x] for x in server_labels]
+
+    def form_lag(self, link_groups: List[LinkGroup] = None):
         """
-        for generic_system in self.servers.values():
-            for res in generic_system.add_vlans():
-                yield res
+        Form the LAGs of the link groups, all of them by default, with one leaf-server-link-labels patch
+        """
+        log_prefix = f"{self.log_prefix}::form_lag()"
+        if link_groups is None:
+            link_groups = [lg for gs in self.servers.values() for lg in gs.link_groups]
+        lag_spec = {'links': {}}
+        for lg in link_groups:
+            lag_links_result = lg.lag_links()
+            if isinstance(lag_links_result, Err):
+                yield lag_links_result
+                continue
+            lag_spec['links'].update(lag_links_result.ok_value)
+        if not lag_spec['links']:
+            yield Ok(f"{log_prefix} no LAG to form")
+            return
+        lag_updated = self.ck_bp.patch_leaf_server_link_labels(lag_spec)
+        if lag_updated:
+            # It is expected to be None
+            yield Err(f"{log_prefix} Unexpected return: LAG updated in blueprint {self.blueprint}: {lag_updated}")
+        else:
+            yield Ok(f"{log_prefix} done {len(lag_spec['links'])} links")
+
+    def rename_interfaces(self, server_labels: List[str] = None):
+        """
+        Rename the interfaces of the generic systems, all of them by default, with one cabling-map patch
+        """
+        log_prefix = f"{self.log_prefix}::rename_interfaces()"
+        rename_spec = {'links': [x for gs in self._selected(server_labels) for lg in gs.link_groups for x in lg.rename_links()]}
+        if not rename_spec['links']:
+            return
+        yield Ok(f"{log_prefix} about to rename {len(rename_spec['links'])} links: {rename_spec=}")
+        rename_updated = self.ck_bp.patch_cable_map(rename_spec)
+        if isinstance(rename_updated, Err):
+            yield Err(f"{log_prefix} Error in blueprint {self.blueprint}: {rename_updated.err_value}")
+        else:
+            yield Ok(f"{log_prefix} rename done")
+
+    def add_vlans(self, server_labels: List[str] = None):
+        """
+        Remove then add the vlans of the generic systems, all of them by default, with one obj-policy-batch-apply each
+        """
+        log_prefix = f"{self.log_prefix}::add_vlans()"
+        generic_systems = self._selected(server_labels)
+        remove_spec = {
+            'application_points': []
+        }
+        for generic_system in generic_systems:
+            for lg in generic_system.link_groups:
+                for x in lg.remove_vlans():
+                    if isinstance(x, dict):
+                        remove_spec['application_points'].append(x)
+                    else:
+                        yield x
+        yield from patch_vlans(self.ck_bp, remove_spec, f"{log_prefix} remove")
+
+        add_spec = {
+            'application_points': []
+        }
+        for generic_system in generic_systems:
+            for lg in generic_system.link_groups:
+                for x in lg.add_vlans():
+                    if isinstance(x, dict):
+                        add_spec['application_points'].append(x)
+                    else:
+                        yield x
+        yield from patch_vlans(self.ck_bp, add_spec, f"{log_prefix} add")
 
     def fix_tags(self):
         """
         Fix the tags for the generic system, link group, and the link
         """
         log_prefix = f"{self.log_prefix}::fix_tags()"
-        for generic_system in self.servers.values():
-            yield Ok(f"{log_prefix} of generic system {generic_system.server}")
-            for res in generic_system.fix_tags():
+        # the tagging and the node patches go out in /batch requests
+        with self.ck_bp.write_batch() as batch:
+            for generic_system in self.servers.values():
+                yield Ok(f"{log_prefix} of generic system {generic_system.server}")
+                for res in generic_system.fix_tags():
+                    yield res
+        for operation in batch.failed:
+            yield Err(f"{log_prefix} failed {operation} {operation.payload=}: {operation.text}")
+        yield Ok(f"{log_prefix} {batch.stats=}")
+
+
+def _generic_system_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    return (row[GsCsvKeys.BLUEPRINT], row[GsCsvKeys.SERVER])
+
+
+def _spill_run(run: List[tuple]):
+    """
+    Write a sorted run of (key, sequence, row) to a temporary file, one json per line
+    """
+    spill_file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+    for key, sequence, row in run:
+        spill_file.write(json.dumps([key, sequence, row]) + '\n')
+    spill_file.seek(0)
+    return spill_file
+
+
+def _read_run(spill_file) -> Iterator[tuple]:
+    for line in spill_file:
+        key, sequence, row = json.loads(line)
+        yield tuple(key), sequence, row
+
+
+def sort_generic_system_rows(generic_system_rows: Iterable[Dict[str, Any]], run_size: int = 100000) -> Iterator[Dict[str, Any]]:
+    """
+    Sort the rows by (blueprint, server), keeping the input order within a generic system.
+    Up to run_size rows are sorted in memory. Beyond that, the sorted runs are spilled to temporary files and merged.
+    """
+    runs = []
+    run = []
+    for sequence, row in enumerate(generic_system_rows):
+        run.append((_generic_system_key(row), sequence, row))
+        if len(run) >= run_size:
+            run.sort(key=lambda x: x[:2])
+            runs.append(_spill_run(run))
+            run = []
+    run.sort(key=lambda x: x[:2])
+    if not runs:
+        for _, _, row in run:
+            yield row
+        return
+    if run:
+        runs.append(_spill_run(run))
+    try:
+        for _, _, row in heapq.merge(*[_read_run(x) for x in runs], key=lambda x: x[:2]):
+            yield row
+    finally:
+        for spill_file in runs:
+            spill_file.close()
+
+
+def chunk_generic_system_rows(generic_system_rows: Iterable[Dict[str, Any]], chunk_size: int,
+                              presorted: bool = False, run_size: int = 100000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Group the rows by (blueprint, server) into chunks of up to chunk_size generic systems.
+    The rows of a generic system are always in the same chunk.
+
+    Args:
+        generic_system_rows: The rows with GsCsvKeys. Read once.
+        chunk_size: The number of generic systems per chunk.
+        presorted: The rows of a generic system are already together. Otherwise, see sort_generic_system_rows()
+        run_size: The number of rows to sort in memory
+    """
+    rows = generic_system_rows if presorted else sort_generic_system_rows(generic_system_rows, run_size)
+    chunk = []
+    seen = set()
+    for row in rows:
+        key = _generic_system_key(row)
+        if key not in seen:
+            if len(seen) >= chunk_size:
+                yield chunk
+                chunk = []
+                seen = set()
+            seen.add(key)
+        chunk.append(row)
+    if chunk:
+        yield chunk
+
+
+class GenericSystemImport:
+    """
+    An import of generic systems. It owns the session and the server blueprints, with their blueprint objects
+    and switch indexes, so the imports do not share any state and can run in parallel threads.
+
+        generic_system_import = GenericSystemImport(apstra_session, workers=16)
+        for res in generic_system_import.run(rows, chunk_size=1000):
+            ...
+    """
+
+    def __init__(self, apstra_session: CkApstraSession, workers: int = 1, dry_run: bool = False, journal: ImportJournal = None):
+        """
+        Args:
+            apstra_session: The apstra session
+            workers: The number of generic systems to fetch concurrently from the apstra server
+            dry_run: Yield the plan (json of PlanOperation) without applying it
+            journal: Record the stages done, and skip the generic systems and the stages already done in it
+        """
+        self.session = apstra_session
+        self.workers = workers
+        self.dry_run = dry_run
+        self.journal = journal
+        self.server_blueprints: Dict[str, ServerBlueprint] = {}  # { blueprint label: ServerBlueprint }
+        self.log_prefix = "::add_generic_systems()"
+
+    def load(self, generic_system_rows: Iterable[Dict[str, Any]]):
+        """
+        Build the server blueprints, the generic systems and the links of the rows
+        """
+        for row in generic_system_rows:
+            blueprint = row[GsCsvKeys.BLUEPRINT]
+            if blueprint not in self.server_blueprints:
+                self.server_blueprints[blueprint] = ServerBlueprint(row)
+            self.server_blueprints[blueprint].load_generic_system(row)
+
+    def run(self, generic_system_rows: Iterable[Dict[str, Any]], chunk_size: int = None, presorted: bool = False) -> Generator[Result[str, str], Any, Any]:
+        """
+        Import the rows. See add_generic_systems()
+        """
+        if chunk_size is None:
+            yield from self.run_chunk(generic_system_rows)
+            return
+        for index, chunk in enumerate(chunk_generic_system_rows(generic_system_rows, chunk_size, presorted)):
+            yield Ok(f"{self.log_prefix} chunk {index} of {len(chunk)} links")
+            yield from self.run_chunk(chunk)
+            # the blueprints, with their sessions and switch indexes, are kept for the next chunk
+            for sbp in self.server_blueprints.values():
+                sbp.servers = {}
+
+    def run_chunk(self, generic_system_rows: Iterable[Dict[str, Any]]) -> Generator[Result[str, str], Any, Any]:
+        """
+        Fetch, plan and apply the generic systems of the rows
+        """
+        log_prefix = self.log_prefix
+        # yield Ok(f"{log_prefix} begin with {generic_system_rows=}")
+
+        # build data classes for the server blueprints, the generic systems and the links
+        self.load(generic_system_rows)
+        if self.journal:
+            # the generic systems done in an earlier run with the same input are not fetched
+            for bp_label, sbp in self.server_blueprints.items():
+                done = [k for k, v in sbp.servers.items() if self.journal.done(bp_label, k, JOURNAL_DONE, v.input_digest)]
+                for server_label in done:
+                    del sbp.servers[server_label]
+                if done:
+                    yield Ok(f"{log_prefix} {len(done)} generic systems of blueprint {bp_label} done in the journal. Skipping")
+        # the blueprints of the earlier chunks are kept without their generic systems
+        server_blueprints = {k: v for k, v in self.server_blueprints.items() if v.servers}
+        blueprints_string = f"blueprints {list(server_blueprints.keys())}"
+        yield Ok(f"{log_prefix} Begin adding generic system by pulling blueprint data from input data - {blueprints_string}")
+
+        for bp_label, sbp in server_blueprints.items():
+            for gs, gs_data in sbp.servers.items():
+                yield Ok(f"{log_prefix} candidate generic system {gs}: {gs_data.raw_input}")
+
+        if self.workers > 1:
+            self.session.set_pool_size(self.workers)
+
+        # fetch the blueprints from the apstra server once and plan the changes
+        plan = []
+        for bp_label, sbp in server_blueprints.items():
+            for res in sbp.fetch_apstra(self.session, self.workers):
                 yield res
+            yield Ok(f"{log_prefix} Done fetching data from Apstra of blueprint {bp_label}")
+            plan.extend(sbp.plan())
+
+        for operation in plan:
+            yield Ok(f"{log_prefix} plan: {json.dumps(asdict(operation))}")
+        yield Ok(f"{log_prefix} {len(plan)} operations planned for {blueprints_string}")
+        if self.dry_run:
+            return
 
+        for bp_label, sbp in server_blueprints.items():
+            for res in sbp.apply(plan, self.session, self.workers, self.journal):
+                yield res
+            yield Ok(f"{log_prefix} Done applying the plan of blueprint {bp_label}")
 
-def add_generic_systems(apstra_session: CkApstraSession, generic_system_rows: list) -> Generator[Result[str, str], Any, Any]:
+        yield Ok(f"{log_prefix} Done adding generic systems for {blueprints_string}")
+
+
+def add_generic_systems(apstra_session: CkApstraSession, generic_system_rows: Iterable[Dict[str, Any]], workers: int = 1, dry_run: bool = False,
+                        chunk_size: int = None, presorted: bool = False, journal: ImportJournal = None) -> Generator[Result[str, str], Any, Any]:
     """
-    Add generic systems to the apstra server.
+    Add generic systems to the apstra server. Each call is a new GenericSystemImport.
 
     Parameters
     ----------
     apstra_session : CkApstraSession
         The apstra session object.
 
-    generic_system_rows : list
-        The each list represents a link in the generic system. They keys are GsCsvKeys.
+    generic_system_rows : Iterable
+        The each row represents a link in the generic system. They keys are GsCsvKeys.
 
-    """
-    log_prefix = "::add_generic_systems()"
-    # yield Ok(f"{log_prefix} begin with {generic_system_rows=}")
-
-    # build data classes for the server blueprints, the generic systems and the links
-    for row in generic_system_rows:
-        _ = ServerBlueprint(row)
-    blueprints_string = f"blueprints {list(ServerBlueprint._bps.keys())}"
-    yield Ok(f"{log_prefix} Begin adding generic system by pulling blueprint data from input data - {blueprints_string}")
-
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for gs, gs_data in sbp.servers.items():
-            yield Ok(f"{log_prefix} candidate generic system {gs}: {gs_data.raw_input}")
-
-    # fetch the blueprints from the apstra server and store them in the data classes
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        # yield Ok(f"{log_prefix} fetching {bp_label=} {sbp=}")
-        for res in sbp.fetch_apstra(apstra_session):
-            yield res
-        yield Ok(f"{log_prefix} Done fetching data from Apstra of blueprint {bp_label}")
+    workers : int
+        The number of generic systems to fetch concurrently from the apstra server.
 
-    # create the generic systems and the links
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        # yield Ok(f"{func_name} fetching {bp_label=} {sbp=}")
-        for res in sbp.add_generic_systems():
-            yield res
-        yield Ok(f"{log_prefix} Done adding generic_systems of blueprint {bp_label}")
+    dry_run : bool
+        Yield the plan (json of PlanOperation) without applying it.
 
-    # AGAIN, fetch the blueprints from the apstra server and store them in the data classes
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.fetch_apstra(apstra_session):
-            yield res
-        yield Ok(f"{log_prefix} Done fetching data from Apstra after generic system creation of blueprint {bp_label}")
+    chunk_size : int
+        Stream the rows through fetch, plan and apply chunk_size generic systems at a time. All at once if None.
 
-    # form LAG for the generic systems
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.form_lag():
-            yield res
-        yield Ok(f"{log_prefix} Done LAG for blueprint {bp_label}")
+    presorted : bool
+        The rows of each generic system are contiguous in the input, so the rows are not sorted for the chunks.
 
-    # form_lag may need some time to catch up
-    time.sleep(3)
+    journal : ImportJournal
+        Record the stages done per generic system. Resume from it when loaded from an earlier run.
 
-    # AGAIN YET, fetch the blueprints from the apstra server and store them in the data classes
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.fetch_apstra(apstra_session):
-            yield res
-        yield Ok(f"{log_prefix} Done fetching data from Apstra after form lag for blueprint {bp_label}")
+    """
+    yield from GenericSystemImport(apstra_session, workers, dry_run, journal).run(generic_system_rows, chunk_size, presorted)
 
-    # fix the server interface names
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.rename_interfaces():
-            yield res
-        yield Ok(f"{log_prefix} Done fixing the interfaces names for blueprints {bp_label}")
 
-    # fix the connectivity templates
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.add_vlans():
-            yield res
-        yield Ok(f"{log_prefix} Done adding vlans for blueprints {bp_label}")
+def generic_system_rows(bp: CkApstraBlueprint) -> Result[Iterator[Dict[str, Any]], str]:
+    """
+    Pull the links of all the generic systems of the blueprint, to be iterated as the rows of GsCsvKeys.
+    One query for the links with their AE and EVPN interfaces, one for the tags and one for the CT assignments.
 
-    # fix the tags
-    for bp_label, sbp in ServerBlueprint._bps.items():
-        for res in sbp.fix_tags():
-            yield res
-        yield Ok(f"{log_prefix} Done fixing tags for blueprint {bp_label}")
+    The rows of a generic system are together, in the order of the generic systems in the query result.
+    Only the rows of one generic system are sorted at a time.
+    """
+    links_query = """
+        match(
+            node('system', system_type='server', name='server')
+                .out('hosted_interfaces').node('interface', if_type='ethernet', name='server_intf')
+                .out('link').node('link', name='link')
+                .in_('link').node('interface', if_type='ethernet', name='switch_intf')
+                .in_('hosted_interfaces').node('system', system_type='switch', name='switch'),
+            optional(
+                node(name='switch_intf').in_('composed_of').node('interface', if_type='port_channel', name='ae')
+            ),
+            optional(
+                node(name='ae').in_('composed_of').node('interface', po_control_protocol='evpn', name='evpn')
+            )
+        )
+        """
+    # not kept in the query cache. the links can be many
+    links_result = bp.query(links_query, use_cache=False)
+    if isinstance(links_result, Err):
+        return Err(f"links of {bp.label}: {links_result.err_value}")
+    node_tags_result = bp.get_node_tags()
+    if isinstance(node_tags_result, Err):
+        return Err(f"tags of {bp.label}: {node_tags_result.err_value}")
+    node_tags = node_tags_result.ok_value
+    ct_query = """
+        match(
+            node('ep_endpoint_policy', policy_type_name='batch', name='ct')
+                .in_().node('ep_application_instance')
+                .out('ep_affected_by').node('ep_group')
+                .in_('ep_member_of').node('interface', name='interface')
+        ).distinct(['ct', 'interface'])
+        """
+    ct_result = bp.query(ct_query, use_cache=False)
+    if isinstance(ct_result, Err):
+        return Err(f"CTs of {bp.label}: {ct_result.err_value}")
+    interface_cts = {}
+    for x in ct_result.ok_value:
+        interface_cts.setdefault(x['interface']['id'], []).append(x['ct']['label'])
+
+    links = links_result.ok_value
+    # { server id: [index of the link] } in the order of the first link of each generic system
+    server_links: Dict[str, List[int]] = {}
+    for i, x in enumerate(links):
+        server_links.setdefault(x['server']['id'], []).append(i)
+
+    def row(x: dict) -> Dict[str, Any]:
+        server, ae, evpn = x['server'], x['ae'], x['evpn']
+        # the application point of the CTs. See LinkGroup.fetch_apstra()
+        application_point = evpn or ae or x['switch_intf']
+        return {
+            GsCsvKeys.LINE: 0,
+            GsCsvKeys.BLUEPRINT: bp.label,
+            GsCsvKeys.SERVER: server['label'],
+            GsCsvKeys.EXT: 'True' if server.get('external') else '',
+            GsCsvKeys.DEPLOY_MODE: server.get('deploy_mode') or '',
+            GsCsvKeys.TAGS_SERVER: ','.join(node_tags.get(server['id'], [])),
+            GsCsvKeys.AE: ae['if_name'] if ae else '',
+            GsCsvKeys.LAG_MODE: (ae.get('lag_mode') or '') if ae else '',
+            GsCsvKeys.CT_NAMES: ','.join(sorted(interface_cts.get(application_point['id'], []))),
+            GsCsvKeys.TAGS_AE: ','.join(node_tags.get(application_point['id'], [])) if ae else '',
+            GsCsvKeys.SPEED: x['link'].get('speed') or '',
+            GsCsvKeys.IFNAME: x['server_intf']['if_name'],
+            GsCsvKeys.SWITCH: x['switch']['label'],
+            GsCsvKeys.SWITCH_IFNAME: x['switch_intf']['if_name'],
+            GsCsvKeys.TAGS_LINK: ','.join(node_tags.get(x['link']['id'], [])),
+            GsCsvKeys.COMMENT: '',
+        }
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        # the rows of a generic system are together, for import-generic-system --presorted
+        for link_indexes in server_links.values():
+            server_rows = [row(links[i]) for i in link_indexes]
+            server_rows.sort(key=lambda r: (r[GsCsvKeys.AE], r[GsCsvKeys.SWITCH], r[GsCsvKeys.SWITCH_IFNAME]))
+            yield from server_rows
 
-    yield Ok(f"{log_prefix} Done adding generic systems for {blueprints_string}")
+    return Ok(rows())
 
 
-def get_generic_systems(apstra_session: CkApstraSession, out_csv: str ) -> Generator[Result[str, str], Any, Any]:
+def get_generic_systems(apstra_session: CkApstraSession, out_csv: str, blueprints: List[str] = None, workers: int = 4) -> Generator[Result[str, str], Any, Any]:
     """
     Get the generic systems from the apstra server and write them to the csv file.
 
@@ -897,8 +1574,46 @@ def get_generic_systems(apstra_session: CkApstraSession, out_csv: str ) -> Gener
         The apstra session object.
 
     out_csv : str
-        The output csv file path.
+        The output csv file path. The format is of GsCsvKeys, to be used by add_generic_systems.
 
-    """
-    yield Err("get_generic_systems not implemented")
+    blueprints : List[str]
+        The labels of the blueprints. All the datacenter blueprints if None.
+
+    workers : int
+        The number of blueprints to pull concurrently.
 
+    """
+    log_prefix = "::get_generic_systems()"
+    summaries = apstra_session.get_blueprint_summaries()
+    if blueprints is None:
+        blueprints = [x['label'] for x in summaries.values() if x.get('design') == 'two_stage_l3clos']
+    workers = max(1, min(workers, len(blueprints)))
+    if workers > 1:
+        apstra_session.set_pool_size(workers)
+
+    def pull(blueprint: str) -> Result[Iterator[Dict[str, Any]], str]:
+        bp = CkApstraBlueprint(apstra_session, blueprint)
+        if bp.id is None:
+            return Err(f"blueprint {blueprint} not found")
+        return generic_system_rows(bp)
+
+    line = 0
+    with open(out_csv, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=[x.value for x in GsCsvKeys])
+        writer.writeheader()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ck-gs-export') as executor:
+            futures = {executor.submit(pull, x): x for x in blueprints}
+            # each blueprint is written as soon as it is pulled
+            for future in as_completed(futures):
+                blueprint, rows_result = futures.pop(future), future.result()
+                if isinstance(rows_result, Err):
+                    yield Err(f"{log_prefix} {rows_result.err_value}")
+                    continue
+                links = 0
+                for row in rows_result.ok_value:
+                    line += 1
+                    links += 1
+                    row[GsCsvKeys.LINE] = line
+                    writer.writerow(row)
+                yield Ok(f"{log_prefix} {links} links of blueprint {blueprint}")
+    yield Ok(f"{log_prefix} Done {line} links of {len(blueprints)} blueprints in {out_csv}")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+import ast
+from dataclasses import dataclass, field
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from result import Result, Ok, Err
+
+from .blueprint_snapshot import BlueprintSnapshot
+
+
+'''
+Local interpreter of the subset of the Apstra graph query language used in this project
+
+    node('system', label='x', name='system').out('hosted_interfaces').node('interface', name='intf')
+    node(id=is_in(['a', 'b'])).in_('tag').node('tag', name='tag')
+    match(path, optional(path), ...).distinct(['name'])
+
+Property values can be constants, is_in([...]), not_in([...]), ne(value), not_none() and is_none().
+'''
+
+
+class GraphQueryError(Exception):
+    """The query is invalid or uses a feature out of the supported subset"""
+
+
+@dataclass
+class Predicate:
+    op: str
+    value: Any = None
+
+    def test(self, actual: Any) -> bool:
+        match self.op:
+            case 'is_in':
+                return any(_equals(actual, x) for x in self.value)
+            case 'not_in':
+                return not any(_equals(actual, x) for x in self.value)
+            case 'ne':
+                return not _equals(actual, self.value)
+            case 'not_none':
+                return actual is not None
+            case 'is_none':
+                return actual is None
+        raise GraphQueryError(f"unsupported predicate {self.op}")
+
+
+def _equals(actual: Any, expected: Any) -> bool:
+    if actual == expected:
+        return True
+    # the graph keeps some numbers as strings (vn_id) and the queries are not consistent about it
+    if actual is None or expected is None or isinstance(actual, bool) or isinstance(expected, bool):
+        return False
+    return str(actual) == str(expected)
+
+
+@dataclass
+class NodeSpec:
+    type: Optional[str] = None
+    name: Optional[str] = None
+    properties: Dict[str, Any] = field(default_factory=dict)
+
+    def matches(self, node: dict) -> bool:
+        if self.type is not None and node.get('type') != self.type:
+            return False
+        for key, expected in self.properties.items():
+            actual = node.get(key)
+            if isinstance(expected, Predicate):
+                if not expected.test(actual):
+                    return False
+            elif not _equals(actual, expected):
+                return False
+        return True
+
+
+@dataclass
+class EdgeSpec:
+    direction: str  # 'out' or 'in'
+    type: Optional[str] = None
+
+
+@dataclass
+class PathSpec:
+    nodes: List[NodeSpec] = field(default_factory=list)
+    edges: List[EdgeSpec] = field(default_factory=list)
+
+    @property
+    def names(self) -> List[str]:
+        return [x.name for x in self.nodes if x.name]
+
+
+@dataclass
+class OptionalSpec:
+    path: PathSpec
+
+
+@dataclass
+class MatchSpec:
+    paths: List[Tuple[PathSpec, bool]] = field(default_factory=list)  # [(path, is_optional)]
+
+
+@dataclass
+class QuerySpec:
+    body: Any  # PathSpec or MatchSpec
+    distinct: Optional[List[str]] = None
+
+
+class _Parser:
+    """Build QuerySpec from the python syntax tree of the query string"""
+
+    PREDICATES = ('is_in', 'not_in', 'ne', 'not_none', 'is_none')
+
+    def parse(self, query_string: str) -> QuerySpec:
+        try:
+            # in parentheses for the queries spanning multiple lines
+            tree = ast.parse(f"({query_string.strip()})", mode='eval')
+        except SyntaxError as e:
+            raise GraphQueryError(f"syntax error: {e}")
+        parsed = self._expr(tree.body)
+        if isinstance(parsed, QuerySpec):
+            return parsed
+        if isinstance(parsed, (PathSpec, MatchSpec)):
+            return QuerySpec(parsed)
+        raise GraphQueryError(f"not a query: {query_string}")
+
+    def _literal(self, tree: ast.AST) -> Any:
+        if isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name) and tree.func.id in self.PREDICATES:
+            args = [self._literal(x) for x in tree.args]
+            return Predicate(tree.func.id, args[0] if args else None)
+        try:
+            return ast.literal_eval(tree)
+        except ValueError:
+            raise GraphQueryError(f"unsupported value: {ast.unparse(tree)}")
+
+    def _node_spec(self, call: ast.Call) -> NodeSpec:
+        spec = NodeSpec()
+        if call.args:
+            spec.type = self._literal(call.args[0])
+        for keyword in call.keywords:
+            value = self._literal(keyword.value)
+            if keyword.arg == 'name':
+                spec.name = value
+            elif keyword.arg == 'type':
+                spec.type = value
+            else:
+                spec.properties[keyword.arg] = value
+        return spec
+
+    def _expr(self, tree: ast.AST) -> Any:
+        if not isinstance(tree, ast.Call):
+            raise GraphQueryError(f"unsupported expression: {ast.unparse(tree)}")
+        func = tree.func
+        if isinstance(func, ast.Name):
+            match func.id:
+                case 'node':
+                    return PathSpec([self._node_spec(tree)], [])
+                case 'optional':
+                    path = self._expr(tree.args[0])
+                    if not isinstance(path, PathSpec):
+                        raise GraphQueryError("optional() takes a path")
+                    return OptionalSpec(path)
+                case 'match':
+                    match_spec = MatchSpec()
+                    for arg in tree.args:
+                        parsed = self._expr(arg)
+                        if isinstance(parsed, OptionalSpec):
+                            match_spec.paths.append((parsed.path, True))
+                        elif isinstance(parsed, PathSpec):
+                            match_spec.paths.append((parsed, False))
+                        else:
+                            raise GraphQueryError("match() takes paths")
+                    return match_spec
+            raise GraphQueryError(f"unsupported function {func.id}()")
+        if isinstance(func, ast.Attribute):
+            receiver = self._expr(func.value)
+            method = func.attr
+            if method == 'distinct':
+                names = self._literal(tree.args[0]) if tree.args else None
+                body = receiver.body if isinstance(receiver, QuerySpec) else receiver
+                return QuerySpec(body, names if names is not None else [])
+            if not isinstance(receiver, PathSpec):
+                raise GraphQueryError(f"unsupported method .{method}()")
+            if method in ('out', 'in_'):
+                if len(receiver.edges) == len(receiver.nodes):
+                    # two edges in a row without node() in between
+                    receiver.nodes.append(NodeSpec())
+                relationship_type = self._literal(tree.args[0]) if tree.args else None
+                receiver.edges.append(EdgeSpec('out' if method == 'out' else 'in', relationship_type))
+                return receiver
+            if method == 'node':
+                if len(receiver.edges) != len(receiver.nodes):
+                    raise GraphQueryError(".node() must follow .out() or .in_()")
+                receiver.nodes.append(self._node_spec(tree))
+                return receiver
+            raise GraphQueryError(f"unsupported method .{method}()")
+        raise GraphQueryError(f"unsupported expression: {ast.unparse(tree)}")
+
+
+class GraphQueryEngine:
+    """
+    Evaluate the queries against a BlueprintSnapshot with its adjacency indexes.
+    The result items are in the same shape as the /qe items: { name: node or None }
+    """
+
+    def __init__(self, snapshot: BlueprintSnapshot) -> None:
+        self.snapshot = snapshot
+        self.logger = logging.getLogger('GraphQueryEngine')
+        self._parser = _Parser()
+
+    def parse(self, query_string: str) -> QuerySpec:
+        return self._parser.parse(query_string)
+
+    def query(self, query_string: str) -> Result[List, str]:
+        """
+        Run the query locally.
+
+        Returns:
+            Ok with the list of items, Err if the query is not supported.
+        """
+        try:
+            query_spec = self.parse(query_string)
+            rows = self.evaluate(query_spec)
+        except GraphQueryError as e:
+            return Err(f"local query failed: {e}: {query_string=}")
+        return Ok(rows)
+
+    def evaluate(self, query_spec: QuerySpec) -> List[dict]:
+        if isinstance(query_spec.body, PathSpec):
+            rows = self._extend([{}], query_spec.body, False)
+        else:
+            rows = [{}]
+            for path, is_optional in query_spec.body.paths:
+                rows = self._extend(rows, path, is_optional)
+        if query_spec.distinct is not None:
+            names = query_spec.distinct or sorted({k for row in rows for k in row})
+            seen = set()
+            distinct_rows = []
+            for row in rows:
+                key = tuple(row[x]['id'] if row.get(x) else None for x in names)
+                if key not in seen:
+                    seen.add(key)
+                    distinct_rows.append({x: row.get(x) for x in names})
+            rows = distinct_rows
+        return [{k: dict(v) if v else v for k, v in row.items()} for row in rows]
+
+    def _candidates(self, spec: NodeSpec) -> Iterable[dict]:
+        node_id = spec.properties.get('id')
+        if isinstance(node_id, str):
+            node = self.snapshot.node(node_id)
+            return [node] if node else []
+        if isinstance(node_id, Predicate) and node_id.op == 'is_in':
+            return [x for x in (self.snapshot.node(y) for y in node_id.value) if x]
+        label = spec.properties.get('label')
+        if spec.type and isinstance(label, str):
+            return self.snapshot.nodes_by_label(spec.type, label)
+        return self.snapshot.nodes_by_type(spec.type)
+
+    def _neighbors(self, node_id: str, edge: EdgeSpec, forward: bool) -> List[str]:
+        # walking backward from the node after the edge reverses the direction
+        if (edge.direction == 'out') == forward:
+            return self.snapshot.out_ids(node_id, edge.type)
+        return self.snapshot.in_ids(node_id, edge.type)
+
+    def _match_path(self, path: PathSpec, row: dict) -> List[dict]:
+        """
+        Return the bindings { name: node } of the path consistent with the names bound in the row
+        """
+        anchor = next((i for i, x in enumerate(path.nodes) if x.name and x.name in row), None)
+        if anchor is None:
+            anchor = 0
+            candidates = [x for x in self._candidates(path.nodes[0]) if path.nodes[0].matches(x)]
+        else:
+            bound = row[path.nodes[anchor].name]
+            if bound is None or not path.nodes[anchor].matches(bound):
+                return []
+            candidates = [bound]
+
+        def bind(binding: dict, spec: NodeSpec, node: dict) -> Optional[dict]:
+            if spec.name:
+                previous = binding['names'].get(spec.name, row.get(spec.name))
+                if previous is not None and previous['id'] != node['id']:
+                    return None
+            new_binding = {'ids': dict(binding['ids']), 'names': dict(binding['names'])}
+            new_binding['ids'][id(spec)] = node['id']
+            if spec.name:
+                new_binding['names'][spec.name] = node
+            return new_binding
+
+        bindings = [x for x in (bind({'ids': {}, 'names': {}}, path.nodes[anchor], node) for node in candidates) if x]
+        # walk forward from the anchor
+        for index in range(anchor + 1, len(path.nodes)):
+            spec = path.nodes[index]
+            next_bindings = []
+            for binding in bindings:
+                for node_id in self._neighbors(binding['ids'][id(path.nodes[index - 1])], path.edges[index - 1], True):
+                    node = self.snapshot.node(node_id)
+                    if node and spec.matches(node) and (new_binding := bind(binding, spec, node)):
+                        next_bindings.append(new_binding)
+            bindings = next_bindings
+        # walk backward from the anchor
+        for index in range(anchor - 1, -1, -1):
+            spec = path.nodes[index]
+            next_bindings = []
+            for binding in bindings:
+                for node_id in self._neighbors(binding['ids'][id(path.nodes[index + 1])], path.edges[index], False):
+                    node = self.snapshot.node(node_id)
+                    if node and spec.matches(node) and (new_binding := bind(binding, spec, node)):
+                        next_bindings.append(new_binding)
+            bindings = next_bindings
+
+        # the same named nodes through different unnamed nodes are one match
+        matches = {}
+        for binding in bindings:
+            key = tuple(sorted((k, v['id']) for k, v in binding['names'].items()))
+            matches.setdefault(key, binding['names'])
+        return list(matches.values())
+
+    def _extend(self, rows: List[dict], path: PathSpec, is_optional: bool) -> List[dict]:
+        extended = []
+        for row in rows:
+            matches = self._match_path(path, row)
+            if matches:
+                extended.extend({**row, **x} for x in matches)
+            elif is_optional:
+                extended.append({**row, **{x: None for x in path.names if x not in row}})
+        return extended
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+
+class ImportJournal:
+    """
+    On-disk journal of an import, one json per line, appended as each stage of a generic system completes.
+
+        {"blueprint": "bp1", "server": "srv1", "stage": "form_lag", "digest": "...", "ids": {...}, "at": 1700000000.0}
+
+    The digest is of the input rows of the generic system. A stage recorded with another digest does not count as done,
+    so a changed input is applied again on resume.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        """
+        Args:
+            path: The journal file
+            resume: Load the entries of the journal. Otherwise the journal starts empty.
+        """
+        self.path = path
+        self.logger = logging.getLogger(f"ImportJournal({path})")
+        self.entries: Dict[Tuple[str, str], Dict[str, dict]] = {}  # { (blueprint, server): { stage: entry } }
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self.load()
+        else:
+            open(path, 'w').close()
+
+    def load(self) -> int:
+        """
+        Load the entries of the journal file. A partly written last line is ignored.
+
+        Returns:
+            The number of entries loaded
+        """
+        loaded = 0
+        with open(self.path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"skipping the broken line {line=}")
+                    continue
+                self.entries.setdefault((entry['blueprint'], entry['server']), {})[entry['stage']] = entry
+                loaded += 1
+        return loaded
+
+    def record(self, blueprint: str, server: str, stage: str, digest: str, ids: Dict[str, Any] = None) -> None:
+        """
+        Record the stage of the generic system as done
+        """
+        entry = {'blueprint': blueprint, 'server': server, 'stage': stage, 'digest': digest, 'ids': ids or {}, 'at': time.time()}
+        with self._lock:
+            self.entries.setdefault((blueprint, server), {})[stage] = entry
+            with open(self.path, 'a') as journal_file:
+                journal_file.write(json.dumps(entry) + '\n')
+
+    def done(self, blueprint: str, server: str, stage: str, digest: str) -> bool:
+        entry = self.entries.get((blueprint, server), {}).get(stage)
+        return entry is not None and entry['digest'] == digest
+
+    def ids(self, blueprint: str, server: str) -> Dict[str, Any]:
+        """
+        The ids recorded for the generic system, the later stages over the earlier ones
+        """
+        ids = {}
+        for entry in sorted(self.entries.get((blueprint, server), {}).values(), key=lambda x: x['at']):
+            ids.update(entry['ids'])
+        return ids
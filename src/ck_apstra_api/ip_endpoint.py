@@ -1,9 +1,10 @@
 
-import click
 import logging
-import ipaddress
 
-from ck_apstra_api.cli import CkJobEnv
+from result import Err
+
+from ck_apstra_api.apstra_blueprint import CkApstraBlueprint
+from ck_apstra_api.prefix_trie import PrefixTrie
 
 
 
@@ -66,7 +67,7 @@ class PrefixListCollection:
     """
     # named_prefix_lists = {}  # { name: NamedPrefixList, ...}
     # vn_nodes = []  # to identify internal ip addresses
-    #    ip_network_obj has the ipaddress.ip_network object
+    # vn_trie  # PrefixTrie of the ipv4_subnet of the vn nodes to the vn node id
     # logger
 
     def __init__(self, main_bp):
@@ -74,22 +75,27 @@ class PrefixListCollection:
         self.named_prefix_lists = {}
         self.logger = logging.getLogger('PrefixListCollection')
         # pull the vn nodes with the ipv4_subnet
-        self.vn_nodes = [x[VN_NODE_NAME] for x in main_bp.query(f"node('virtual_network',name='{VN_NODE_NAME}')") if x[VN_NODE_NAME]['ipv4_subnet'] is not None]
+        vn_result = main_bp.query(f"node('virtual_network',name='{VN_NODE_NAME}')")
+        if vn_result.is_err():
+            self.logger.error(f"vn nodes not pulled: {vn_result.err_value}")
+        self.vn_nodes = [x[VN_NODE_NAME] for x in vn_result.unwrap_or([]) if x[VN_NODE_NAME]['ipv4_subnet'] is not None]
+        self.vn_trie = PrefixTrie()
         for vn_node in self.vn_nodes:
-            vn_node['ip_network_obj'] = ipaddress.ip_network(vn_node['ipv4_subnet'])
+            self.vn_trie.insert(vn_node['ipv4_subnet'], vn_node['id'])
         self.logger.info(f"There are {len(self.vn_nodes)} vn nodes")
 
-    def add(self, prefix_list_name: str, ipv4_addr: str):
+    def add(self, prefix_list_name: str, ipv4_addr: str, vn_id: str = PrefixTrie.MISSING):
         """
         Add a prefix list item into a named prefix list
+
+        Args:
+            vn_id: The id of the vn node of the subnet containing ipv4_addr, None if external.
+                Looked up from the vn subnets if not given.
         """
-        vn_id = None
-        this_ip_network = ipaddress.ip_network(ipv4_addr)
-        for vn_node in self.vn_nodes:
-            if this_ip_network.subnet_of(vn_node.get('ip_network_obj')):
-                vn_id = vn_node['id']
-                self.logger.warning(f"{ipv4_addr=} is internal")
-                break
+        if vn_id is PrefixTrie.MISSING:
+            vn_id = self.vn_trie.longest_match(ipv4_addr)
+        if vn_id:
+            self.logger.warning(f"{ipv4_addr=} is internal")
         # update existing named prefix list
         if prefix_list_name in self.named_prefix_lists:
             self.named_prefix_lists[prefix_list_name].add(ipv4_addr, vn_id)
@@ -109,6 +115,7 @@ class PrefixListCollection:
         PREFIX_LIST_PREFIX = 'set policy-options prefix-list '
         with open(set_file, 'r') as f:
             set_lines = f.readlines()
+        prefix_list_items = []  # [(prefix_list_name, ipv4_addr)]
         for set_line in set_lines:
             if not set_line.startswith(PREFIX_LIST_PREFIX):
                 continue
@@ -117,13 +124,17 @@ class PrefixListCollection:
             if len(prefix_list_key_and_value) < 2:
                 # no value - skip
                 continue
-            self.add(prefix_list_key_and_value[0], prefix_list_key_and_value[1])
+            prefix_list_items.append((prefix_list_key_and_value[0], prefix_list_key_and_value[1]))
+        # classify all the prefixes at once
+        vn_ids = self.vn_trie.match_many([x[1] for x in prefix_list_items])
+        for (prefix_list_name, ipv4_addr), vn_id in zip(prefix_list_items, vn_ids):
+            self.add(prefix_list_name, ipv4_addr, vn_id)
 
 
-def create_ip_endpoint(jobEnv: CkJobEnv, prefix_name: str, prefix_with_vnid: PrefixListMember) -> EndpointWithVnId:
+def ip_endpoint_spec(prefix_name: str, prefix_with_vnid: PrefixListMember) -> tuple:
     """
-    Create an ip endpoint
-     Return the tuple of (str: node_id, bool: vn_id)
+    Build the spec to create an ip endpoint
+     Return the tuple of (str: post_url, dict: post_spec)
     """
     # POST bp/external_endpoints?type=staging"
     post_external_endpoint_spec = {
@@ -167,14 +178,23 @@ def create_ip_endpoint(jobEnv: CkJobEnv, prefix_name: str, prefix_with_vnid: Pre
         post_spec['enforcement_points'] = []
         post_url = 'external_endpoints'
 
-    # post_external_endpoint_spec['ipv4_addr'] = ipv4_addr
-    result = jobEnv.main_bp.post_item(post_url, post_spec=post_spec, params={'type': 'staging'})
+    return post_url, post_spec
+
+
+def create_ip_endpoint(main_bp: CkApstraBlueprint, prefix_name: str, prefix_with_vnid: PrefixListMember) -> EndpointWithVnId:
+    """
+    Create an ip endpoint
+     Return the tuple of (str: node_id, bool: vn_id)
+    """
+    post_url, post_spec = ip_endpoint_spec(prefix_name, prefix_with_vnid)
+    vn_id = prefix_with_vnid.vn_id
+    result = main_bp.post_item(post_url, post_spec=post_spec, params={'type': 'staging'})
     if result.status_code == 201:
         return EndpointWithVnId(result.json()['id'], vn_id)
     logging.warning(f"{result=} {result.text=} {prefix_with_vnid=} {post_spec=} {post_url=}")
     return None
 
-def update_group(jobEnv: CkJobEnv, members: list, prefix_name: str, the_group_id: str):
+def update_group(main_bp: CkApstraBlueprint, members: list, prefix_name: str, the_group_id: str):
     """
     Create or update a group
     members is a list of EndpointWithVnId
@@ -233,25 +253,25 @@ def update_group(jobEnv: CkJobEnv, members: list, prefix_name: str, the_group_id
         post_group_spec['group_type'] = the_group_type
         post_group_spec['members'] = members_ids
         post_group_spec['label'] = prefix_name
-        result = jobEnv.main_bp.post_item('groups', post_spec=post_group_spec, params={'type': 'staging'})
-        if result.status_code != 201:
+        result = main_bp.post_item('groups', post_spec=post_group_spec, params={'type': 'staging'})
+        # status_code is None while queued in a write batch
+        if result.status_code not in (None, 201):
             logging.error(f"{result=} {result.text=} {post_group_spec=}, {members=}")
         return result
     put_group_spec['group_type'] = the_group_type
     put_group_spec['members'] = members_ids
     put_group_spec['label'] = prefix_name
     put_group_spec['id'] = the_group_id
-    result = jobEnv.main_bp.put_item(f'groups/{the_group_id}', put_spec=put_group_spec, params={'type': 'staging'})
-    if result.status_code != 201:
+    result = main_bp.put_item(f'groups/{the_group_id}', put_spec=put_group_spec, params={'type': 'staging'})
+    if result.status_code not in (None, 201):
         logging.error(f"{result=} {result.text=} {put_group_spec=}")
     return result
 
 
-def add_ip_endpoints(jobEnv: CkJobEnv, prefix_list_collection: PrefixListCollection):
+def add_ip_endpoints(main_bp: CkApstraBlueprint, prefix_list_collection: PrefixListCollection):
     """
     Add the ip endpoints to the blueprint from the prefix list
     """
-    main_bp = jobEnv.main_bp
 
     IP_ENDPOINT_NODE_NAME = 'ip_endpoint'
     GROUP_NODE_NAME = 'group'
@@ -265,57 +285,74 @@ def add_ip_endpoints(jobEnv: CkJobEnv, prefix_list_collection: PrefixListCollect
         )
     """
 
-    ip_endpoint_nodes = main_bp.query(endpoint_query, multiline=True)
+    ip_endpoint_result = main_bp.query(endpoint_query)
+    if isinstance(ip_endpoint_result, Err):
+        logging.error(f"ip endpoints not pulled: {ip_endpoint_result.err_value}")
+        return
+    ip_endpoint_nodes = ip_endpoint_result.ok_value
     ip_endpoint_nodes_no_group = [x for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is None]
 
-    for prefix_name, named_prefix_list in prefix_list_collection.iteritems():
-        logging.debug(f"{prefix_name=}, {named_prefix_list=}")
-        the_member_ids_to_add = []  # list of EndpointWithVnId
-        existing_member_ids = [] # list of EndpointWithVnId
-        the_group_id = None
+    group_orders = []  # [(prefix_name, the_member_ids_to_add, existing_member_ids, the_group_id)]
+    endpoints_to_create = []  # [(the_member_ids_to_add, label, BatchOperation, vn_id)]
+    # create the missing ip endpoints of all the prefix lists in /batch requests
+    with main_bp.write_batch() as endpoint_batch:
+        for prefix_name, named_prefix_list in prefix_list_collection.iteritems():
+            logging.debug(f"{prefix_name=}, {named_prefix_list=}")
+            the_member_ids_to_add = []  # list of EndpointWithVnId
+            existing_member_ids = [] # list of EndpointWithVnId
+            the_group_id = None
 
-        # iterate named_prefix_list and compare with ipv4_in_bp
-        for ipv4, prefix_list_member in named_prefix_list.iteritems():
+            # iterate named_prefix_list and compare with ipv4_in_bp
+            for ipv4, prefix_list_member in named_prefix_list.iteritems():
 
-            logging.debug(f"{prefix_name=} {ipv4} {type(prefix_list_member)=} {prefix_list_member=}")
+                logging.debug(f"{prefix_name=} {ipv4} {type(prefix_list_member)=} {prefix_list_member=}")
             
-            # see if the bp has the same ip_v4 under the same group. Then add the node id to the list of existing_member_ids
-            the_endpoint_node_in_bp = [x[IP_ENDPOINT_NODE_NAME] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is not None and x[GROUP_NODE_NAME]['label'] == prefix_name and x[IP_ENDPOINT_NODE_NAME]['ipv4_addr'] == ipv4]
-            if len(the_endpoint_node_in_bp) > 0:
-                existing_member_ids.append(EndpointWithVnId(the_endpoint_node_in_bp[0]['id'], prefix_list_member.vn_id))
-                if the_group_id is None:                    
-                    the_group_id = [x[GROUP_NODE_NAME]['id'] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is not None and x[GROUP_NODE_NAME]['label'] == prefix_name][0]
-                continue
-
-            # the bp does not have the same ip_v4 under the same group. Then find the node id of not grouped ip_v4
-            the_endpoint_node_in_bp = [x[IP_ENDPOINT_NODE_NAME] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is None and x[IP_ENDPOINT_NODE_NAME]['ipv4_addr'] == ipv4]
-            if len(the_endpoint_node_in_bp) > 0:
-                the_member_ids_to_add.append(EndpointWithVnId(the_endpoint_node_in_bp[0]['id'], prefix_list_member.vn_id))
-                continue
-
-            # no ip_endpoint node for the ipv4_addr in the bp. Need to create it
-            new_id = create_ip_endpoint(jobEnv, prefix_name, prefix_list_member)
-            if new_id:
-                the_member_ids_to_add.append(new_id)
-            else:
+                # see if the bp has the same ip_v4 under the same group. Then add the node id to the list of existing_member_ids
+                the_endpoint_node_in_bp = [x[IP_ENDPOINT_NODE_NAME] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is not None and x[GROUP_NODE_NAME]['label'] == prefix_name and x[IP_ENDPOINT_NODE_NAME]['ipv4_addr'] == ipv4]
+                if len(the_endpoint_node_in_bp) > 0:
+                    existing_member_ids.append(EndpointWithVnId(the_endpoint_node_in_bp[0]['id'], prefix_list_member.vn_id))
+                    if the_group_id is None:                    
+                        the_group_id = [x[GROUP_NODE_NAME]['id'] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is not None and x[GROUP_NODE_NAME]['label'] == prefix_name][0]
+                    continue
+
+                # the bp does not have the same ip_v4 under the same group. Then find the node id of not grouped ip_v4
+                the_endpoint_node_in_bp = [x[IP_ENDPOINT_NODE_NAME] for x in ip_endpoint_nodes if x[GROUP_NODE_NAME] is None and x[IP_ENDPOINT_NODE_NAME]['ipv4_addr'] == ipv4]
+                if len(the_endpoint_node_in_bp) > 0:
+                    the_member_ids_to_add.append(EndpointWithVnId(the_endpoint_node_in_bp[0]['id'], prefix_list_member.vn_id))
+                    continue
+
+                # no ip_endpoint node for the ipv4_addr in the bp. Need to create it
+                post_url, post_spec = ip_endpoint_spec(prefix_name, prefix_list_member)
+                posted = main_bp.post_item(post_url, post_spec=post_spec, params={'type': 'staging'})
+                endpoints_to_create.append((the_member_ids_to_add, post_spec['label'], posted, prefix_list_member.vn_id))
+
+            group_orders.append((prefix_name, the_member_ids_to_add, existing_member_ids, the_group_id))
+
+    # the ids of the created endpoints. From the batch results, or by the label when the results do not carry them
+    created_ids = {label: posted.json()['id'] for _, label, posted, _ in endpoints_to_create
+                   if posted.ok and isinstance(posted.json(), dict) and 'id' in posted.json()}
+    labels_to_lookup = [label for _, label, posted, _ in endpoints_to_create if posted.ok and label not in created_ids]
+    if labels_to_lookup:
+        created_nodes = main_bp.query(f"node('ip_endpoint', label=is_in({labels_to_lookup}), name='{IP_ENDPOINT_NODE_NAME}')")
+        if isinstance(created_nodes, Err):
+            logging.error(f"the created ip endpoints not found: {created_nodes.err_value}")
+        else:
+            created_ids.update({x[IP_ENDPOINT_NODE_NAME]['label']: x[IP_ENDPOINT_NODE_NAME]['id'] for x in created_nodes.ok_value})
+    for the_member_ids_to_add, label, posted, vn_id in endpoints_to_create:
+        if label in created_ids:
+            the_member_ids_to_add.append(EndpointWithVnId(created_ids[label], vn_id))
+        else:
+            logging.warning(f"{posted=} {posted.text=} {label=}")
+
+    # create or update the groups in /batch requests
+    with main_bp.write_batch() as group_batch:
+        for prefix_name, the_member_ids_to_add, existing_member_ids, the_group_id in group_orders:
+            # if there is no member to add, all good. Continue to the next prefix
+            # TODO: need to check if there is any member to delete
+            if len(the_member_ids_to_add) == 0:
                 continue
-
-        # if there is no member to add, all good. Continue to the next prefix
-        # TODO: need to check if there is any member to delete
-        if len(the_member_ids_to_add) == 0:
-            continue
-
-        updated_result = update_group(jobEnv, the_member_ids_to_add + existing_member_ids, prefix_name, the_group_id)
-        if updated_result.status_code != 201:
-            logging.error(f"{updated_result=} {updated_result.text=} {prefix_name=}")
-        logging.debug(f"{prefix_name=} Created")
-
-@click.command(name='add-ip-endpoints')
-@click.option('--set-file', required=True,
-              help='The name of the junos configuration in set format')
-def click_add_ip_endpoints(set_file: str):
-    job_env = CkJobEnv()
-    prefix_list_collection = PrefixListCollection(job_env.main_bp)
-    prefix_list_collection.read_from_set(set_file)
-    add_ip_endpoints(job_env, prefix_list_collection)
-
+            update_group(main_bp, the_member_ids_to_add + existing_member_ids, prefix_name, the_group_id)
+            logging.debug(f"{prefix_name=} queued")
+    for updated_result in group_batch.failed:
+        logging.error(f"{updated_result=} {updated_result.text=} {updated_result.payload=}")
+    logging.debug(f"{endpoint_batch.stats=} {group_batch.stats=}")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import ipaddress
+from typing import Any, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def parse_ipv4_prefix(prefix: str) -> Optional[Tuple[int, int]]:
+    """
+    Return (the integer address, the prefix length) of the IPv4 prefix, or None if it is not an IPv4 prefix
+    """
+    try:
+        network = ipaddress.ip_network(prefix, strict=False)
+    except ValueError:
+        return None
+    if network.version != 4:
+        return None
+    return int(network.network_address), network.prefixlen
+
+
+class PrefixTrie:
+    """
+    Binary radix trie of the IPv4 networks with the longest prefix match, one bit per level.
+
+        trie = PrefixTrie()
+        trie.insert('10.1.0.0/16', 'vn1')
+        trie.longest_match('10.1.2.0/24')  # 'vn1'
+        trie.longest_match('10.2.0.1/32')  # None
+
+    A prefix matches a network when it is the same or a subnet of the network.
+    """
+    MISSING = object()
+    WIDTH = 32
+
+    def __init__(self) -> None:
+        self._root = [None, None, self.MISSING]  # [child of bit 0, child of bit 1, value]
+        self.networks: List[Tuple[int, int, Any]] = []  # [(address, prefix length, value)] in the insert order
+        self._arrays = None  # the networks by the prefix length for match_many(). Built on the first use
+
+    def __len__(self) -> int:
+        return len(self.networks)
+
+    def insert(self, network: str, value: Any) -> bool:
+        """
+        Insert the IPv4 network. The value of the same network inserted earlier is kept.
+
+        Returns:
+            False if the network is not IPv4 or already present
+        """
+        parsed = parse_ipv4_prefix(network)
+        if parsed is None:
+            return False
+        address, prefix_length = parsed
+        node = self._root
+        for depth in range(prefix_length):
+            bit = (address >> (self.WIDTH - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, self.MISSING]
+            node = node[bit]
+        if node[2] is not self.MISSING:
+            return False
+        node[2] = value
+        self.networks.append((address, prefix_length, value))
+        self._arrays = None
+        return True
+
+    def match(self, address: int, prefix_length: int = WIDTH, default: Any = None) -> Any:
+        """
+        The value of the longest network containing the integer address with the prefix length, or default
+        """
+        found = default
+        node = self._root
+        if node[2] is not self.MISSING:
+            found = node[2]
+        for depth in range(prefix_length):
+            node = node[(address >> (self.WIDTH - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not self.MISSING:
+                found = node[2]
+        return found
+
+    def longest_match(self, prefix: str, default: Any = None) -> Any:
+        """
+        The value of the longest network containing the IPv4 prefix, or default
+        """
+        parsed = parse_ipv4_prefix(prefix)
+        if parsed is None:
+            return default
+        return self.match(*parsed, default=default)
+
+    def match_many(self, prefixes: Iterable[str], default: Any = None) -> List[Any]:
+        """
+        The longest_match() of each prefix, in the order of the prefixes.
+        Vectorized with numpy when it is installed, one sorted search per prefix length of the networks.
+        """
+        parsed = [parse_ipv4_prefix(x) for x in prefixes]
+        if np is None or not self.networks:
+            return [default if x is None else self.match(*x, default=default) for x in parsed]
+
+        if self._arrays is None:
+            self._arrays = []
+            # the longest networks first, so the first match wins
+            for prefix_length in sorted({x[1] for x in self.networks}, reverse=True):
+                keys = np.array([x[0] >> (self.WIDTH - prefix_length) for x in self.networks if x[1] == prefix_length], dtype=np.int64)
+                order = np.argsort(keys)
+                values = [x[2] for x in self.networks if x[1] == prefix_length]
+                self._arrays.append((prefix_length, keys[order], [values[i] for i in order]))
+
+        valid = np.array([x is not None for x in parsed], dtype=bool)
+        addresses = np.array([x[0] if x else 0 for x in parsed], dtype=np.int64)
+        lengths = np.array([x[1] if x else -1 for x in parsed], dtype=np.int64)
+        matched = np.full(len(parsed), -1, dtype=np.int64)  # the index of the network in its prefix length group
+        group = np.full(len(parsed), -1, dtype=np.int64)
+        for group_index, (prefix_length, keys, _) in enumerate(self._arrays):
+            candidates = valid & (matched < 0) & (lengths >= prefix_length)
+            if not candidates.any():
+                continue
+            wanted = addresses[candidates] >> (self.WIDTH - prefix_length)
+            positions = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            hit = keys[positions] == wanted
+            indexes = np.flatnonzero(candidates)[hit]
+            matched[indexes] = positions[hit]
+            group[indexes] = group_index
+        return [self._arrays[g][2][m] if m >= 0 else default for g, m in zip(group.tolist(), matched.tolist())]
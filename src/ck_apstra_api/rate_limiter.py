@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+
+class CkRateLimiter:
+    """
+    Session wide token bucket for the requests to an Apstra controller.
+
+    The bucket refills at self.rate requests per second up to burst. On HTTP 429 the rate is halved
+    (not below min_rate) and every caller pauses for the Retry-After value or an exponential backoff
+    with jitter, whichever is longer. Each successful response ramps the rate back up by ramp_up
+    until max_rate is reached again.
+    """
+
+    def __init__(self,
+                 max_rate: float = 50.0,
+                 burst: int = 50,
+                 min_rate: float = 0.5,
+                 ramp_up: float = 0.05,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0,
+                 max_retries: int = 8) -> None:
+        """
+        Args:
+            max_rate: The requests per second when the controller does not throttle.
+            burst: The number of requests that can go out back to back.
+            min_rate: The floor of the rate after throttling.
+            ramp_up: The fraction of the current rate to add back per successful response.
+            backoff_base: The first backoff in seconds. Doubled per consecutive 429.
+            backoff_max: The ceiling of the backoff in seconds.
+            max_retries: The number of retries of a request on 429 before giving up.
+        """
+        self.max_rate = max_rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.ramp_up = ramp_up
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self.logger = logging.getLogger('CkRateLimiter')
+
+        self.rate = max_rate
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        # counters
+        self.requests = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> float:
+        """
+        Take a token, sleeping until one is available or the throttling pause is over.
+
+        Returns:
+            The seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # reserve the token now. The debt is paid by the wait
+            self._tokens -= 1
+            wait = max(self._blocked_until - now, -self._tokens / self.rate if self._tokens < 0 else 0.0)
+            self.requests += 1
+            self.wait_seconds += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self) -> None:
+        """
+        Ramp the rate back up after throttling has cleared.
+        """
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * (1 + self.ramp_up))
+
+    def on_throttled(self, retry_after: Optional[str], attempt: int) -> float:
+        """
+        Register an HTTP 429 and pause the whole session.
+
+        Args:
+            retry_after: The Retry-After header of the response, if any.
+            attempt: The number of 429 received in a row for the request, starting from 0.
+
+        Returns:
+            The seconds of the pause. The next acquire() waits it out.
+        """
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay = max(self.parse_retry_after(retry_after), backoff / 2 + random.uniform(0, backoff / 2))
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.logger.info(f"throttled ({attempt=}): waiting {delay:.1f} seconds, rate now {self.rate:.2f}/s")
+        return delay
+
+    @staticmethod
+    def parse_retry_after(retry_after: Optional[str]) -> float:
+        """
+        Return the seconds from the Retry-After header in seconds or HTTP date format. 0 if absent or invalid.
+        """
+        if not retry_after:
+            return 0.0
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return 0.0
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    @property
+    def stats(self) -> dict:
+        """
+        The counters to tune the controller load.
+        """
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'rate': round(self.rate, 3),
+        }
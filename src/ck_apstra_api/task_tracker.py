@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from result import Result, Ok, Err
+
+
+TASK_DONE = ('succeeded', 'failed')
+
+
+def wait_until(condition: Callable[[], Any], timeout: float = 60.0, initial_delay: float = 0.5, max_delay: float = 5.0) -> Any:
+    """
+    Call condition until it returns a truthy value or timeout seconds pass.
+    The delay between the calls starts at initial_delay and doubles up to max_delay.
+
+    Returns:
+        The last value of condition
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        value = condition()
+        if value or time.monotonic() + delay > deadline:
+            return value
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+class TaskTracker:
+    """
+    Track the tasks of the async=full writes of a blueprint.
+
+    The pending tasks are polled together with one GET of the tasks collection per round,
+    with exponential backoff between the rounds.
+
+        task_id = bp.task_tracker.register(bp.patch_obj_policy_batch_apply(spec, params={'async': 'full'}))
+        waited = bp.task_tracker.wait([task_id])
+    """
+
+    def __init__(self, bp, timeout: float = 60.0, initial_delay: float = 0.5, max_delay: float = 5.0) -> None:
+        """
+        Args:
+            bp: The CkApstraBlueprint of the tasks
+            timeout: The default seconds to wait for the tasks
+            initial_delay: The first delay between the polls in seconds. Doubled per poll.
+            max_delay: The ceiling of the delay in seconds
+        """
+        self.bp = bp
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.logger = logging.getLogger(f"TaskTracker({bp.label})")
+        self.tasks: Dict[str, dict] = {}  # { task id: the last task item }
+        self._lock = threading.Lock()
+        # counters
+        self.polls = 0
+
+    def register(self, task: Any) -> Optional[str]:
+        """
+        Register a task to be tracked.
+
+        Args:
+            task: The task id, the json of the async=full response, or the response itself
+
+        Returns:
+            The task id, or None if there is no task in it
+        """
+        if task is not None and not isinstance(task, (str, dict)) and hasattr(task, 'json'):
+            try:
+                task = task.json()
+            except ValueError:
+                task = None
+        task_id = task.get('task_id') if isinstance(task, dict) else task
+        if not task_id:
+            return None
+        with self._lock:
+            self.tasks.setdefault(task_id, {'id': task_id, 'status': 'init'})
+        return task_id
+
+    @property
+    def pending(self) -> List[str]:
+        with self._lock:
+            return [k for k, v in self.tasks.items() if v.get('status') not in TASK_DONE]
+
+    def poll(self, task_ids: Iterable[str] = None) -> Dict[str, dict]:
+        """
+        Update the pending tasks, of task_ids or all of them, with one GET of the tasks collection.
+        The tasks missing from the collection are pulled one by one.
+
+        Returns:
+            { task id: task item } of the tasks polled
+        """
+        pending = set(self.pending)
+        if task_ids is not None:
+            pending &= set(task_ids)
+        if not pending:
+            return {}
+        self.polls += 1
+        tasks = self.bp.get_item('tasks') or {}
+        polled = {x['id']: x for x in tasks.get('items', []) if x.get('id') in pending}
+        for task_id in pending - set(polled):
+            task = self.bp.get_item(f"tasks/{task_id}")
+            if task and 'status' in task:
+                polled[task_id] = task
+        for task_id, task in polled.items():
+            if task.get('status') == 'failed' and 'detailed_status' not in task:
+                # the collection does not carry the error
+                task = self.bp.get_item(f"tasks/{task_id}") or task
+            polled[task_id] = task
+        with self._lock:
+            self.tasks.update(polled)
+        return polled
+
+    def wait(self, task_ids: Iterable[str], timeout: float = None) -> Result[Dict[str, dict], str]:
+        """
+        Wait for the tasks to be done, polling them with backoff.
+
+        Returns:
+            Ok with { task id: task item } when all succeeded. Err with the failed or unfinished tasks.
+        """
+        task_ids = [x for x in task_ids if x]
+        for task_id in task_ids:
+            self.register(task_id)
+        timeout = self.timeout if timeout is None else timeout
+
+        def done() -> bool:
+            self.poll(task_ids)
+            return not (set(self.pending) & set(task_ids))
+
+        wait_until(done, timeout, self.initial_delay, self.max_delay)
+        with self._lock:
+            tasks = {x: self.tasks[x] for x in task_ids}
+        failed = {k: v.get('detailed_status', v) for k, v in tasks.items() if v.get('status') == 'failed'}
+        unfinished = [k for k, v in tasks.items() if v.get('status') not in TASK_DONE]
+        if failed or unfinished:
+            self.logger.warning(f"{failed=} {unfinished=}")
+            return Err(f"tasks failed: {failed} not done in {timeout} seconds: {unfinished}")
+        return Ok(tasks)
+
+    def wait_all(self, timeout: float = None) -> Result[Dict[str, dict], str]:
+        """
+        Wait for all the pending tasks
+        """
+        return self.wait(self.pending, timeout)
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [x.get('status') for x in self.tasks.values()]
+        return {
+            'tasks': len(statuses),
+            'succeeded': statuses.count('succeeded'),
+            'failed': statuses.count('failed'),
+            'polls': self.polls,
+        }
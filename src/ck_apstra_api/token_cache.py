@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+
+class CkTokenCache:
+    """
+    On-disk cache of the Apstra auth tokens keyed by host, port and user.
+
+    The file is a json dict of { "user@host:port": { "token": str, "expires_at": epoch } } readable only by the owner.
+    The expiry comes from the 'exp' claim of the token when present, otherwise from default_ttl.
+    """
+    DEFAULT_PATH = '~/.cache/ck_apstra_api/tokens.json'
+
+    def __init__(self, path: str = None, default_ttl: int = 3600, margin: int = 60) -> None:
+        """
+        Args:
+            path: The cache file. Defaults to the environment variable CK_APSTRA_TOKEN_CACHE or DEFAULT_PATH.
+            default_ttl: The seconds a token is trusted when it has no 'exp' claim.
+            margin: The seconds before the expiry to stop using a token.
+        """
+        self.path = os.path.expanduser(path or os.getenv('CK_APSTRA_TOKEN_CACHE') or self.DEFAULT_PATH)
+        self.default_ttl = default_ttl
+        self.margin = margin
+        self.logger = logging.getLogger('CkTokenCache')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(host: str, port: int, username: str) -> str:
+        return f"{username}@{host}:{port}"
+
+    @staticmethod
+    def token_expiry(token: str) -> Optional[float]:
+        """
+        Return the 'exp' claim of a JWT token, or None if the token is not a JWT.
+        """
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: dict) -> None:
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        # write to a temporary file and move it, so a concurrent ck-cli never reads a partial file
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.tokens-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"failed to write {self.path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get(self, host: str, port: int, username: str) -> Optional[str]:
+        """
+        Return the cached token, or None if absent or about to expire.
+        """
+        entry = self._load().get(self.key(host, port, username))
+        if not entry or entry.get('expires_at', 0) - self.margin <= time.time():
+            return None
+        return entry['token']
+
+    def put(self, host: str, port: int, username: str, token: str) -> None:
+        """
+        Store the token with its expiry and drop the expired entries.
+        """
+        now = time.time()
+        expires_at = self.token_expiry(token) or now + self.default_ttl
+        with self._lock:
+            entries = {k: v for k, v in self._load().items() if v.get('expires_at', 0) > now}
+            entries[self.key(host, port, username)] = {'token': token, 'expires_at': expires_at}
+            self._save(entries)
+
+    def remove(self, host: str, port: int, username: str) -> None:
+        """
+        Forget the token, e.g. after logout or when the controller rejected it.
+        """
+        with self._lock:
+            entries = self._load()
+            if entries.pop(self.key(host, port, username), None) is not None:
+                self._save(entries)
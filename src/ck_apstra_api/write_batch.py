@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import logging
+from typing import Any, List
+from urllib.parse import urlencode
+
+from result import Result, Ok, Err
+
+
+class BatchOperation:
+    """
+    A write queued in a WriteBatcher. It stands in for the requests.Response of the write.
+    status_code, text and json() are set when the batch is flushed. status_code is None until then.
+    """
+
+    def __init__(self, method: str, path: str, payload: Any = None) -> None:
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.status_code = None
+        self.text = ''
+        self._json = None
+
+    @property
+    def spec(self) -> dict:
+        spec = {'method': self.method, 'path': self.path}
+        if self.payload is not None:
+            spec['payload'] = self.payload
+        return spec
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+    def json(self) -> Any:
+        return self._json
+
+    def __repr__(self) -> str:
+        return f"BatchOperation({self.method} {self.path} {self.status_code})"
+
+
+class WriteBatcher:
+    """
+    Queue the writes of a blueprint and send them as /batch requests of up to size operations.
+
+    Use it through CkApstraBlueprint.write_batch(). While it is active, patch_item, post_item, put_item and
+    delete_item of the blueprint queue the write and return a BatchOperation. The queue is flushed when full
+    and when leaving the context.
+
+        with bp.write_batch(size=100) as batch:
+            for x in items:
+                bp.patch_item(f"nodes/{x}", spec)
+        failed = batch.failed
+    """
+
+    def __init__(self, bp, size: int = 100, params: dict = None) -> None:
+        """
+        Args:
+            bp: The CkApstraBlueprint to write to
+            size: The maximum number of operations per /batch request
+            params: The query parameters of the /batch request
+        """
+        self.bp = bp
+        self.size = size
+        self.params = params
+        self.logger = logging.getLogger(f"WriteBatcher({bp.label})")
+        self.operations: List[BatchOperation] = []  # every operation queued, flushed or not
+        self._pending: List[BatchOperation] = []
+        self._previous = None
+        self.requests = 0  # the number of /batch requests made
+
+    def queue(self, method: str, item: str, payload: Any = None, params: dict = None) -> BatchOperation:
+        """
+        Queue a write to the blueprint relative url item.
+        The writes are made to the staging blueprint, so 'type': 'staging' is not carried over to the operation.
+        """
+        query = {k: v for k, v in (params or {}).items() if (k, v) != ('type', 'staging')}
+        path = f"/{item}?{urlencode(query)}" if query else f"/{item}"
+        operation = BatchOperation(method, path, payload)
+        self.operations.append(operation)
+        self._pending.append(operation)
+        if len(self._pending) >= self.size:
+            self.flush()
+        return operation
+
+    def flush(self) -> Result[int, str]:
+        """
+        Send the queued operations.
+
+        Returns:
+            The number of operations sent, or Err with the response of the failed /batch request
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return Ok(0)
+        response = self.bp.batch({'operations': [x.spec for x in pending]}, params=self.params)
+        self.requests += 1
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        # per operation results when the response has them in the same order.
+        # otherwise json() of the operations stays None, as the body of the batch is not of any one of them
+        entries = body.get('operations') if isinstance(body, dict) else None
+        if not isinstance(entries, list) or len(entries) != len(pending):
+            entries = [None] * len(pending)
+        for operation, entry in zip(pending, entries):
+            operation.status_code = response.status_code
+            operation.text = response.text
+            operation._json = entry
+        if not 200 <= response.status_code < 300:
+            self.logger.warning(f"batch of {len(pending)} failed: {response.status_code=} {response.text=}")
+            return Err(f"batch of {len(pending)} failed: {response.status_code=} {response.text=}")
+        return Ok(len(pending))
+
+    @property
+    def failed(self) -> List[BatchOperation]:
+        return [x for x in self.operations if x.status_code is not None and not x.ok]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'operations': len(self.operations),
+            'requests': self.requests,
+            'failed': len(self.failed),
+        }
+
+    def __enter__(self) -> 'WriteBatcher':
+        self._previous = self.bp.write_batcher
+        self.bp.write_batcher = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.bp.write_batcher = self._previous
+        # the writes queued before an exception are still sent, as they would have been without the batch
+        self.flush()
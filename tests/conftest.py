@@ -1,6 +1,11 @@
 import pytest
 import logging
-from ck_apstra_api import CkApstraSession
+from result import Err
+
+from ck_apstra_api import CkApstraSession, CkApstraBlueprint
+from ck_apstra_api.blueprint_snapshot import BlueprintSnapshot
+from ck_apstra_api.cache import LruCache
+from ck_apstra_api.graph_query import GraphQueryEngine
 
 logger = logging.getLogger(__name__)
 
@@ -88,3 +93,167 @@ def mock_sngle_vlan_cts_yaml_file():
 #     return Data().tor_bp_name
 
 
+
+
+class OfflineResponse:
+    """The requests.Response of the OfflineSession"""
+
+    def __init__(self, status_code: int, body=None) -> None:
+        self.status_code = status_code
+        self.body = body
+        self.text = '' if body is None else str(body)
+        self.ok = 200 <= status_code < 300
+
+    def json(self):
+        return self.body
+
+
+class OfflineHttp:
+    """
+    The http calls of the OfflineSession. /qe runs over the snapshot. The other calls are recorded
+    and answered by the handler of (method, path), or 202 with {}.
+    """
+
+    def __init__(self, engine: GraphQueryEngine, url_prefix: str) -> None:
+        self.engine = engine
+        self.url_prefix = url_prefix
+        self.requests = []  # [(method, path, json)] the path relative to the blueprint
+        self.handlers = {}  # { (method, path): handler(json) -> OfflineResponse }
+
+    def request(self, method: str, url: str, json=None, params=None) -> OfflineResponse:
+        path = url[len(self.url_prefix):]
+        self.requests.append((method, path, json))
+        if (method, path) in self.handlers:
+            return self.handlers[(method, path)](json)
+        if (method, path) == ('POST', '/qe'):
+            query_result = self.engine.query(json['query'])
+            if isinstance(query_result, Err):
+                return OfflineResponse(422, {'errors': query_result.err_value})
+            return OfflineResponse(200, {'items': query_result.ok_value})
+        return OfflineResponse(202, {})
+
+    def get(self, url: str, params=None) -> OfflineResponse:
+        return self.request('GET', url, None, params)
+
+    def post(self, url: str, json=None, params=None) -> OfflineResponse:
+        return self.request('POST', url, json, params)
+
+    def put(self, url: str, json=None, params=None) -> OfflineResponse:
+        return self.request('PUT', url, json, params)
+
+    def patch(self, url: str, json=None, params=None) -> OfflineResponse:
+        return self.request('PATCH', url, json, params)
+
+    def delete(self, url: str, params=None) -> OfflineResponse:
+        return self.request('DELETE', url, None, params)
+
+    def queries(self) -> list:
+        return [x[2]['query'] for x in self.requests if x[:2] == ('POST', '/qe')]
+
+
+class OfflineSession:
+    """CkApstraSession of one blueprint without the controller. diff-status answers staging_version"""
+
+    url_prefix = 'https://apstra/api'
+
+    def __init__(self, snapshot: BlueprintSnapshot) -> None:
+        self.summary = {'id': snapshot.id or snapshot.label, 'label': snapshot.label, 'design': 'two_stage_l3clos', 'version': 1}
+        self.session = OfflineHttp(GraphQueryEngine(snapshot), f"{self.url_prefix}/blueprints/{self.summary['id']}")
+        self.staging_version = 1  # None for a diff-status without it
+        self.gets = []
+        self.blueprint_summaries = None
+        self.blueprints = LruCache(4)
+
+    def find_blueprint_summary(self, label: str = None, id: str = None):
+        return self.summary if self.summary['label'] == label or self.summary['id'] == id else None
+
+    def delete_raw(self, delete_url: str):
+        return self.session.delete(delete_url)
+
+    def get_items(self, url: str):
+        self.gets.append(url)
+        if url.endswith('/diff-status'):
+            return {} if self.staging_version is None else {'staging_version': self.staging_version}
+        return {'items': []}
+
+
+@pytest.fixture
+def offline_blueprint():
+    """
+    Factory of a CkApstraBlueprint without the controller, over the snapshot of the nodes and the relationships
+    of (source id, type, target id). The calls are in bp.session.session.requests.
+    """
+    def make(nodes=(), relationships=(), snapshot: BlueprintSnapshot = None, label: str = 'bp1', **kwargs) -> CkApstraBlueprint:
+        if snapshot is None:
+            snapshot = BlueprintSnapshot({
+                'id': label,
+                'label': label,
+                'version': 1,
+                'nodes': {x['id']: x for x in nodes},
+                'relationships': {f"r{i}": {'id': f"r{i}", 'source_id': s, 'type': t, 'target_id': d} for i, (s, t, d) in enumerate(relationships)},
+            })
+        return CkApstraBlueprint(OfflineSession(snapshot), snapshot.label, **kwargs)
+    return make
+
+
+@pytest.fixture
+def generic_system_blueprint(offline_blueprint):
+    """
+    A blueprint without the controller: dual-1 in an ESI LAG to leaf1 and leaf2 with vn20,
+    single-1 on leaf1 with vn30.
+    """
+    nodes = [
+        {'id': 'leaf1', 'type': 'system', 'label': 'leaf1', 'system_type': 'switch'},
+        {'id': 'leaf2', 'type': 'system', 'label': 'leaf2', 'system_type': 'switch'},
+        {'id': 'dual-1', 'type': 'system', 'label': 'dual-1', 'system_type': 'server', 'external': False, 'deploy_mode': 'deploy'},
+        {'id': 'single-1', 'type': 'system', 'label': 'single-1', 'system_type': 'server', 'external': False, 'deploy_mode': None},
+        {'id': 'leaf1-et1', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'et-0/0/1'},
+        {'id': 'leaf1-et2', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'et-0/0/2'},
+        {'id': 'leaf2-et1', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'et-0/0/1'},
+        {'id': 'leaf1-ae1', 'type': 'interface', 'if_type': 'port_channel', 'if_name': 'ae1', 'lag_mode': 'lacp_active'},
+        {'id': 'leaf2-ae1', 'type': 'interface', 'if_type': 'port_channel', 'if_name': 'ae1', 'lag_mode': 'lacp_active'},
+        {'id': 'evpn1', 'type': 'interface', 'if_type': 'port_channel', 'po_control_protocol': 'evpn', 'if_name': None},
+        {'id': 'dual-1-eth0', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'eth0'},
+        {'id': 'dual-1-eth1', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'eth1'},
+        {'id': 'single-1-eth0', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'eth0'},
+        {'id': 'link1', 'type': 'link', 'speed': '10G'},
+        {'id': 'link2', 'type': 'link', 'speed': '10G'},
+        {'id': 'link3', 'type': 'link', 'speed': '25G'},
+        {'id': 'tag-dual', 'type': 'tag', 'label': 'dual'},
+        {'id': 'tag-forceup', 'type': 'tag', 'label': 'forceup'},
+        {'id': 'ct-vn20', 'type': 'ep_endpoint_policy', 'policy_type_name': 'batch', 'label': 'vn20'},
+        {'id': 'ct-vn30', 'type': 'ep_endpoint_policy', 'policy_type_name': 'batch', 'label': 'vn30'},
+        {'id': 'ai-1', 'type': 'ep_application_instance'},
+        {'id': 'ai-2', 'type': 'ep_application_instance'},
+        {'id': 'group-1', 'type': 'ep_group'},
+        {'id': 'group-2', 'type': 'ep_group'},
+    ]
+    relationships = [
+        ('leaf1', 'hosted_interfaces', 'leaf1-et1'),
+        ('leaf1', 'hosted_interfaces', 'leaf1-et2'),
+        ('leaf1', 'hosted_interfaces', 'leaf1-ae1'),
+        ('leaf2', 'hosted_interfaces', 'leaf2-et1'),
+        ('leaf2', 'hosted_interfaces', 'leaf2-ae1'),
+        ('leaf1-ae1', 'composed_of', 'leaf1-et1'),
+        ('leaf2-ae1', 'composed_of', 'leaf2-et1'),
+        ('evpn1', 'composed_of', 'leaf1-ae1'),
+        ('evpn1', 'composed_of', 'leaf2-ae1'),
+        ('dual-1', 'hosted_interfaces', 'dual-1-eth0'),
+        ('dual-1', 'hosted_interfaces', 'dual-1-eth1'),
+        ('single-1', 'hosted_interfaces', 'single-1-eth0'),
+        ('leaf1-et1', 'link', 'link1'),
+        ('dual-1-eth0', 'link', 'link1'),
+        ('leaf2-et1', 'link', 'link2'),
+        ('dual-1-eth1', 'link', 'link2'),
+        ('leaf1-et2', 'link', 'link3'),
+        ('single-1-eth0', 'link', 'link3'),
+        ('tag-dual', 'tag', 'dual-1'),
+        ('tag-forceup', 'tag', 'link1'),
+        ('ai-1', 'ep_nested', 'ct-vn20'),
+        ('ai-1', 'ep_affected_by', 'group-1'),
+        ('evpn1', 'ep_member_of', 'group-1'),
+        ('ai-2', 'ep_nested', 'ct-vn30'),
+        ('ai-2', 'ep_affected_by', 'group-2'),
+        ('leaf1-et2', 'ep_member_of', 'group-2'),
+    ]
+    return offline_blueprint(nodes, relationships)
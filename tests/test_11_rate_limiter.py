@@ -0,0 +1,22 @@
+from ck_apstra_api import CkRateLimiter
+
+
+def test_11_retry_after():
+    assert CkRateLimiter.parse_retry_after(None) == 0.0
+    assert CkRateLimiter.parse_retry_after('3') == 3.0
+    assert CkRateLimiter.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert CkRateLimiter.parse_retry_after('garbage') == 0.0
+
+
+def test_11_throttle_and_ramp_up():
+    limiter = CkRateLimiter(max_rate=10.0, burst=10, backoff_base=0.01, backoff_max=0.02)
+    assert limiter.acquire() == 0
+    delay = limiter.on_throttled(None, 0)
+    assert 0.005 <= delay <= 0.01
+    assert limiter.rate == 5.0
+    assert limiter.acquire() > 0
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == 10.0
+    assert limiter.stats['throttled'] == 1
+    assert limiter.stats['requests'] == 2
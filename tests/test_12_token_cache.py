@@ -0,0 +1,29 @@
+import base64
+import json
+import os
+import time
+
+from ck_apstra_api import CkTokenCache
+
+
+def make_jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+    return f"header.{payload}.signature"
+
+
+def test_12_token_cache(tmp_path):
+    cache = CkTokenCache(path=str(tmp_path / 'tokens.json'))
+    assert cache.get('10.0.0.1', 443, 'admin') is None
+
+    token = make_jwt(time.time() + 3600)
+    cache.put('10.0.0.1', 443, 'admin', token)
+    assert cache.get('10.0.0.1', 443, 'admin') == token
+    assert cache.get('10.0.0.1', 443, 'other') is None
+    assert oct(os.stat(cache.path).st_mode & 0o777) == '0o600'
+
+    # about to expire
+    cache.put('10.0.0.2', 443, 'admin', make_jwt(time.time() + 10))
+    assert cache.get('10.0.0.2', 443, 'admin') is None
+
+    cache.remove('10.0.0.1', 443, 'admin')
+    assert cache.get('10.0.0.1', 443, 'admin') is None
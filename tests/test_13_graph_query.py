@@ -0,0 +1,80 @@
+from result import Ok
+
+from ck_apstra_api.blueprint_snapshot import BlueprintSnapshot
+from ck_apstra_api.graph_query import GraphQueryEngine
+
+
+def make_snapshot() -> BlueprintSnapshot:
+    nodes = [
+        {'id': 'leaf1', 'type': 'system', 'label': 'leaf1', 'system_type': 'switch'},
+        {'id': 'srv1', 'type': 'system', 'label': 'srv1', 'system_type': 'server'},
+        {'id': 'srv2', 'type': 'system', 'label': 'srv2', 'system_type': 'server'},
+        {'id': 'sw-et1', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'et-0/0/1'},
+        {'id': 'sw-et2', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'et-0/0/2'},
+        {'id': 'srv1-eth0', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'eth0'},
+        {'id': 'srv2-eth0', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'eth0'},
+        {'id': 'sw-ae1', 'type': 'interface', 'if_type': 'port_channel', 'if_name': 'ae1'},
+        {'id': 'link1', 'type': 'link', 'link_type': 'ethernet'},
+        {'id': 'link2', 'type': 'link', 'link_type': 'ethernet'},
+        {'id': 'tag1', 'type': 'tag', 'label': 'forty'},
+        {'id': 'vn1', 'type': 'virtual_network', 'label': 'vn100', 'vn_id': '100'},
+    ]
+    relationships = [
+        ('leaf1', 'hosted_interfaces', 'sw-et1'),
+        ('leaf1', 'hosted_interfaces', 'sw-et2'),
+        ('leaf1', 'hosted_interfaces', 'sw-ae1'),
+        ('sw-ae1', 'composed_of', 'sw-et1'),
+        ('srv1', 'hosted_interfaces', 'srv1-eth0'),
+        ('srv2', 'hosted_interfaces', 'srv2-eth0'),
+        ('sw-et1', 'link', 'link1'),
+        ('srv1-eth0', 'link', 'link1'),
+        ('sw-et2', 'link', 'link2'),
+        ('srv2-eth0', 'link', 'link2'),
+        ('tag1', 'tag', 'link1'),
+    ]
+    return BlueprintSnapshot({
+        'id': 'bp1',
+        'label': 'bp1',
+        'version': 1,
+        'nodes': {x['id']: x for x in nodes},
+        'relationships': {f"r{i}": {'id': f"r{i}", 'source_id': s, 'type': t, 'target_id': d} for i, (s, t, d) in enumerate(relationships)},
+    })
+
+
+def test_13_graph_query():
+    engine = GraphQueryEngine(make_snapshot())
+
+    # a path with a constant, an is_in() and a backward edge
+    result = engine.query("""
+        node('system', label=is_in(['srv1', 'srv2']), name='server')
+            .out('hosted_interfaces').node('interface', name='server_intf')
+            .out('link').node('link', name='link')
+            .in_('link').node('interface', if_type='ethernet', name='switch_intf')
+            .in_('hosted_interfaces').node('system', system_type='switch', name='switch')
+    """)
+    assert isinstance(result, Ok)
+    pairs = sorted((x['server']['label'], x['switch_intf']['if_name']) for x in result.ok_value)
+    assert pairs == [('srv1', 'et-0/0/1'), ('srv2', 'et-0/0/2')]
+
+    # optional() keeps the row with None, distinct() projects and dedups
+    result = engine.query("""
+        match(
+            node('system', label='leaf1', name='switch').out('hosted_interfaces').node('interface', if_type='ethernet', name='intf'),
+            optional(node(name='intf').in_('composed_of').node('interface', name='ae')),
+            optional(node(name='intf').out('link').node('link', name='link').in_('tag').node('tag', name='tag'))
+        ).distinct(['intf', 'ae', 'tag'])
+    """)
+    rows = {x['intf']['id']: x for x in result.ok_value}
+    assert set(rows) == {'sw-et1', 'sw-et2'}
+    assert rows['sw-et1']['ae']['id'] == 'sw-ae1' and rows['sw-et1']['tag']['label'] == 'forty'
+    assert rows['sw-et2']['ae'] is None and rows['sw-et2']['tag'] is None
+    assert set(rows['sw-et1']) == {'intf', 'ae', 'tag'}
+
+    # numbers compare with the string properties, the items do not share the snapshot nodes
+    items = engine.query("node('virtual_network', vn_id=100, name='vn')").ok_value
+    assert [x['vn']['label'] for x in items] == ['vn100']
+    items[0]['vn']['label'] = 'changed'
+    assert engine.snapshot.node('vn1')['label'] == 'vn100'
+
+    # out of the subset
+    assert not isinstance(engine.query("node('system', name='s').where(lambda s: s)"), Ok)
@@ -0,0 +1,35 @@
+from .conftest import OfflineResponse
+
+
+def test_14_write_batch(offline_blueprint):
+    # the /batch requests are recorded
+    bp = offline_blueprint()
+    http = bp.session.session
+    http.handlers[('POST', '/batch')] = lambda batch_spec: OfflineResponse(
+        202, {'operations': [{'id': f"id-{i}"} for i, _ in enumerate(batch_spec['operations'])]})
+
+    def batch_specs():
+        return [x[2] for x in http.requests if x[:2] == ('POST', '/batch')]
+
+    with bp.write_batch(size=2) as write_batch:
+        patched = bp.patch_item('nodes/a', {'deploy_mode': 'deploy'})
+        assert patched.status_code is None
+        posted = bp.post_item('external_endpoints', {'label': 'x'}, params={'type': 'staging'})
+        # flushed by the size
+        assert len(batch_specs()) == 1 and patched.status_code == 202
+        deleted = bp.delete_item('remote_gateways/b', params={'async': 'full'})
+    assert bp.write_batcher is None
+    assert len(batch_specs()) == 2
+    assert batch_specs()[0]['operations'] == [
+        {'method': 'PATCH', 'path': '/nodes/a', 'payload': {'deploy_mode': 'deploy'}},
+        {'method': 'POST', 'path': '/external_endpoints', 'payload': {'label': 'x'}},
+    ]
+    assert batch_specs()[1]['operations'] == [{'method': 'DELETE', 'path': '/remote_gateways/b?async=full'}]
+    assert posted.json() == {'id': 'id-1'} and deleted.ok
+    assert write_batch.stats == {'operations': 3, 'requests': 2, 'failed': 0}
+
+    # no per operation results. The id of the batch is not taken as the id of each operation
+    http.handlers[('POST', '/batch')] = lambda batch_spec: OfflineResponse(202, {'id': 'batch-1'})
+    with bp.write_batch() as write_batch:
+        posted = bp.post_item('external_endpoints', {'label': 'y'}, params={'type': 'staging'})
+    assert posted.ok and posted.json() is None
@@ -0,0 +1,55 @@
+from result import Ok, Err
+
+from ck_apstra_api.task_tracker import TaskTracker
+
+from .conftest import OfflineResponse
+
+
+class TaskBlueprint:
+    """The tasks collection of a blueprint. Each task is done after its number of polls"""
+
+    def __init__(self, tasks: dict) -> None:
+        self.label = 'bp1'
+        self.tasks = tasks  # { task id: (polls to be done, final status) }
+        self.gets = []
+
+    def get_item(self, item: str):
+        self.gets.append(item)
+        if item == 'tasks':
+            items = []
+            for task_id, (polls, status) in self.tasks.items():
+                self.tasks[task_id] = (polls - 1, status)
+                items.append({'id': task_id, 'status': status if polls <= 1 else 'in_progress'})
+            return {'items': items}
+        task_id = item.split('/')[1]
+        return {'id': task_id, 'status': self.tasks[task_id][1], 'detailed_status': {'errors': 'bad'}}
+
+
+def test_16_task_tracker():
+    bp = TaskBlueprint({'t1': (1, 'succeeded'), 't2': (3, 'succeeded')})
+    tracker = TaskTracker(bp, timeout=5, initial_delay=0.01, max_delay=0.02)
+    assert tracker.register({'task_id': 't1'}) == 't1'
+    assert tracker.register(None) is None
+    tracker.register('t2')
+    waited = tracker.wait_all()
+    assert isinstance(waited, Ok) and set(waited.ok_value) == {'t1', 't2'}
+    # both tasks in one GET per round
+    assert bp.gets == ['tasks', 'tasks', 'tasks']
+    assert tracker.pending == []
+
+    bp = TaskBlueprint({'t3': (1, 'failed'), 't4': (100, 'succeeded')})
+    tracker = TaskTracker(bp, timeout=0.05, initial_delay=0.01, max_delay=0.02)
+    waited = tracker.wait(['t3', 't4'])
+    assert isinstance(waited, Err) and "'t3': {'errors': 'bad'}" in waited.err_value and "['t4']" in waited.err_value
+    assert tracker.stats['failed'] == 1 and tracker.stats['succeeded'] == 0
+
+
+def test_16_delete_self_timeout(offline_blueprint):
+    bp = offline_blueprint()
+    http = bp.session.session
+    # still present
+    http.handlers[('GET', '/diff-status')] = lambda json: OfflineResponse(200, {})
+    assert bp.delete_self(timeout=0) is False
+    http.handlers[('GET', '/diff-status')] = lambda json: OfflineResponse(404, {})
+    assert bp.delete_self(timeout=0) is True
+    assert [x[:2] for x in http.requests] == [('DELETE', ''), ('GET', '/diff-status'), ('DELETE', ''), ('GET', '/diff-status')]
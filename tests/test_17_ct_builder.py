@@ -0,0 +1,28 @@
+from ck_apstra_api.blueprint_snapshot import BlueprintSnapshot
+from ck_apstra_api.connectivity_template import CtBuilder
+
+from .test_13_graph_query import make_snapshot
+
+
+def test_17_ct_builder(offline_blueprint):
+    snapshot = make_snapshot()
+    nodes = {**snapshot.nodes, 'ct1': {'id': 'ct1', 'type': 'ep_endpoint_policy', 'policy_type_name': 'batch', 'label': 'vn100'}}
+    bp = offline_blueprint(snapshot=BlueprintSnapshot({'id': 'bp1', 'label': 'bp1', 'nodes': nodes, 'relationships': {}}))
+    http = bp.session.session
+    builder = CtBuilder(bp, chunk_size=2)
+    builder.add_single_vlan('vn100', 100, is_tagged=True)  # present
+    builder.add_single_vlan('vn100-untagged', 100, is_tagged=False)
+    builder.add_single_vlan('vn200', 200, is_tagged=True)  # no such vni
+    builder.add_ip_link('iplink-1', 'sz1', 'tagged', 11, 9100, 'numbered', 'none')
+    builder.add_ip_link('iplink-2', 'sz1', 'tagged', 12, 9100, 'numbered', 'none')
+    results = list(builder.build())
+    assert [x.is_ok() for x in results] == [True, False, True, True]
+    # one query for the labels, one for the vnis
+    assert len(http.queries()) == 2
+    puts = [x[2] for x in http.requests if x[:2] == ('PUT', '/obj-policy-import')]
+    assert [[x['label'] for x in spec['policies'] if x['policy_type_name'] == 'batch'] for spec in puts] == [
+        ['vn100-untagged', 'iplink-1'], ['iplink-2']]
+    single_vlan = [x for x in puts[0]['policies'] if x['policy_type_name'] == 'AttachSingleVLAN'][0]
+    assert single_vlan['attributes'] == {'vn_node_id': 'vn1', 'tag_type': 'untagged'}
+    pipeline = [x for x in puts[0]['policies'] if x['policy_type_name'] == 'pipeline'][0]
+    assert pipeline['attributes']['first_subpolicy'] == single_vlan['id']
@@ -0,0 +1,40 @@
+from .conftest import OfflineResponse
+
+
+def test_18_blueprint_catalog(offline_blueprint):
+    bp = offline_blueprint([
+        {'id': 'sz1', 'type': 'security_zone', 'label': 'blue', 'vrf_name': 'blue'},
+        {'id': 'rp1', 'type': 'routing_policy', 'label': 'Default_immutable'},
+        {'id': 'vn1', 'type': 'virtual_network', 'label': 'vn100', 'vn_id': '100'},
+        {'id': 'ct1', 'type': 'ep_endpoint_policy', 'policy_type_name': 'batch', 'label': 'vn100'},
+        {'id': 'ct1-pipeline', 'type': 'ep_endpoint_policy', 'policy_type_name': 'pipeline', 'label': 'vn100'},
+    ], version_ttl=0)
+    http = bp.session.session
+    catalog = bp.catalog
+    assert catalog.id('security_zone', 'blue') == 'sz1'
+    assert catalog.id('security_zone', 'red') is None
+    assert catalog.id('routing_policy', 'Default_immutable') == 'rp1'
+    assert catalog.id('virtual_network', 100, key='vn_id') == 'vn1'
+    assert catalog.label('virtual_network', 'vn1') == 'vn100'
+    assert catalog.ids('connectivity_template', ['vn100', 'vn200']) == ['ct1']
+    # one query per kind
+    assert len(http.queries()) == 4
+    assert catalog.stats['loads'] == 4 and catalog.stats['misses'] == 2
+
+    # reloaded on the next version
+    bp.session.staging_version = 2
+    assert catalog.id('security_zone', 'blue') == 'sz1'
+    assert len(http.queries()) == 5
+    assert catalog.stats['refreshes'] == 1 and catalog.stats['sizes'] == {'security_zone': 1}
+
+    catalog.invalidate()
+    catalog.id('security_zone', 'blue')
+    assert catalog.stats['loads'] == 6
+
+    # a failed query is reported and loaded again on the next lookup
+    http.handlers[('POST', '/qe')] = lambda json: OfflineResponse(500, {'errors': 'timeout'})
+    assert 'routing_policy not loaded' in catalog.load('routing_policy').err_value
+    assert catalog.id('routing_policy', 'Default_immutable') is None
+    assert 'connectivity_template not loaded' in bp.get_ct_ids(['vn100']).err_value
+    del http.handlers[('POST', '/qe')]
+    assert catalog.id('routing_policy', 'Default_immutable') == 'rp1'
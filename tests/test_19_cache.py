@@ -0,0 +1,86 @@
+from result import Ok, Err
+
+from ck_apstra_api.cache import LruCache, cached_method, clear_method_caches, method_cache_stats
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Lookup:
+    def __init__(self) -> None:
+        self.calls = []
+
+    @cached_method(maxsize=2, cache_if=lambda x: isinstance(x, Ok))
+    def ids(self, labels: list):
+        self.calls.append(labels)
+        return Ok([f"id-{x}" for x in labels]) if labels else Err('no labels')
+
+
+def test_19_lru_cache_ttl():
+    clock = Clock()
+    cache = LruCache(2, ttl=10, clock=clock)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    clock.now = 11
+    assert cache.get('a') is LruCache.MISSING
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('c', 3)
+    assert cache.get('a', None) is None
+    assert cache.invalidate('b') and not cache.invalidate('b')
+    assert cache.stats == {'hits': 1, 'misses': 2, 'evictions': 1, 'expirations': 1, 'size': 1, 'maxsize': 2, 'ttl': 10}
+
+
+def test_19_cached_method():
+    first, second = Lookup(), Lookup()
+    # the list arguments are frozen into the key
+    assert first.ids(['a', 'b']).ok_value == ['id-a', 'id-b']
+    assert first.ids(['a', 'b']).ok_value == ['id-a', 'id-b']
+    assert first.ids([]).is_err() and first.ids([]).is_err()
+    assert first.calls == [['a', 'b'], [], []]
+    # per object
+    second.ids(['a', 'b'])
+    assert len(second.calls) == 1
+    assert method_cache_stats(first) == {'Lookup.ids': {
+        'hits': 1, 'misses': 3, 'evictions': 0, 'expirations': 0, 'size': 1, 'maxsize': 2, 'ttl': None}}
+
+    clear_method_caches(first)
+    first.ids(['a', 'b'])
+    assert len(first.calls) == 4
+
+
+def test_19_query_cache(offline_blueprint):
+    bp = offline_blueprint([{'id': 'sz1', 'type': 'security_zone', 'label': 'blue'}], version_ttl=0)
+    session, http = bp.session, bp.session.session
+    sz_query = "node('security_zone', name='sz')"
+    vn_query = "node('virtual_network', name='vn')"
+    # the version is pulled once to be known
+    assert bp.query(sz_query).ok_value[0]['sz']['id'] == 'sz1'
+    assert len(session.gets) == 1 and len(http.queries()) == 1
+    # a miss is not checked against the version
+    bp.query(vn_query)
+    assert len(session.gets) == 1 and len(http.queries()) == 2
+    # a hit is, after version_ttl
+    bp.query(sz_query)
+    assert len(session.gets) == 2 and len(http.queries()) == 2
+
+    # a write drops the entries without pulling the version again
+    bp.patch_item('nodes/sz1', {'label': 'red'})
+    bp.query(sz_query)
+    assert len(session.gets) == 2 and len(http.queries()) == 3
+    # another version
+    session.staging_version = 2
+    bp.query(sz_query)
+    assert len(http.queries()) == 4
+
+    # not cached without the version
+    bp = offline_blueprint([{'id': 'sz1', 'type': 'security_zone', 'label': 'blue'}])
+    bp.session.staging_version = None
+    bp.query(sz_query)
+    bp.query(sz_query)
+    assert len(bp.session.session.queries()) == 2 and len(bp.query_cache) == 0
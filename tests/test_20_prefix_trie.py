@@ -0,0 +1,45 @@
+import ipaddress
+import random
+
+from ck_apstra_api import prefix_trie
+from ck_apstra_api.prefix_trie import PrefixTrie
+
+
+def test_20_prefix_trie():
+    trie = PrefixTrie()
+    assert trie.insert('10.0.0.0/8', 'vn8')
+    assert trie.insert('10.1.0.0/16', 'vn16')
+    assert not trie.insert('10.1.0.0/16', 'other')
+    assert not trie.insert('2001:db8::/32', 'v6')
+    assert len(trie) == 2
+    assert trie.longest_match('10.1.2.3/32') == 'vn16'
+    assert trie.longest_match('10.1.2.3') == 'vn16'
+    assert trie.longest_match('10.2.0.0/16') == 'vn8'
+    # a supernet of the network is not internal
+    assert trie.longest_match('10.0.0.0/7') is None
+    assert trie.longest_match('192.168.0.1/32') is None
+    assert trie.longest_match('2001:db8::1/128') is None
+    assert trie.longest_match('not-an-address', 'x') == 'x'
+
+
+def test_20_prefix_trie_match_many(monkeypatch):
+    rng = random.Random(20)
+    networks = {str(ipaddress.ip_network(f"10.{rng.randrange(256)}.{rng.randrange(256)}.0/{rng.choice([16, 20, 24])}", strict=False)) for _ in range(200)}
+    trie = PrefixTrie()
+    for network in networks:
+        trie.insert(network, network)
+    prefixes = [f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}/{rng.choice([16, 24, 28, 32])}" for _ in range(500)]
+    prefixes += ['2001:db8::/64', 'bad']
+    expected = []
+    for prefix in prefixes:
+        try:
+            this_network = ipaddress.ip_network(prefix, strict=False)
+        except ValueError:
+            expected.append(None)
+            continue
+        containing = [ipaddress.ip_network(x) for x in networks if this_network.version == 4 and this_network.subnet_of(ipaddress.ip_network(x))]
+        expected.append(str(max(containing, key=lambda x: x.prefixlen)) if containing else None)
+    assert trie.match_many(prefixes) == expected
+    # the same without numpy
+    monkeypatch.setattr(prefix_trie, 'np', None)
+    assert trie.match_many(prefixes) == expected
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ck_apstra_api.apstra_async_session import CkApstraAsyncSession
+
+
+class SyncSession:
+    """The blocking calls of CkApstraSession. Each call takes delay seconds"""
+
+    def __init__(self, delay: float = 0.02) -> None:
+        self.delay = delay
+        self.pool_size = None
+        self.in_flight = 0
+        self.max_seen = 0
+        self.lock = threading.Lock()
+
+    def set_pool_size(self, pool_size: int) -> None:
+        self.pool_size = pool_size
+
+    def get_items(self, url: str) -> dict:
+        with self.lock:
+            self.in_flight += 1
+            self.max_seen = max(self.max_seen, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if url == 'bad':
+            raise ValueError(url)
+        return {'items': [url]}
+
+
+def test_21_async_session_in_flight():
+    session = SyncSession()
+
+    async def main():
+        async with CkApstraAsyncSession(session, max_in_flight=3) as async_session:
+            return await async_session.gather(*[async_session.get_items(f"url{i}") for i in range(10)])
+
+    results = asyncio.run(main())
+    # in the given order, at most max_in_flight at once
+    assert results == [{'items': [f"url{i}"]} for i in range(10)]
+    assert session.max_seen == 3 and session.pool_size == 3
+
+
+def test_21_async_session_exception():
+    session = SyncSession(delay=0)
+
+    async def main():
+        async with CkApstraAsyncSession(session, max_in_flight=2) as async_session:
+            # the sync session is called with the arguments of run()
+            assert await async_session.run(session.get_items, url='url1') == {'items': ['url1']}
+            await async_session.get_items('bad')
+
+    with pytest.raises(ValueError, match='bad'):
+        asyncio.run(main())
+
+
+def test_21_async_blueprint(offline_blueprint):
+    bp = offline_blueprint([{'id': 'sz1', 'type': 'security_zone', 'label': 'blue'}])
+
+    async def main():
+        async with CkApstraAsyncSession(SyncSession(), max_in_flight=2) as async_session:
+            async_bp = async_session.blueprint(bp)
+            assert (async_bp.id, async_bp.label) == (bp.id, 'bp1')
+            return await async_session.gather(
+                async_bp.query("node('security_zone', name='sz')"),
+                async_bp.patch_item('nodes/sz1', {'label': 'red'}))
+
+    queried, patched = asyncio.run(main())
+    assert queried.ok_value[0]['sz']['label'] == 'blue'
+    assert patched.status_code == 202
+    assert ('PATCH', '/nodes/sz1', {'label': 'red'}) in bp.session.session.requests
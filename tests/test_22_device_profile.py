@@ -0,0 +1,43 @@
+from ck_apstra_api.device_profile import DeviceProfileCatalog
+
+
+def port(port_id: int, transformations: list) -> dict:
+    return {'port_id': port_id, 'transformations': [
+        {'transformation_id': transformation_id, 'interfaces': [{'name': name, 'speed': {'unit': unit, 'value': value}} for name, value, unit in interfaces]}
+        for transformation_id, interfaces in transformations]}
+
+
+class ProfileSession:
+    """The device profiles of the controller. get_items is recorded"""
+
+    def __init__(self) -> None:
+        self.gets = []
+        self.profiles = {
+            'dp1': {'id': 'dp1', 'ports': [
+                port(1, [(1, [('et-0/0/0', 100, 'G')]), (2, [('et-0/0/0:0', 25, 'G'), ('et-0/0/0:1', 25, 'G')])]),
+                # the same interface with the same speed in another transformation
+                port(2, [(1, [('et-0/0/1', 100, 'G')]), (3, [('et-0/0/1', 100, 'g')])]),
+            ]},
+        }
+
+    def get_items(self, url: str) -> dict:
+        self.gets.append(url)
+        return self.profiles.get(url.split('/')[-1], {'errors': 'not found'})
+
+
+def test_22_device_profile_catalog():
+    session = ProfileSession()
+    catalog = DeviceProfileCatalog(session)
+    assert catalog.transformation_id('dp1', 'et-0/0/0', '100g').ok_value == 1
+    assert catalog.transformation_id('dp1', 'et-0/0/0:1', '25G').ok_value == 2
+    # the first transformation in the port order
+    assert catalog.transformation_id('dp1', 'et-0/0/1', '100G').ok_value == 1
+    assert 'transformation not found' in catalog.transformation_id('dp1', 'et-0/0/0', '25G').err_value
+    # one pull per device profile
+    assert session.gets == ['device-profiles/dp1']
+    assert catalog.get('dp1').ok_value['id'] == 'dp1'
+
+    # not kept when not loaded
+    assert 'dp2 not loaded' in catalog.transformation_id('dp2', 'et-0/0/0', '100G').err_value
+    assert catalog.get('dp2').is_err() and catalog.get(None).is_err()
+    assert session.gets == ['device-profiles/dp1', 'device-profiles/dp2', 'device-profiles/dp2']
@@ -0,0 +1,69 @@
+from ck_apstra_api import prefix_trie
+from ck_apstra_api.ip_endpoint import PrefixListCollection, add_ip_endpoints
+
+from .conftest import OfflineResponse
+
+
+SET_LINES = [
+    'set policy-options prefix-list pl-a 192.168.0.1/32',
+    'set policy-options prefix-list pl-a 10.1.2.3/32',
+    'set policy-options prefix-list pl-b 192.168.0.2/32',
+    'set policy-options prefix-list pl-b 172.16.0.0/24',
+    'set policy-options prefix-list pl-c',
+    'set interfaces et-0/0/1 unit 0 family inet address 10.1.0.1/16',
+]
+
+
+def endpoint_blueprint(offline_blueprint):
+    """vn1 of 10.1.0.0/16. 192.168.0.1 in the group pl-a, 192.168.0.2 without a group"""
+    return offline_blueprint([
+        {'id': 'vn1', 'type': 'virtual_network', 'label': 'vn1', 'ipv4_subnet': '10.1.0.0/16'},
+        {'id': 'vn2', 'type': 'virtual_network', 'label': 'vn2', 'ipv4_subnet': None},
+        {'id': 'ep1', 'type': 'ip_endpoint', 'endpoint_type': 'external', 'label': 'pl-a-192.168.0.1', 'ipv4_addr': '192.168.0.1/32'},
+        {'id': 'ep2', 'type': 'ip_endpoint', 'endpoint_type': 'external', 'label': 'ep2', 'ipv4_addr': '192.168.0.2/32'},
+        {'id': 'g1', 'type': 'group', 'label': 'pl-a'},
+    ], [('ep1', 'member_of', 'g1')])
+
+
+def test_23_add_ip_endpoints(offline_blueprint, tmp_path):
+    bp = endpoint_blueprint(offline_blueprint)
+    http = bp.session.session
+    http.handlers[('POST', '/batch')] = lambda batch_spec: OfflineResponse(
+        202, {'operations': [{'id': f"new-{x['payload']['ipv4_addr']}"} if 'endpoints' in x['path'] else {} for x in batch_spec['operations']]})
+    set_file = tmp_path / 'config.set'
+    set_file.write_text('\n'.join(SET_LINES) + '\n')
+    prefix_list_collection = PrefixListCollection(bp)
+    prefix_list_collection.read_from_set(str(set_file))
+    add_ip_endpoints(bp, prefix_list_collection)
+
+    # the endpoints in one /batch request, then the groups in another
+    batches = [x[2]['operations'] for x in http.requests if x[:2] == ('POST', '/batch')]
+    assert [[(x['method'], x['path']) for x in operations] for operations in batches] == [
+        [('POST', '/internal_endpoints'), ('POST', '/external_endpoints')],
+        [('PUT', '/groups/g1'), ('POST', '/groups')]]
+    assert batches[0][0]['payload']['vn_id'] == 'vn1'
+    assert batches[1][0]['payload']['members'] == ['new-10.1.2.3/32', 'ep1']
+    assert batches[1][1]['payload']['label'] == 'pl-b' and batches[1][1]['payload']['members'] == ['ep2', 'new-172.16.0.0/24']
+
+
+def test_23_prefix_list_collection(offline_blueprint, tmp_path, monkeypatch):
+    bp = endpoint_blueprint(offline_blueprint)
+    prefix_list_collection = PrefixListCollection(bp)
+    # the vn without a subnet is not in the trie
+    assert len(prefix_list_collection.vn_trie) == 1
+    prefix_list_collection.add('pl-d', '10.1.255.0/24')
+    prefix_list_collection.add('pl-d', '10.0.0.0/8')  # a supernet of vn1
+    prefix_list_collection.add('pl-d', '10.2.0.1/32', vn_id='vn9')  # given
+    assert {k: v.vn_id for k, v in prefix_list_collection.named_prefix_lists['pl-d'].iteritems()} == {
+        '10.1.255.0/24': 'vn1', '10.0.0.0/8': None, '10.2.0.1/32': 'vn9'}
+
+    set_file = tmp_path / 'config.set'
+    set_file.write_text('\n'.join(SET_LINES) + '\n')
+    expected = {'pl-a': {'192.168.0.1/32': None, '10.1.2.3/32': 'vn1'}, 'pl-b': {'192.168.0.2/32': None, '172.16.0.0/24': None}}
+    prefix_list_collection.read_from_set(str(set_file))
+    assert {k: {x: y.vn_id for x, y in v.iteritems()} for k, v in prefix_list_collection.iteritems() if k != 'pl-d'} == expected
+    # the same without numpy
+    monkeypatch.setattr(prefix_trie, 'np', None)
+    prefix_list_collection = PrefixListCollection(bp)
+    prefix_list_collection.read_from_set(str(set_file))
+    assert {k: {x: y.vn_id for x, y in v.iteritems()} for k, v in prefix_list_collection.iteritems()} == expected
@@ -0,0 +1,217 @@
+import csv
+import json
+from dataclasses import asdict
+
+from result import Ok, Err
+
+from ck_apstra_api.generic_system import GenericSystem, GenericSystemImport, PlanStage, ServerBlueprint, SwitchInterfaceIndex, chunk_generic_system_rows, JOURNAL_DONE
+from ck_apstra_api.import_journal import ImportJournal
+
+from .conftest import OfflineResponse
+
+
+def yield_results(results, messages: list):
+    """Collect the messages of the generator into messages and return its return value"""
+    while True:
+        try:
+            messages.append(next(results))
+        except StopIteration as stop:
+            return stop.value
+
+
+def load_generic_system(server: str) -> GenericSystem:
+    with open('tests/fixtures/gs_sample.csv', 'r') as csvfile:
+        rows = [x for x in csv.DictReader(csvfile) if x['server'] == server]
+    generic_system = GenericSystem(rows[0])
+    for row in rows:
+        generic_system.load_link_group(row)
+    return generic_system
+
+
+def test_41_generic_system_plan():
+    # absent in the blueprint
+    generic_system = load_generic_system('dual-home-1')
+    plan = generic_system.plan('_mock')
+    stages = [x.stage for x in plan]
+    assert stages[0] == PlanStage.CREATE_SYSTEM
+    assert plan[0].detail['links'] == ['server_1:xe-0/0/12:10G', 'server_2:xe-0/0/12:10G']
+    lag = [x for x in plan if x.stage == PlanStage.FORM_LAG]
+    assert len(lag) == 1 and lag[0].detail == {'ae': 'ae101', 'lag_mode': 'lacp_active', 'links': ['server_1:xe-0/0/12', 'server_2:xe-0/0/12']}
+    assert [x.detail['ct_names'] for x in plan if x.stage == PlanStage.ADD_CTS] == [['vn20', 'vn101']]
+    assert PlanStage.PATCH_SYSTEM not in stages
+    # serializable for the dry run
+    assert json.loads(json.dumps([asdict(x) for x in plan]))[0]['stage'] == 'create_system'
+
+    # present in the blueprint with the LAG, one CT to swap and a link tag missing
+    generic_system.gs_id = 'gs-1'
+    generic_system.fetched_server_tags = ['dual']
+    generic_system.fetched_external_flag = False
+    link_group = generic_system.link_groups[0]
+    link_group.fetched_ae_id = 'evpn-1'
+    link_group.fetched_ct_names = ['vn20', 'vn30']
+    for member in link_group.members:
+        member.fetched_server_ifname = member.ifname
+        member.fetched_tags_link = list(member.tags_link)
+    link_group.members[0].fetched_tags_link.remove('forceup')
+    plan = generic_system.plan('_mock')
+    assert [(x.stage, x.detail) for x in plan] == [
+        (PlanStage.REMOVE_CTS, {'ae': 'ae101', 'ct_names': ['vn30']}),
+        (PlanStage.ADD_CTS, {'ae': 'ae101', 'ct_names': ['vn101']}),
+        (PlanStage.FIX_TAGS, {'link': 'server_1:xe-0/0/12', 'add': ['forceup'], 'remove': []}),
+    ]
+
+
+def test_41_chunk_generic_system_rows():
+    # interleaved generic systems, sorted with spilled runs of 4 rows
+    rows = [{'blueprint': f"bp{i % 2}", 'server': f"s{i % 5}", 'line': i} for i in range(30)]
+    chunks = list(chunk_generic_system_rows(iter(rows), 2, run_size=4))
+    assert [len({(x['blueprint'], x['server']) for x in chunk}) for chunk in chunks] == [2, 2, 2, 2, 2]
+    assert sum(len(x) for x in chunks) == 30
+    # the rows of a generic system stay in one chunk in the input order
+    lines = {}
+    for index, chunk in enumerate(chunks):
+        for row in chunk:
+            lines.setdefault((row['blueprint'], row['server']), []).append((index, row['line']))
+    assert all(len({x[0] for x in v}) == 1 and [x[1] for x in v] == sorted(x[1] for x in v) for v in lines.values())
+
+
+def test_41_generic_system_import():
+    with open('tests/fixtures/gs_sample.csv', 'r') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    # the imports do not share the server blueprints
+    first = GenericSystemImport(None)
+    first.load(rows)
+    second = GenericSystemImport(None)
+    second.load(rows[:1])
+    assert set(first.server_blueprints) == {x['blueprint'] for x in rows}
+    assert list(second.server_blueprints[rows[0]['blueprint']].servers) == [rows[0]['server']]
+    assert first.server_blueprints[rows[0]['blueprint']] is not second.server_blueprints[rows[0]['blueprint']]
+
+
+def test_41_import_journal(tmp_path):
+    generic_system = load_generic_system('dual-home-1')
+    generic_system.gs_id = 'gs-1'
+    journal_path = str(tmp_path / 'gs.csv.journal')
+    journal = ImportJournal(journal_path)
+    journal.record('_mock', 'dual-home-1', PlanStage.FORM_LAG, generic_system.input_digest, {'ae_ids': {'ae101': 'evpn-1'}})
+    journal.record('_mock', 'dual-home-1', JOURNAL_DONE, generic_system.input_digest, generic_system.journal_ids())
+    # interrupted in the middle of a line
+    with open(journal_path, 'a') as journal_file:
+        journal_file.write('{"blueprint": "_mock", "ser')
+
+    resumed = ImportJournal(journal_path, resume=True)
+    assert resumed.done('_mock', 'dual-home-1', JOURNAL_DONE, generic_system.input_digest)
+    assert resumed.ids('_mock', 'dual-home-1')['gs_id'] == 'gs-1'
+    # the input changed
+    assert not resumed.done('_mock', 'dual-home-1', JOURNAL_DONE, load_generic_system('single-home-1').input_digest)
+    # not resumed
+    assert not ImportJournal(journal_path).entries
+
+
+def load_server_blueprint(offline_blueprint, servers: dict):
+    """
+    The server blueprint of the generic systems of gs_sample.csv, absent from an offline blueprint with the switches.
+    servers: { new server label: the server label in gs_sample.csv to copy the rows from }
+    """
+    with open('tests/fixtures/gs_sample.csv', 'r') as csvfile:
+        sample_rows = list(csv.DictReader(csvfile))
+    server_blueprint = ServerBlueprint({'blueprint': '_mock'})
+    for server, sample in servers.items():
+        for row in sample_rows:
+            if row['server'] == sample:
+                server_blueprint.load_generic_system({**row, 'server': server})
+    nodes = [
+        {'id': 'sw1', 'type': 'system', 'label': 'server_1', 'system_type': 'switch'},
+        {'id': 'sw2', 'type': 'system', 'label': 'server_2', 'system_type': 'switch'},
+        {'id': 'sw1-11', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'xe-0/0/11'},
+        {'id': 'sw1-12', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'xe-0/0/12'},
+        {'id': 'sw2-12', 'type': 'interface', 'if_type': 'ethernet', 'if_name': 'xe-0/0/12'},
+    ]
+    relationships = [('sw1', 'hosted_interfaces', 'sw1-11'), ('sw1', 'hosted_interfaces', 'sw1-12'), ('sw2', 'hosted_interfaces', 'sw2-12')]
+    bp = offline_blueprint(nodes, relationships, label='_mock')
+    server_blueprint.ck_bp = bp
+    switch_index = SwitchInterfaceIndex(bp)
+    for generic_system in server_blueprint.servers.values():
+        list(generic_system.fetch_apstra(bp, [], switch_index, {}))
+    return server_blueprint
+
+
+def test_41_add_generic_systems(offline_blueprint):
+    server_blueprint = load_server_blueprint(offline_blueprint, {
+        'single-home-1': 'single-home-1', 'bad-links': 'single-home-1', 'dual-home-1': 'dual-home-1', 'rejected': 'single-home-1'})
+    bp = server_blueprint.ck_bp
+    # no transformation for the links of bad-links
+    bp.get_transformation_id = lambda switch, ifname, speed: Ok(1)
+    server_blueprint.servers['bad-links'].bp = None
+    for member in server_blueprint.servers['bad-links'].link_groups[0].members:
+        member.bp = type('NoTransformation', (), {'get_transformation_id': lambda *args: Err('no transformation')})()
+
+    def switch_system_links(spec):
+        if 'rejected' in [x['label'] for x in spec['new_systems']]:
+            return OfflineResponse(422, {'errors': 'rejected'})
+        return OfflineResponse(201, {'ids': [f"link-{i}" for i, _ in enumerate(spec['links'])]})
+    http = bp.session.session
+    http.handlers[('POST', '/switch-system-links')] = switch_system_links
+
+    messages = []
+    failed = yield_results(server_blueprint.add_generic_systems(chunk_size=10), messages)
+    assert failed == {'bad-links', 'rejected'}
+    # only the failed generic systems have errors
+    errors = [x.err_value for x in messages if isinstance(x, Err)]
+    assert errors and all('bad-links' in x or 'rejected' in x for x in errors)
+
+    specs = [x[2] for x in http.requests if x[:2] == ('POST', '/switch-system-links')]
+    # one chunk without bad-links, then one by one
+    assert [[x['label'] for x in spec['new_systems']] for spec in specs] == [
+        ['single-home-1', 'dual-home-1', 'rejected'], ['single-home-1'], ['dual-home-1'], ['rejected']]
+    assert [(x['switch']['system_id'], x['switch']['if_name'], x['system']['new_system_index']) for x in specs[0]['links']] == [
+        ('sw1', 'xe-0/0/11', 0), ('sw1', 'xe-0/0/12', 1), ('sw2', 'xe-0/0/12', 1), ('sw1', 'xe-0/0/11', 2)]
+
+
+def test_41_apply_skips_failed(offline_blueprint):
+    server_blueprint = load_server_blueprint(offline_blueprint, {'dual-home-1': 'dual-home-1', 'dual-home-2': 'dual-home-1'})
+    plan = server_blueprint.plan()
+    called = {}
+
+    def stage(name, returned=None):
+        def run(server_labels=None, *args, **kwargs):
+            called[name] = server_labels
+            yield Ok(name)
+            return returned
+        return run
+    server_blueprint.add_generic_systems = stage('create', {'dual-home-2'})
+    server_blueprint.fetch_apstra = lambda session, workers, server_labels: stage('fetch')(server_labels)
+    server_blueprint.form_lag = lambda link_groups: stage('form_lag')([lg.log_prefix for lg in link_groups])
+    server_blueprint.wait_for_lags = lambda session, server_labels, workers: stage('wait_for_lags')(server_labels)
+    server_blueprint.rename_interfaces = stage('rename')
+    server_blueprint.add_vlans = stage('add_vlans')
+    list(server_blueprint.apply(plan, server_blueprint.ck_bp.session))
+    assert called['fetch'] == ['dual-home-1']
+    assert called['wait_for_lags'] == ['dual-home-1'] and len(called['form_lag']) == 1
+    assert called['add_vlans'] == ['dual-home-1']
+
+
+def test_41_switch_index_failed_load(offline_blueprint):
+    bp = offline_blueprint([{'id': 'sw1', 'type': 'system', 'label': 'leaf1', 'system_type': 'switch'}])
+    http = bp.session.session
+    http.handlers[('POST', '/qe')] = lambda json: OfflineResponse(500, {'errors': 'unavailable'})
+    switch_index = SwitchInterfaceIndex(bp)
+    # the failed switch is queried once by the lookups
+    assert switch_index.switch_id('leaf1') is None
+    assert switch_index.interface_id('leaf1', 'xe-0/0/1') is None
+    assert len(http.queries()) == 1 and switch_index.failed_labels == {'leaf1'}
+    # loaded again by an explicit load
+    del http.handlers[('POST', '/qe')]
+    assert switch_index.load(['leaf1']).is_ok()
+    assert switch_index.switch_id('leaf1') == 'sw1' and not switch_index.failed_labels
+
+
+def test_41_wait_for_lags_refetch(offline_blueprint):
+    server_blueprint = load_server_blueprint(offline_blueprint, {'dual-home-1': 'dual-home-1'})
+    bp = server_blueprint.ck_bp
+    http = bp.session.session
+    messages = list(server_blueprint.wait_for_lags(bp.session, ['dual-home-1'], timeout=0.6))
+    assert 'LAGs not present' in messages[-1].err_value
+    # the LAG is looked up in the blueprint on each round, within version_ttl
+    interface_queries = [x for x in http.queries() if "'dual-home-1'" in x]
+    assert len(interface_queries) == 2
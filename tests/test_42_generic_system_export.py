@@ -0,0 +1,29 @@
+import csv
+
+from ck_apstra_api import GenericSystemImport, GsCsvKeys
+from ck_apstra_api.generic_system import generic_system_rows
+
+
+def test_42_generic_system_export(tmp_path, generic_system_blueprint):
+    rows = list(generic_system_rows(generic_system_blueprint).ok_value)
+    assert [(x[GsCsvKeys.SERVER], x[GsCsvKeys.SWITCH], x[GsCsvKeys.AE], x[GsCsvKeys.CT_NAMES], x[GsCsvKeys.TAGS_LINK]) for x in rows] == [
+        ('dual-1', 'leaf1', 'ae1', 'vn20', 'forceup'),
+        ('dual-1', 'leaf2', 'ae1', 'vn20', ''),
+        ('single-1', 'leaf1', '', 'vn30', ''),
+    ]
+    assert rows[0][GsCsvKeys.TAGS_SERVER] == 'dual' and rows[0][GsCsvKeys.LAG_MODE] == 'lacp_active'
+
+    # round trip through the csv file into the import
+    csv_path = tmp_path / 'gs.csv'
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=[x.value for x in GsCsvKeys])
+        writer.writeheader()
+        for line, row in enumerate(rows, 1):
+            writer.writerow({**row, GsCsvKeys.LINE: line})
+    with open(csv_path, 'r') as csvfile:
+        generic_system_import = GenericSystemImport(None)
+        generic_system_import.load(csv.DictReader(csvfile))
+    servers = generic_system_import.server_blueprints['bp1'].servers
+    assert [(x.ae, x.lag_mode, x.ct_names, len(x.members)) for x in servers['dual-1'].link_groups] == [('ae1', 'lacp_active', ['vn20'], 2)]
+    assert servers['dual-1'].deploy_mode == 'deploy' and servers['dual-1'].tags_server == ['dual']
+    assert servers['single-1'].link_groups[0].members[0].speed == '25G'
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from ck_apstra_api import CkEnum, GsCsvKeys
+from ck_apstra_api.generic_system import ServerBlueprint, generic_system_rows
+
+from .conftest import OfflineResponse
+
+
+def test_43_server_interface_index(generic_system_blueprint):
+    bp = generic_system_blueprint
+    http = bp.session.session
+    index = bp.get_server_interface_index(['dual-1', 'single-1', 'dual-1', 'absent'], chunk_size=2)
+    # the labels once, chunk_size per query
+    assert len(http.queries()) == 2
+    assert "['dual-1', 'single-1']" in http.queries()[0] and "['absent']" in http.queries()[1]
+    assert sorted(x[CkEnum.LINK]['id'] for x in index.ok_value['dual-1']) == ['link1', 'link2']
+    assert [x[CkEnum.MEMBER_INTERFACE]['id'] for x in index.ok_value['single-1']] == ['leaf1-et2']
+    assert index.ok_value['absent'] == []
+
+    http.handlers[('POST', '/qe')] = lambda json: OfflineResponse(500, {'errors': 'timeout'})
+    assert bp.get_server_interface_index(['leaf9'], chunk_size=2).is_err()
+
+
+def test_43_node_tags(generic_system_blueprint):
+    bp = generic_system_blueprint
+    http = bp.session.session
+    node_tags = bp.get_node_tags(['dual-1', 'link1', 'link2', None, 'link1'], chunk_size=2)
+    assert node_tags.ok_value == {'dual-1': ['dual'], 'link1': ['forceup'], 'link2': []}
+    assert len(http.queries()) == 2
+    # all the tagged nodes in one query
+    assert bp.get_node_tags().ok_value == {'dual-1': ['dual'], 'link1': ['forceup']}
+    assert len(http.queries()) == 3
+
+
+def test_43_system_labels(generic_system_blueprint):
+    bp = generic_system_blueprint
+    http = bp.session.session
+    present = bp.get_system_labels(['dual-1', 'new-1', 'leaf1', 'single-1', 'dual-1'], chunk_size=3)
+    assert present.ok_value == {'dual-1', 'leaf1', 'single-1'}
+    assert len(http.queries()) == 2
+
+
+def load_server_blueprint(bp) -> ServerBlueprint:
+    """The server blueprint of the generic systems exported from the blueprint"""
+    server_blueprint = ServerBlueprint({'blueprint': bp.label})
+    for line, row in enumerate(generic_system_rows(bp).ok_value, 1):
+        server_blueprint.load_generic_system({**row, GsCsvKeys.LINE: line})
+    server_blueprint.ck_bp = bp
+    return server_blueprint
+
+
+def test_43_fetch_apstra_workers(generic_system_blueprint, offline_blueprint):
+    messages = {}
+    threads = set()
+    for workers in (1, 4):
+        bp = offline_blueprint(snapshot=generic_system_blueprint.session.session.engine.snapshot)
+        server_blueprint = load_server_blueprint(bp)
+        dual = server_blueprint.servers['dual-1']
+        fetch_dual = dual.fetch_apstra
+
+        def slow_fetch(*args, **kwargs):
+            # dual-1, the first in the input, is done last
+            threads.add(threading.current_thread().name)
+            time.sleep(0.05)
+            yield from fetch_dual(*args, **kwargs)
+        dual.fetch_apstra = slow_fetch
+        messages[workers] = [str(x) for x in server_blueprint.fetch_apstra(bp.session, workers=workers)]
+        assert dual.gs_id == 'dual-1' and dual.fetched_server_tags == ['dual']
+        assert server_blueprint.servers['single-1'].link_groups[0].fetched_ct_names == ['vn30']
+    assert any(x.startswith('ck-gs-fetch') for x in threads)
+    # in the input order regardless of the workers
+    assert messages[4] == messages[1]
+    assert [x.split('::')[0] for x in messages[4] if 'generic system data' in x] == ['GenericSystem(dual-1)', 'GenericSystem(single-1)']